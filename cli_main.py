@@ -12,6 +12,7 @@ from uploader.tk_uploader.main_chrome import tiktok_setup, TiktokVideo
 from utils.base_social_media import get_supported_social_media, get_cli_action, SOCIAL_MEDIA_DOUYIN, \
     SOCIAL_MEDIA_TENCENT, SOCIAL_MEDIA_TIKTOK, SOCIAL_MEDIA_KUAISHOU
 from utils.constant import TencentZoneTypes
+from utils.browser_pool import use_browser_pool
 from utils.files_times import get_title_and_hashtags
 
 
@@ -77,24 +78,26 @@ async def main():
             print("Scheduling videos...")
             publish_date = parse_schedule(args.schedule)
 
-        if args.platform == SOCIAL_MEDIA_DOUYIN:
-            await douyin_setup(account_file, handle=False)
-            app = DouYinVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TIKTOK:
-            await tiktok_setup(account_file, handle=True)
-            app = TiktokVideo(title, video_file, tags, publish_date, account_file)
-        elif args.platform == SOCIAL_MEDIA_TENCENT:
-            await weixin_setup(account_file, handle=True)
-            category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
-            app = TencentVideo(title, video_file, tags, publish_date, account_file, category)
-        elif args.platform == SOCIAL_MEDIA_KUAISHOU:
-            await ks_setup(account_file, handle=True)
-            app = KSVideo(title, video_file, tags, publish_date, account_file)
-        else:
-            print("Wrong platform, please check your input")
-            exit()
+        # 校验与上传共用同一个浏览器，校验结果也会被缓存供后续调用复用
+        async with use_browser_pool():
+            if args.platform == SOCIAL_MEDIA_DOUYIN:
+                await douyin_setup(account_file, handle=False)
+                app = DouYinVideo(title, video_file, tags, publish_date, account_file)
+            elif args.platform == SOCIAL_MEDIA_TIKTOK:
+                await tiktok_setup(account_file, handle=True)
+                app = TiktokVideo(title, video_file, tags, publish_date, account_file)
+            elif args.platform == SOCIAL_MEDIA_TENCENT:
+                await weixin_setup(account_file, handle=True)
+                category = TencentZoneTypes.LIFESTYLE.value  # 标记原创需要否则不需要传
+                app = TencentVideo(title, video_file, tags, publish_date, account_file, category)
+            elif args.platform == SOCIAL_MEDIA_KUAISHOU:
+                await ks_setup(account_file, handle=True)
+                app = KSVideo(title, video_file, tags, publish_date, account_file)
+            else:
+                print("Wrong platform, please check your input")
+                exit()
 
-        await app.main()
+            await app.main()
 
 
 if __name__ == "__main__":
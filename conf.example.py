@@ -22,3 +22,168 @@ AI_ROLE_PROMPT = (
     os.getenv("AI_ROLE_PROMPT")
     or "你是一名资深短视频运营顾问，擅长根据素材、产品与平台特性生成吸引人的中文标题和热门话题。请保持口吻自然、贴合平台内容生态，严格遵守用户提供的约束。"
 )
+
+# 发布任务队列：workers 为后台同时执行的发布任务上限，poll_interval 为空闲时轮询间隔（秒）
+# mode 为 thread（同一进程内的事件循环并发执行）、process（workers 个独立工作进程，各执行一个任务）
+# 或 external（后端只入队，由 sau_worker.py 节点执行）；
+# job_timeout 为 process 模式下单个任务的最长执行时间（秒），超时后终止该工作进程，None 表示不限制
+PUBLISH_QUEUE_SETTINGS = {
+    "workers": int(os.getenv("PUBLISH_WORKERS", 4)),
+    "poll_interval": 1.0,
+    "mode": os.getenv("PUBLISH_MODE", "thread"),
+    "job_timeout": 1800,
+    # /postVideoBatch 每校验多少条请求写入一次任务队列并输出结果
+    "batch_chunk_size": 500,
+}
+
+# 并发发布限制：platforms 为各平台同时运行的上传数（键为平台标识 1 小红书 2 视频号 3 抖音 4 快手 5 TikTok），
+# 未配置的平台使用 default_platform；per_account 为单个账号同时运行的上传数
+PUBLISH_CONCURRENCY = {
+    "default_platform": 2,
+    "platforms": {},
+    "per_account": 1,
+}
+
+# 浏览器池：同一个浏览器累计借出 max_contexts_per_browser 个上下文后回收重启，args 为启动 Chromium 的额外参数
+BROWSER_POOL_SETTINGS = {
+    "max_contexts_per_browser": 100,
+    "args": [],
+}
+
+# 账号持久化 profile（user-data-dir 模式）：开启后每个账号在 dir 下拥有独立的浏览器 profile，
+# HTTP 缓存、Service Worker、IndexedDB 跨任务保留；max_open 为同时保持打开的 profile 数，
+# 超出按最久未使用关闭，空闲 idle_seconds 秒后自动关闭；retention_days 天未使用的 profile 在启动时清理
+BROWSER_PROFILE_SETTINGS = {
+    "enabled": os.getenv("BROWSER_PROFILES", "0") == "1",
+    "dir": BASE_DIR / "browserProfiles",
+    "max_open": 4,
+    "idle_seconds": 600,
+    "retention_days": 30,
+}
+
+# 上传页预热：发布循环满载时，为排在最前面的 lookahead 个排队任务提前创建上下文并打开上传页；
+# 同时最多保留 max_pages 个预热页面，系统可用内存低于 min_available_mb（MB）时不预热，超过 ttl 秒未被取用则丢弃
+PREWARM_SETTINGS = {
+    "lookahead": 1,
+    "max_pages": 2,
+    "min_available_mb": 1024,
+    "ttl": 300,
+}
+
+# 多节点 sau_worker：store 为任务存储类（"模块:类名"，留空使用 SQLite 的 JobQueue），db_path 为与后端共享的数据库；
+# 节点以 lease_seconds 秒的租约领取任务并定期续约，失联节点的任务在租约过期后被回收，
+# 领取次数未达 max_attempts 的重新排队（可能重复发布），否则标记为失败
+# 各节点还需共享 videoFile 与 cookiesFile 目录
+WORKER_SETTINGS = {
+    "store": os.getenv("SAU_JOB_STORE", ""),
+    "db_path": os.getenv("SAU_JOB_DB") or BASE_DIR / "database.db",
+    "lease_seconds": 60,
+    "max_attempts": 2,
+}
+
+# 任务调度（计数保存在数据库中，重启后依然有效，多个 worker / 节点共享）：
+# platform_limits / default_platform_limit 为各平台全局同时运行的任务数上限（0 表示不限），account_limit 为单账号同时运行上限；
+# account_min_gap_seconds 为同一账号两次开始发布的最小间隔；daily_quota 为每个账号在 quota_window_seconds 滑动窗口内
+# 最多开始的任务数，platforms 中按平台标识单独配置，default 为其余平台（0 表示不限）
+# 立即发布的任务优先于定时发布的任务，同一优先级内优先最久未发布过的账号
+SCHEDULER_SETTINGS = {
+    "platform_limits": {},
+    "default_platform_limit": 0,
+    "account_limit": 1,
+    "account_min_gap_seconds": 0,
+    "daily_quota": {"default": 0, "platforms": {}},
+    "quota_window_seconds": 86400,
+}
+
+# 账号有效性缓存：/getValidAccounts 直接返回数据库中的校验结果，后台线程每轮取最多 batch_size 个
+# 超过 ttl_seconds 未校验的账号并发校验（需要浏览器时共用一个浏览器，同时最多 concurrency 个，单个超过 timeout_seconds 记为失效），
+# 轮与轮之间间隔 interval_seconds，没有过期账号时每 idle_seconds 检查一次
+ACCOUNT_CHECK_SETTINGS = {
+    "enabled": os.getenv("ACCOUNT_CHECK", "1") != "0",
+    "ttl_seconds": 3600,
+    "interval_seconds": 10,
+    "idle_seconds": 30,
+    "batch_size": 20,
+    "concurrency": 4,
+    "timeout_seconds": 60,
+    # 快速校验：先检查 cookie 文件中的登录 cookie 是否缺失或过期，再带 cookie 请求一次平台接口，
+    # 只有无法判断时才打开浏览器；关闭后跳过 HTTP 请求（cookie 预检查始终进行）。
+    # HTTP 探测只覆盖小红书、抖音（有效与失效都能判断）和 TikTok（只能确认有效），视频号、快手始终使用浏览器校验
+    "http_fast_path": True,
+    "http_timeout_seconds": 5,
+    "http_max_connections": 20,
+    # 同一个 cookie 文件（修改时间未变）在 cache_seconds 内的校验结果直接复用，后端、CLI 与发布任务共享，0 表示不缓存
+    "cache_seconds": 300,
+}
+
+# 会话保活：每 interval_seconds 重新索引各账号登录 cookie 的过期时间，对 lead_hours 小时内将过期的有效账号
+# 打开一次平台页面续期并写回 cookie 文件（每轮最多 batch_size 个，同一账号至少间隔 min_gap_seconds）
+KEEPALIVE_SETTINGS = {
+    "enabled": os.getenv("KEEPALIVE", "1") != "0",
+    "lead_hours": 24,
+    "interval_seconds": 300,
+    "min_gap_seconds": 21600,
+    "batch_size": 5,
+    "settle_seconds": 3,
+}
+
+# 自动化上下文（cookie 校验、上传、保活）的资源路由策略，默认中止字体、视频预览和第三方埋点、广告域名，图片照常加载，
+# 规则见 utils/resource_policy.py。default 对所有平台生效，platforms 按平台名（douyin / xiaohongshu / tencent /
+# kuaishou / tiktok / baijiahao）覆盖：abort_types / stub_types 整体替换（如 {"stub_types": ["image"]} 把图片换成
+# 1x1 占位图），block_hosts / allow_patterns 追加。开启路由后 Playwright 不再对该上下文使用 HTTP 缓存，
+# 因此开启 BROWSER_PROFILE_SETTINGS 时持久化 profile 的上下文默认不路由，persistent_contexts 为 True 时也路由；
+# 设置 enabled 为 False 可整体关闭
+RESOURCE_ROUTING_SETTINGS = {
+    "enabled": os.getenv("RESOURCE_ROUTING", "1") != "0",
+    "persistent_contexts": False,
+    "default": {},
+    "platforms": {},
+}
+
+# cookie 文件（Playwright storage_state）压缩，规则见 utils/storage_state.py：
+# 读取（仅内存中）、写回 cookie 与服务启动时，丢弃过期 cookie、非本平台域名的 cookie 与 localStorage，以及百家号 AI 成片的历史批次记录。
+# platforms 按平台名追加需要保留的域名后缀，例如 {"kuaishou": ["kuaishou.cn"]}；
+# max_item_bytes 大于 0 时丢弃超过该长度的单个 localStorage 值
+STORAGE_STATE_SETTINGS = {
+    "compact": os.getenv("STORAGE_COMPACT", "1") != "0",
+    "platforms": {},
+    "max_item_bytes": 0,
+}
+
+# 账号登录态存储（utils/cookie_store.py）：写入时加跨进程的账号锁、经临时文件原子替换、记录版本号，内容未变化时不写。
+# layout：flat 平铺在 cookiesFile 下（默认）；sharded 按文件名前两位分子目录，账号很多时使用；
+# sqlite 存入 database.db 的 cookie_store 表。切换后已有的 cookie 文件在首次读取时自动迁移
+COOKIE_STORE_SETTINGS = {
+    "layout": os.getenv("COOKIE_STORE", "flat"),
+    "lock_timeout_seconds": 30,
+}
+
+# 素材上传（myUtils/upload_sessions.py）：分片续传接口 /uploadSession、/uploadChunk、/uploadComplete。
+# buffer_bytes 为读写请求体的缓冲大小；每累计 fsync_bytes 字节 fsync 一次；单个分片不超过 max_chunk_bytes
+# （同时受 MAX_CONTENT_LENGTH 限制），整个文件不限大小；超过 session_ttl_hours 未更新的未完成会话会被清理。
+# dedup 开启时按 SHA-256 去重：内容相同的素材只保留一份文件，多条素材记录共用
+UPLOAD_SETTINGS = {
+    "buffer_bytes": 1024 * 1024,
+    "fsync_bytes": 64 * 1024 * 1024,
+    "max_chunk_bytes": 64 * 1024 * 1024,
+    "session_ttl_hours": 72,
+    "dedup": True,
+}
+
+# 素材下载与预览 /getFile（myUtils/file_serving.py）：支持 Range 与 304，max_age 为浏览器缓存秒数（0 表示每次都重新校验）。
+# accel_redirect 为 nginx 中映射到 videoFile 的 internal location（如 /_videoFile/），设置后文件由 nginx 以 sendfile 发送，
+# docker-compose 部署时已通过环境变量 ACCEL_REDIRECT 开启。只有带 X-Sendfile-Type: X-Accel-Redirect 请求头（nginx.conf 的 /api/ 中设置）
+# 的请求才返回 X-Accel-Redirect，直接访问后端端口的请求仍由后端发送文件
+FILE_SERVING_SETTINGS = {
+    "max_age": 365 * 86400,
+    "accel_redirect": os.getenv("ACCEL_REDIRECT", ""),
+}
+
+# 素材元数据（myUtils/media_info.py）：上传完成后由 workers 个后台线程运行 ffprobe，结果按内容哈希存入 media_info 表，
+# /getFiles 与发布任务直接读取。需要安装 ffmpeg（Docker 镜像已包含），ffprobe 不在 PATH 中时用 FFPROBE 指定路径
+MEDIA_PROBE_SETTINGS = {
+    "enabled": True,
+    "workers": 2,
+    "timeout_seconds": 60,
+    "ffprobe": os.getenv("FFPROBE", "ffprobe"),
+}
@@ -0,0 +1,228 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from conf import BASE_DIR
+from myUtils.cookie_check import load_storage_state, critical_expiry
+from utils.log import account_logger
+
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
+
+ACCOUNT_STATUS_INVALID = 0
+ACCOUNT_STATUS_VALID = 1
+
+# 在初版 user_info 之后新增的字段：(字段名, 定义)
+_EXTRA_COLUMNS = (
+    ("last_checked_at", "REAL"),
+    ("status_reason", "TEXT"),
+    ("cookie_expires_at", "REAL"),
+    ("keepalive_at", "REAL"),
+)
+
+# /getValidAccounts 返回的字段顺序，前 5 列与旧版 SELECT * 保持一致
+ACCOUNT_COLUMNS = ("id", "type", "filePath", "userName", "status", "last_checked_at", "status_reason")
+
+
+class AccountStatusStore(object):
+    """
+    账号有效性缓存，直接存放在 user_info 中：status 为最近一次校验结果，
+    last_checked_at 为校验时间（时间戳），status_reason 为结果说明。超过 TTL 的账号视为过期，由 AccountRefresher 重新校验。
+    cookie_expires_at 为 cookie 文件中登录 cookie 最早的过期时间（索引），keepalive_at 为最近一次保活时间，供 SessionKeeper 使用。
+    """
+
+    def __init__(self, db_path, cookies_dir=None):
+        self.db_path = Path(db_path)
+        self.cookies_dir = Path(cookies_dir or BASE_DIR / "cookiesFile")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        with self._connect() as conn:
+            # 旧版本创建的表补齐新增字段
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(user_info)")}
+            for name, definition in _EXTRA_COLUMNS:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE user_info ADD COLUMN {name} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_user_info_checked ON user_info (last_checked_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_user_info_expires ON user_info (cookie_expires_at)")
+
+    def list_accounts(self, platform: Optional[int] = None, account_ids: Optional[Iterable[int]] = None) -> List[List]:
+        """按 ACCOUNT_COLUMNS 的顺序返回账号行，可按平台类型和账号 id 过滤。"""
+        conditions, params = [], []
+        if platform is not None:
+            conditions.append("type = ?")
+            params.append(platform)
+        if account_ids is not None:
+            account_ids = list(account_ids)
+            conditions.append(f"id IN ({', '.join('?' * len(account_ids))})" if account_ids else "0")
+            params.extend(account_ids)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM user_info{where} ORDER BY id",
+                                params).fetchall()
+        return [list(row) for row in rows]
+
+    def stale(self, ttl: float, limit: int, now: Optional[float] = None) -> List[Dict]:
+        """返回从未校验或校验结果已超过 ttl 秒的账号，最久未校验的排在前面。"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, type, filePath FROM user_info
+                WHERE last_checked_at IS NULL OR last_checked_at < ?
+                ORDER BY last_checked_at IS NOT NULL, last_checked_at, id
+                LIMIT ?
+                """,
+                (now - ttl, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def record(self, account_id: int, valid: bool, reason: str, checked_at: Optional[float] = None):
+        """写入一次校验结果，有效和失效都会写回，失效账号重新登录或 cookie 恢复后可以变回有效。"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE user_info SET status = ?, status_reason = ?, last_checked_at = ? WHERE id = ?",
+                (ACCOUNT_STATUS_VALID if valid else ACCOUNT_STATUS_INVALID, reason,
+                 time.time() if checked_at is None else checked_at, account_id),
+            )
+
+    def mark_stale(self, account_ids: Optional[Iterable[int]] = None) -> int:
+        """清除校验时间，让这些账号（默认全部）在下一轮被优先重新校验。"""
+        with self._connect() as conn:
+            if account_ids is None:
+                cursor = conn.execute("UPDATE user_info SET last_checked_at = NULL")
+            else:
+                cursor = conn.executemany("UPDATE user_info SET last_checked_at = NULL WHERE id = ?",
+                                          [(account_id,) for account_id in account_ids])
+            return cursor.rowcount
+
+
+    def index_expiry(self, account_ids: Optional[Iterable[int]] = None) -> Dict[int, Optional[float]]:
+        """重新解析这些账号（默认全部）的 cookie 文件，更新 cookie_expires_at，返回 {账号 id: 过期时间}。"""
+        with self._connect() as conn:
+            if account_ids is None:
+                rows = conn.execute("SELECT id, type, filePath FROM user_info").fetchall()
+            else:
+                account_ids = list(account_ids)
+                rows = conn.execute(
+                    f"SELECT id, type, filePath FROM user_info WHERE id IN ({', '.join('?' * len(account_ids))})",
+                    account_ids).fetchall() if account_ids else []
+            updates = [(critical_expiry(row["type"], load_storage_state(self.cookies_dir / row["filePath"])), row["id"])
+                       for row in rows]
+            conn.executemany("UPDATE user_info SET cookie_expires_at = ? WHERE id = ?", updates)
+        return {account_id: expires_at for expires_at, account_id in updates}
+
+    def expiring(self, within: float, now: Optional[float] = None) -> List[Dict]:
+        """返回登录 cookie 将在 within 秒内过期（含已过期）的账号，最早过期的排在前面。"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {', '.join(ACCOUNT_COLUMNS)}, cookie_expires_at, keepalive_at FROM user_info
+                WHERE cookie_expires_at IS NOT NULL AND cookie_expires_at <= ?
+                ORDER BY cookie_expires_at, id
+                """,
+                (now + within,),
+            ).fetchall()
+        return [dict(row, expires_in=round(row["cookie_expires_at"] - now)) for row in rows]
+
+    def keepalive_candidates(self, lead: float, min_gap: float, limit: int, now: Optional[float] = None) -> List[Dict]:
+        """需要保活的有效账号：登录 cookie 将在 lead 秒内过期、尚未过期，且 min_gap 秒内没有保活过。"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, type, filePath, cookie_expires_at FROM user_info
+                WHERE status = ? AND cookie_expires_at > ? AND cookie_expires_at <= ?
+                  AND (keepalive_at IS NULL OR keepalive_at < ?)
+                ORDER BY cookie_expires_at, id
+                LIMIT ?
+                """,
+                (ACCOUNT_STATUS_VALID, now, now + lead, now - min_gap, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_keepalive(self, account_id: int, at: Optional[float] = None):
+        with self._connect() as conn:
+            conn.execute("UPDATE user_info SET keepalive_at = ? WHERE id = ?",
+                         (time.time() if at is None else at, account_id))
+
+
+class AccountRefresher(object):
+    """
+    后台账号校验线程：每轮取最多 batch_size 个过期账号交给 checker 并发校验，轮与轮之间间隔 interval 秒，
+    以稳定的速率刷新缓存，不会在页面加载时集中启动浏览器。
+    没有过期账号时每 idle_interval 秒检查一次，调用 wake 可立即开始新一轮。
+    checker 接收 (type, filePath) 列表，按顺序返回包含 valid / reason 的结果（见 myUtils.auth.check_cookies）。
+    """
+
+    def __init__(self, store: AccountStatusStore, checker: Callable[[List[Tuple[int, str]]], Awaitable[List[Dict]]],
+                 ttl: Optional[float] = None, interval: Optional[float] = None,
+                 idle_interval: Optional[float] = None, batch_size: Optional[int] = None):
+        settings = ACCOUNT_CHECK_SETTINGS
+        self.store = store
+        self.checker = checker
+        self.ttl = float(ttl if ttl is not None else settings.get("ttl_seconds", 3600))
+        self.interval = float(interval if interval is not None else settings.get("interval_seconds", 10))
+        self.idle_interval = float(idle_interval if idle_interval is not None else settings.get("idle_seconds", 30))
+        self.batch_size = int(batch_size if batch_size is not None else settings.get("batch_size", 20))
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="account-refresher",
+                                        daemon=True)
+        self._thread.start()
+        account_logger.info(f"[+] 账号校验线程已启动，有效期 {self.ttl}s，每轮最多 {self.batch_size} 个，间隔 {self.interval}s")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        self._wake_event.set()
+
+    async def _sleep(self, seconds: float):
+        if await asyncio.to_thread(self._wake_event.wait, seconds):
+            self._wake_event.clear()
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                accounts = self.store.stale(self.ttl, self.batch_size)
+            except Exception as exc:
+                account_logger.error(f"[-] 读取待校验账号失败: {exc}")
+                accounts = []
+            if not accounts:
+                await self._sleep(self.idle_interval)
+                continue
+            try:
+                await self.check_accounts(accounts)
+            except Exception as exc:
+                account_logger.error(f"[-] 账号校验失败: {exc}")
+            await self._sleep(self.interval)
+
+    async def check_accounts(self, accounts: List[Dict]) -> List[Dict]:
+        started = time.monotonic()
+        results = await self.checker([(account["type"], account["filePath"]) for account in accounts])
+        for account, result in zip(accounts, results):
+            self.store.record(account["id"], result["valid"], result["reason"])
+        self.store.index_expiry([account["id"] for account in accounts])
+        valid = sum(1 for result in results if result["valid"])
+        account_logger.info(f"[+] 本轮校验 {len(results)} 个账号，有效 {valid} 个，耗时 {time.monotonic() - started:.1f}s")
+        return results
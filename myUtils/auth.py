@@ -1,162 +1,256 @@
 import asyncio
-import configparser
-import os
 import re
-import json
+import time
 from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
-from playwright.async_api import async_playwright
-from xhs import XhsClient
+import httpx
 
 from conf import BASE_DIR
+from myUtils.cookie_cache import get_cookie_cache
+from myUtils.cookie_check import SESSION_COOKIES, load_storage_state, precheck_cookies, http_probe, new_http_client
 from utils.base_social_media import set_init_script
-from utils.log import tencent_logger, kuaishou_logger, douyin_logger
-from uploader.xhs_uploader.main import sign_local
+from utils.browser_pool import use_browser_pool
+from utils.cookie_store import get_cookie_store
+from utils.log import tencent_logger, kuaishou_logger, douyin_logger, account_logger
 
-async def cookie_auth_douyin(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.douyin.com/creator-micro/content/upload")
-        try:
-            await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=5000)
-            # 2024.06.17 抖音创作者中心改版
-            # 判断
-            # 等待“扫码登录”元素出现，超时 5 秒（如果 5 秒没出现，说明 cookie 有效）
-            try:
-                await page.get_by_text("扫码登录").wait_for(timeout=5000)
-                douyin_logger.error("[+] cookie 失效，需要扫码登录")
-                return False
-            except:
-                douyin_logger.success("[+]  cookie 有效")
-                return True
-        except:
-            douyin_logger.error("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
-            return False
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
 
-async def cookie_auth_tencent(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
+async def page_auth_douyin(page):
+    # 访问指定的 URL
+    await page.goto("https://creator.douyin.com/creator-micro/content/upload")
+    try:
+        await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=5000)
+        # 2024.06.17 抖音创作者中心改版
+        # 判断
+        # 等待“扫码登录”元素出现，超时 5 秒（如果 5 秒没出现，说明 cookie 有效）
         try:
-            await page.wait_for_selector('div.title-name:has-text("微信小店")', timeout=5000)  # 等待5秒
-            tencent_logger.error("[+] 等待5秒 cookie 失效")
+            await page.get_by_text("扫码登录").wait_for(timeout=5000)
+            douyin_logger.error("[+] cookie 失效，需要扫码登录")
             return False
         except:
-            tencent_logger.success("[+] cookie 有效")
+            douyin_logger.success("[+]  cookie 有效")
             return True
+    except:
+        douyin_logger.error("[+] 等待5秒 cookie 失效")
+        return False
 
-async def cookie_auth_ks(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://cp.kuaishou.com/article/publish/video")
-        try:
-            await page.wait_for_selector("div.names div.container div.name:text('机构服务')", timeout=5000)  # 等待5秒
+async def page_auth_tencent(page):
+    # 访问指定的 URL
+    await page.goto("https://channels.weixin.qq.com/platform/post/create")
+    try:
+        await page.wait_for_selector('div.title-name:has-text("微信小店")', timeout=5000)  # 等待5秒
+        tencent_logger.error("[+] 等待5秒 cookie 失效")
+        return False
+    except:
+        tencent_logger.success("[+] cookie 有效")
+        return True
 
-            kuaishou_logger.info("[+] 等待5秒 cookie 失效")
-            return False
-        except:
-            kuaishou_logger.success("[+] cookie 有效")
-            return True
+async def page_auth_ks(page):
+    # 访问指定的 URL
+    await page.goto("https://cp.kuaishou.com/article/publish/video")
+    try:
+        await page.wait_for_selector("div.names div.container div.name:text('机构服务')", timeout=5000)  # 等待5秒
 
+        kuaishou_logger.info("[+] 等待5秒 cookie 失效")
+        return False
+    except:
+        kuaishou_logger.success("[+] cookie 有效")
+        return True
 
-async def cookie_auth_xhs(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.xiaohongshu.com/creator-micro/content/upload")
-        try:
-            await page.wait_for_url("https://creator.xiaohongshu.com/creator-micro/content/upload", timeout=5000)
-        except:
-            print("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
-            return False
-        # 2024.06.17 抖音创作者中心改版
-        if await page.get_by_text('手机号登录').count() or await page.get_by_text('扫码登录').count():
-            print("[+] 等待5秒 cookie 失效")
-            return False
-        else:
-            print("[+] cookie 有效")
-            return True
 
-async def cookie_auth_tiktok(account_file):
+async def page_auth_xhs(page):
+    # 访问指定的 URL
+    await page.goto("https://creator.xiaohongshu.com/creator-micro/content/upload")
+    try:
+        await page.wait_for_url("https://creator.xiaohongshu.com/creator-micro/content/upload", timeout=5000)
+    except:
+        print("[+] 等待5秒 cookie 失效")
+        return False
+    # 2024.06.17 抖音创作者中心改版
+    if await page.get_by_text('手机号登录').count() or await page.get_by_text('扫码登录').count():
+        print("[+] 等待5秒 cookie 失效")
+        return False
+    else:
+        print("[+] cookie 有效")
+        return True
+
+async def page_auth_tiktok(page):
+    # 登录 cookie 的预检查已由 validate_account 统一完成（见 myUtils.cookie_check）
     try:
-        state = json.loads(Path(account_file).read_text(encoding="utf-8"))
-        cookies = state.get("cookies") or []
-        logged_in_cookie_names = {"sessionid", "sessionid_ss", "sid_tt", "uid_tt"}
-        has_logged_in_cookie = any(cookie.get("name") in logged_in_cookie_names for cookie in cookies)
-    except Exception:
-        has_logged_in_cookie = False
-
-    if not has_logged_in_cookie:
+        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en", wait_until="domcontentloaded", timeout=30000)
+        current_url = page.url or ""
+        if "/login" in current_url or "login" in current_url:
+            print("[+] TikTok cookie 失效")
+            return False
+        if await page.get_by_text(re.compile(r"\blog\s*in\b", re.I)).count():
+            print("[+] TikTok cookie 失效")
+            return False
+        print("[+] TikTok cookie 有效")
+        return True
+    except Exception as exc:
+        print("[+] TikTok cookie 校验异常:", exc)
         print("[+] TikTok cookie 失效")
         return False
 
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
+
+# 各平台的页面校验（平台标识：1 小红书 2 视频号 3 抖音 4 快手 5 TikTok）：在给定页面中打开创作者后台，判断是否仍处于登录状态
+PAGE_AUTHS = {
+    1: page_auth_xhs,
+    2: page_auth_tencent,
+    3: page_auth_douyin,
+    4: page_auth_ks,
+    5: page_auth_tiktok,
+}
+
+
+async def check_page_login(type, context) -> bool:
+    """在已有的上下文中新开一个页面完成页面校验，校验完关闭该页面，上下文保持不变。"""
+    page_auth = PAGE_AUTHS.get(type)
+    if page_auth is None:
+        return False
+    page = await context.new_page()
+    try:
+        return bool(await page_auth(page))
+    finally:
+        await page.close()
+
+
+async def browser_check_cookie(type, account_file):
+    """打开平台页面校验 cookie，最准确也最慢，只在快速检查无法判断时使用。"""
+    if type not in PAGE_AUTHS:
+        return False
+    async with use_browser_pool() as pool, pool.new_context(storage_state=account_file, headless=True) as context:
         context = await set_init_script(context)
-        page = await context.new_page()
+        return await check_page_login(type, context)
+
+
+async def validate_context(type, context, client: Optional[httpx.AsyncClient] = None) -> Tuple[bool, str, str, Optional[Dict]]:
+    """
+    在刚完成登录的上下文中直接校验（登录流程使用），不再另开浏览器，返回 (是否有效, 原因, 校验方式, storage_state)：
+    先对上下文当前的 cookie 做预检查，再按 validate_account 的顺序尝试 HTTP 探测，无法判断时在该上下文中打开页面校验。
+    返回的 storage_state 即应保存的登录态，调用方无需再读取一次。
+    """
+    if type not in SESSION_COOKIES:
+        return False, f"不支持的平台类型: {type}", "cookie", None
+    state = await context.storage_state()
+    ok, reason = precheck_cookies(type, state)
+    if not ok:
+        return False, reason, "cookie", state
+    if client is not None:
+        result, reason = await http_probe(client, type, state)
+        if result is not None:
+            return result, reason, "http", state
+    result = await check_page_login(type, context)
+    # 页面校验过程中平台可能下发新的 cookie，重新读取一次
+    state = await context.storage_state()
+    return result, "cookie 有效" if result else "cookie 已失效，需要重新登录", "browser", state
+
+
+async def validate_account(type, file_path, client: Optional[httpx.AsyncClient] = None,
+                           use_cache: bool = True) -> Tuple[bool, str, str]:
+    """
+    统一的账号校验服务（后端、CLI 的 *_setup 与发布任务共用），分级校验一个账号，返回 (是否有效, 原因, 校验方式)：
+    1. cookie：解析 storage_state，缺少登录 cookie 或已全部过期直接判定失效，无需任何网络请求；
+    2. cache：同一个 cookie 文件（登录态未变化）在 cache_seconds 内校验过的，直接复用结果；
+    3. http：传入 client 时带 cookie 请求一次平台接口，能明确判断的直接返回；
+    4. browser：以上都无法判断时才打开浏览器校验。
+    file_path 为 cookiesFile 下的文件名，也可以是 cookie 文件的完整路径。
+    """
+    if type not in SESSION_COOKIES:
+        return False, f"不支持的平台类型: {type}", "cookie"
+    account_file = Path(BASE_DIR / "cookiesFile" / file_path)
+    mtime_ns = get_cookie_store().stamp(account_file)
+    if mtime_ns is None:
+        return False, "cookie 文件不存在", "cookie"
+    state = load_storage_state(account_file)
+    ok, reason = precheck_cookies(type, state)
+    if not ok:
+        return False, reason, "cookie"
+    cache = get_cookie_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(type, account_file, mtime_ns)
+        if cached is not None:
+            return cached[0], cached[1], "cache"
+    method = "browser"
+    result = None
+    if client is not None:
+        result, reason = await http_probe(client, type, state)
+        method = "http"
+    if result is None:
+        result = bool(await browser_check_cookie(type, account_file))
+        reason = "cookie 有效" if result else "cookie 已失效，需要重新登录"
+        method = "browser"
+    if cache is not None:
+        cache.put(type, account_file, mtime_ns, result, reason)
+    return result, reason, method
+
+
+async def check_cookie(type,file_path):
+    """单个账号是否有效，file_path 可以是 cookiesFile 下的文件名或完整路径。"""
+    fast_path = ACCOUNT_CHECK_SETTINGS.get("http_fast_path", True)
+    async with new_http_client() as client:
+        valid, _, _ = await validate_account(type, file_path, client if fast_path else None)
+    return valid
+
+async def iter_check_cookies(accounts: Iterable[Tuple[int, str]], concurrency: Optional[int] = None,
+                             timeout: Optional[float] = None, use_cache: bool = True) -> AsyncIterator[Dict]:
+    """
+    并发校验一批账号，每个账号按 validate_account 分级校验，大部分账号在 cookie 预检查或一次 HTTP 请求内得出结果。
+    HTTP 探测共用一个带连接池的客户端；需要浏览器的账号共用当前事件循环浏览器池里的同一个浏览器，
+    每个账号使用独立的上下文（退出时关闭）。同时进行的校验数由信号量限制。
+    accounts 为 (type, filePath) 列表，按完成顺序逐个产出 {"index", "type", "filePath", "valid", "reason", "method", "latency"}，
+    index 为账号在输入中的下标；单个账号异常或超时只记为该账号失效，不影响其他账号。
+    """
+    if concurrency is None:
+        concurrency = ACCOUNT_CHECK_SETTINGS.get("concurrency", 4)
+    if timeout is None:
+        timeout = ACCOUNT_CHECK_SETTINGS.get("timeout_seconds", 60)
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _check(client, index, type, file_path):
+        async with semaphore:
+            started = time.monotonic()
+            method = "browser"
+            try:
+                valid, reason, method = await asyncio.wait_for(validate_account(type, file_path, client, use_cache),
+                                                               timeout or None)
+            except asyncio.TimeoutError:
+                valid = False
+                reason = f"校验超时（{timeout}s）"
+            except Exception as exc:
+                valid = False
+                reason = f"校验异常: {exc}"
+            latency = round(time.monotonic() - started, 3)
+            account_logger.info(f"[+] 账号 {file_path} 校验完成（{method}）: {reason}，耗时 {latency}s")
+            return {"index": index, "type": type, "filePath": file_path, "valid": valid, "reason": reason,
+                    "method": method, "latency": latency}
+
+    accounts = list(accounts)
+    if not accounts:
+        return
+    fast_path = ACCOUNT_CHECK_SETTINGS.get("http_fast_path", True)
+    async with use_browser_pool(), new_http_client() as client:
+        tasks = [asyncio.ensure_future(_check(client if fast_path else None, index, type, file_path))
+                 for index, (type, file_path) in enumerate(accounts)]
         try:
-            await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en", wait_until="domcontentloaded", timeout=30000)
-            current_url = page.url or ""
-            if "/login" in current_url or "login" in current_url:
-                print("[+] TikTok cookie 失效")
-                return False
-            if await page.get_by_text(re.compile(r"\\blog\\s*in\\b", re.I)).count():
-                print("[+] TikTok cookie 失效")
-                return False
-            print("[+] TikTok cookie 有效")
-            return True
-        except Exception as exc:
-            print("[+] TikTok cookie 校验异常:", exc)
-            print("[+] TikTok cookie 失效")
-            return False
+            for future in asyncio.as_completed(tasks):
+                yield await future
         finally:
-            await context.close()
-            await browser.close()
+            # 调用方提前退出（如客户端断开）时取消尚未完成的校验，上下文随之关闭
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
 
-async def check_cookie(type,file_path):
-    match type:
-        # 小红书
-        case 1:
-            return await cookie_auth_xhs(Path(BASE_DIR / "cookiesFile" / file_path))
-        # 视频号
-        case 2:
-            return await cookie_auth_tencent(Path(BASE_DIR / "cookiesFile" / file_path))
-        # 抖音
-        case 3:
-            return await cookie_auth_douyin(Path(BASE_DIR / "cookiesFile" / file_path))
-        # 快手
-        case 4:
-            return await cookie_auth_ks(Path(BASE_DIR / "cookiesFile" / file_path))
-        # TikTok
-        case 5:
-            return await cookie_auth_tiktok(Path(BASE_DIR / "cookiesFile" / file_path))
-        case _:
-            return False
+async def check_cookies(accounts: Iterable[Tuple[int, str]], concurrency: Optional[int] = None,
+                        timeout: Optional[float] = None, use_cache: bool = True) -> List[Dict]:
+    """并发校验一批账号，按输入顺序返回结果，见 iter_check_cookies。"""
+    results = [result async for result in iter_check_cookies(accounts, concurrency, timeout, use_cache)]
+    return sorted(results, key=lambda result: result["index"])
 
 # a = asyncio.run(check_cookie(1,"3a6cfdc0-3d51-11f0-8507-44e51723d63c.json"))
 # print(a)
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from conf import BASE_DIR
+
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
+
+
+class CookieCheckCache(object):
+    """
+    cookie 校验结果的短期缓存，保存在 database.db 的 cookie_checks 表中，后端、CLI 与发布任务共用。
+    以 (cookie 文件绝对路径, 文件修改时间) 为键：cookie 文件被登录、上传或保活改写后修改时间变化，旧结果自动失效；
+    超过 max_age 秒的结果不再使用。
+    """
+
+    def __init__(self, db_path=None, max_age: Optional[float] = None):
+        self.db_path = Path(db_path or BASE_DIR / "database.db")
+        if max_age is None:
+            max_age = ACCOUNT_CHECK_SETTINGS.get("cache_seconds", 300)
+        self.max_age = float(max_age or 0)
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        with self._lock:
+            if self._schema_ready:
+                return
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS cookie_checks (
+                        account_file TEXT PRIMARY KEY,
+                        mtime_ns INTEGER NOT NULL,
+                        platform INTEGER NOT NULL,
+                        valid INTEGER NOT NULL,
+                        reason TEXT,
+                        checked_at REAL NOT NULL
+                    )
+                    """
+                )
+            self._schema_ready = True
+
+    @staticmethod
+    def _key(account_file) -> str:
+        return str(Path(account_file).resolve())
+
+    def get(self, platform: int, account_file, mtime_ns: int, now: Optional[float] = None) -> Optional[Tuple[bool, str]]:
+        """返回 (是否有效, 原因)，没有可用的缓存时返回 None。"""
+        if not self.max_age:
+            return None
+        self.ensure_schema()
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT valid, reason FROM cookie_checks "
+                "WHERE account_file = ? AND mtime_ns = ? AND platform = ? AND checked_at >= ?",
+                (self._key(account_file), mtime_ns, platform, now - self.max_age),
+            ).fetchone()
+        return (bool(row["valid"]), row["reason"] or "") if row else None
+
+    def put(self, platform: int, account_file, mtime_ns: int, valid: bool, reason: str):
+        if not self.max_age:
+            return
+        self.ensure_schema()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cookie_checks (account_file, mtime_ns, platform, valid, reason, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(account_file), mtime_ns, platform, int(bool(valid)), reason, time.time()),
+            )
+
+    def invalidate(self, account_file):
+        self.ensure_schema()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cookie_checks WHERE account_file = ?", (self._key(account_file),))
+
+
+_cache: Optional[CookieCheckCache] = None
+
+
+def get_cookie_cache() -> CookieCheckCache:
+    global _cache
+    if _cache is None:
+        _cache = CookieCheckCache()
+    return _cache
@@ -0,0 +1,173 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from utils.cookie_store import get_cookie_store
+
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
+
+# 各平台代表登录态的 cookie，至少存在一个未过期的才可能有效（平台标识：1 小红书 2 视频号 3 抖音 4 快手 5 TikTok）
+SESSION_COOKIES = {
+    1: ("web_session", "galaxy_creator_session_id", "access-token-creator.xiaohongshu.com"),
+    2: ("sessionid", "wxuin"),
+    3: ("sessionid", "sessionid_ss", "sid_tt", "sid_guard"),
+    4: ("kuaishou.web.cp.api_st", "kuaishou.web.cp.api_ph", "userId"),
+    5: ("sessionid", "sessionid_ss", "sid_tt", "uid_tt"),
+}
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0.0.0 Safari/537.36")
+
+
+def load_storage_state(account_file) -> Optional[Dict]:
+    """通过 cookie 存储读取 Playwright storage_state，不存在或内容损坏时返回 None。"""
+    return get_cookie_store().load(account_file)
+
+
+def session_cookies(platform: int, state: Dict) -> List[Dict]:
+    names = set(SESSION_COOKIES.get(platform, ()))
+    return [cookie for cookie in state.get("cookies") or [] if cookie.get("name") in names]
+
+
+def cookie_expires(cookie: Dict) -> Optional[float]:
+    """cookie 的过期时间戳，会话 cookie（expires 为 -1 或缺失）返回 None。"""
+    expires = cookie.get("expires")
+    if isinstance(expires, (int, float)) and expires > 0:
+        return float(expires)
+    return None
+
+
+def precheck_cookies(platform: int, state: Optional[Dict], now: Optional[float] = None) -> Tuple[bool, str]:
+    """
+    只看 cookie 文件本身：缺少登录 cookie 或登录 cookie 全部过期时返回 (False, 原因)，
+    否则返回 (True, "")，表示需要进一步请求平台确认。
+    """
+    if state is None:
+        return False, "cookie 文件不存在或格式错误"
+    cookies = session_cookies(platform, state)
+    if not cookies:
+        return False, "缺少登录 cookie"
+    now = time.time() if now is None else now
+    if all(cookie_expires(cookie) is not None and cookie_expires(cookie) <= now for cookie in cookies):
+        return False, "登录 cookie 已过期"
+    return True, ""
+
+
+def critical_expiry(platform: int, state: Optional[Dict]) -> Optional[float]:
+    """登录 cookie 中最早的过期时间，全部为会话 cookie 或没有登录 cookie 时返回 None。"""
+    if state is None:
+        return None
+    expires = [cookie_expires(cookie) for cookie in session_cookies(platform, state)]
+    expires = [value for value in expires if value is not None]
+    return min(expires) if expires else None
+
+
+def cookie_header(state: Dict, url: str) -> str:
+    """按域名和路径挑出请求 url 时浏览器会携带的 cookie，拼成 Cookie 请求头。"""
+    parts = urlsplit(url)
+    host, path = parts.hostname or "", parts.path or "/"
+    now = time.time()
+    pairs = []
+    for cookie in state.get("cookies") or []:
+        domain = (cookie.get("domain") or "").lstrip(".")
+        if not domain or not (host == domain or host.endswith("." + domain)):
+            continue
+        if not path.startswith(cookie.get("path") or "/"):
+            continue
+        expires = cookie_expires(cookie)
+        if expires is not None and expires <= now:
+            continue
+        pairs.append(f"{cookie['name']}={cookie.get('value', '')}")
+    return "; ".join(pairs)
+
+
+def _is_login_url(url: str) -> bool:
+    return "login" in url.lower() or "passport" in url.lower()
+
+
+def _parse_douyin(response: httpx.Response) -> Optional[bool]:
+    data = response.json()
+    if data.get("status_code") == 0 and data.get("user"):
+        return True
+    # 8: 未登录
+    if data.get("status_code") == 8:
+        return False
+    return None
+
+
+def _parse_xhs(response: httpx.Response) -> Optional[bool]:
+    data = response.json()
+    if data.get("success") and (data.get("data") or {}).get("userId"):
+        return True
+    # -100: 登录已过期
+    if data.get("code") == -100:
+        return False
+    return None
+
+
+def _parse_tiktok(response: httpx.Response) -> Optional[bool]:
+    # 只能确认有效：未登录时的响应没有稳定的错误码，交给浏览器判断
+    data = response.json()
+    user = (data.get("data") or {}).get("user") or {}
+    if data.get("status_code") == 0 and user.get("uid"):
+        return True
+    return None
+
+
+# 各平台的轻量探测请求：url 与解析函数，解析函数返回 True / False，无法判断时返回 None。
+# 小红书、抖音可以确认有效或失效；TikTok 只能确认有效，失效仍由浏览器判断；
+# 视频号、快手的创作者页面无论是否登录都返回同一个前端页面，没有可用的探测接口，始终由浏览器校验
+HTTP_PROBES = {
+    1: ("https://creator.xiaohongshu.com/api/galaxy/user/info", _parse_xhs),
+    3: ("https://creator.douyin.com/web/api/media/user/info/", _parse_douyin),
+    5: ("https://www.tiktok.com/passport/web/account/info/", _parse_tiktok),
+}
+
+
+def new_http_client(timeout: Optional[float] = None) -> httpx.AsyncClient:
+    """探测用的 HTTP 客户端，同一批校验共用一个，复用到各平台的连接。"""
+    if timeout is None:
+        timeout = ACCOUNT_CHECK_SETTINGS.get("http_timeout_seconds", 5)
+    return httpx.AsyncClient(
+        timeout=timeout,
+        follow_redirects=False,
+        headers={"User-Agent": USER_AGENT},
+        limits=httpx.Limits(max_connections=ACCOUNT_CHECK_SETTINGS.get("http_max_connections", 20)),
+    )
+
+
+async def http_probe(client: httpx.AsyncClient, platform: int, state: Dict) -> Tuple[Optional[bool], str]:
+    """
+    带 cookie 请求一次平台接口，返回 (结果, 原因)：结果为 None 表示无法判断（网络错误、风控、未知响应等），
+    需要回退到浏览器校验。
+    """
+    probe = HTTP_PROBES.get(platform)
+    if not probe:
+        return None, ""
+    url, parse = probe
+    parts = urlsplit(url)
+    try:
+        response = await client.get(url, headers={
+            "Cookie": cookie_header(state, url),
+            "Referer": f"{parts.scheme}://{parts.netloc}/",
+        })
+    except httpx.HTTPError as exc:
+        return None, f"探测请求失败: {exc.__class__.__name__}"
+    if response.is_redirect and _is_login_url(response.headers.get("location", "")):
+        return False, "cookie 已失效，需要重新登录"
+    if response.status_code == 401:
+        return False, "cookie 已失效，需要重新登录"
+    if response.status_code != 200:
+        return None, ""
+    try:
+        result = parse(response)
+    except (ValueError, AttributeError):
+        return None, ""
+    if result is None:
+        return None, ""
+    return result, "cookie 有效" if result else "cookie 已失效，需要重新登录"
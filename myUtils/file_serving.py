@@ -0,0 +1,68 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, request, send_file
+
+try:
+    from conf import FILE_SERVING_SETTINGS
+except ImportError:
+    FILE_SERVING_SETTINGS = {}
+
+
+def _cache_headers(response: Response, max_age: int):
+    # videoFile 下的文件名带 uuid，内容写入后不会再变，可以长期缓存
+    if max_age > 0:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+
+
+def _accel_enabled() -> Optional[str]:
+    """
+    返回 accel_redirect 前缀；请求不是经 nginx 转发（没有 nginx 设置的 X-Sendfile-Type 请求头）时返回 None，
+    直接访问后端端口仍由 Flask 发送文件，而不是返回没有内容的 200。
+    """
+    accel_prefix = FILE_SERVING_SETTINGS.get("accel_redirect")
+    if accel_prefix and request.headers.get("X-Sendfile-Type", "").lower() == "x-accel-redirect":
+        return accel_prefix
+    return None
+
+
+def send_library_file(path, relative_path: str, sha256: Optional[str] = None) -> Response:
+    """
+    返回素材文件，支持 Range（拖动进度条只请求需要的片段）与条件请求（If-None-Match / If-Modified-Since 返回 304）。
+    有内容哈希时以 SHA-256 作为强 ETag，去重后共用同一文件的记录 ETag 也相同。
+    配置了 accel_redirect 且请求经 nginx 转发时只返回 X-Accel-Redirect 响应头，由 nginx 以 sendfile 直接发送文件并处理 Range。
+    """
+    path = Path(path)
+    max_age = int(FILE_SERVING_SETTINGS.get("max_age", 365 * 86400))
+    accel_prefix = _accel_enabled()
+    if not accel_prefix:
+        response = send_file(path, conditional=True, etag=sha256 or True, max_age=max_age)
+        _cache_headers(response, max_age)
+        return response
+
+    last_modified = datetime.fromtimestamp(int(path.stat().st_mtime), timezone.utc)
+    # 与 send_file 一致：有 If-None-Match 时只按 ETag 判断，否则按 If-Modified-Since
+    if request.if_none_match:
+        not_modified = bool(sha256) and request.if_none_match.contains(sha256)
+    else:
+        not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+    if not_modified:
+        response = Response(status=304)
+    else:
+        mimetype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        response = Response(mimetype=mimetype)
+        # 响应头只能是 latin-1，文件名需要百分号编码，nginx 会先解码再查找文件
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(relative_path.replace(os.sep, "/"))
+    if sha256:
+        response.set_etag(sha256)
+    response.last_modified = last_modified
+    _cache_headers(response, max_age)
+    return response
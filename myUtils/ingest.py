@@ -0,0 +1,126 @@
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+
+from flask import Request
+
+from conf import BASE_DIR
+
+try:
+    from conf import UPLOAD_SETTINGS
+except ImportError:
+    UPLOAD_SETTINGS = {}
+
+INGEST_PREFIX = ".ingest-"
+
+
+class IngestFile(object):
+    """
+    直接写在 videoFile 目录下的上传临时文件，写入的同时计算大小与 SHA-256。
+    commit 时 fsync 后原地改名为最终文件，不再复制；未 commit 就关闭（请求失败、客户端断开）时删除。
+    其余文件方法（seek、read 等）转交给底层文件，可以作为 Werkzeug FileStorage 的 stream 使用。
+    """
+
+    def __init__(self, directory=None):
+        directory = Path(directory or BASE_DIR / "videoFile")
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{INGEST_PREFIX}{uuid.uuid4().hex}.part"
+        self._file = open(self.path, "w+b")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def commit(self, final_path) -> Path:
+        final_path = Path(final_path)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, final_path)
+        self.path = final_path
+        self.committed = True
+        return final_path
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def ingest_stream(stream: BinaryIO, length: Optional[int] = None, directory=None) -> IngestFile:
+    """把请求体按固定大小的缓冲区流式写入 IngestFile（原始字节上传，不经过 multipart 解析）。"""
+    buffer_bytes = int(UPLOAD_SETTINGS.get("buffer_bytes", 1024 * 1024))
+    target = IngestFile(directory)
+    try:
+        remaining = length
+        while remaining is None or remaining > 0:
+            buf = stream.read(buffer_bytes if remaining is None else min(buffer_bytes, remaining))
+            if not buf:
+                break
+            target.write(buf)
+            if remaining is not None:
+                remaining -= len(buf)
+    except BaseException:
+        target.close()
+        raise
+    return target
+
+
+def hash_file(path, buffer_bytes: int = 1024 * 1024) -> Tuple[int, str]:
+    """读取已落盘的文件，返回 (字节数, SHA-256)。用于无法在接收时计算哈希的情况（分片续传、历史文件）。"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(buffer_bytes), b""):
+            digest.update(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+def prune_ingest_files(directory=None, max_age: float = 86400) -> int:
+    """删除遗留的上传临时文件（进程在请求中途退出等情况），返回删除的数量。"""
+    directory = Path(directory or BASE_DIR / "videoFile")
+    removed = 0
+    for path in directory.glob(f"{INGEST_PREFIX}*.part"):
+        try:
+            if time.time() - path.stat().st_mtime > max_age:
+                path.unlink()
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+class IngestRequest(Request):
+    """
+    Flask 请求类：ingest_endpoints 中的接口解析 multipart 时，文件部分直接写入 videoFile 下的 IngestFile，
+    而不是 Werkzeug 默认的临时文件，保存时改名即可，每个字节只落盘一次。
+    """
+
+    ingest_endpoints = frozenset()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint in self.ingest_endpoints:
+            return IngestFile()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
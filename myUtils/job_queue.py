@@ -0,0 +1,567 @@
+import asyncio
+import importlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from myUtils.scheduler import SchedulePolicy, task_priority
+from utils.log import job_logger
+from utils.progress import set_progress_reporter, checkpoint_rank, CHECKPOINTS, PHASE_PUBLISH_CONFIRMED
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+JOB_STATUSES = (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED)
+
+# 在初版 publish_jobs 之后新增的字段：(字段名, 定义)
+_EXTRA_COLUMNS = (
+    ("phase", "TEXT"),
+    ("phase_detail", "TEXT"),
+    ("phase_at", "DATETIME"),
+    ("worker_id", "TEXT"),
+    ("lease_expires_at", "REAL"),
+    ("priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("checkpoint", "TEXT"),
+    ("checkpoint_detail", "TEXT"),
+)
+
+
+class JobQueue(object):
+    """
+    SQLite 持久化的发布任务队列，每个 (文件, 账号) 组合对应一条任务。
+    多节点部署时各 sau_worker 通过租约领取任务：claim 时写入 worker_id 与租约到期时间，
+    执行期间 heartbeat 续约，节点宕机后租约过期的任务由 reclaim_expired 回收。
+    其他任务存储只需实现同名方法（claim / heartbeat / reclaim_expired / update_progress / complete / fail / peek），
+    即可通过 load_job_store 接入。
+    """
+
+    def __init__(self, db_path, policy: Optional[SchedulePolicy] = None):
+        self.db_path = Path(db_path)
+        self.policy = policy or SchedulePolicy()
+
+    def _connect(self):
+        # isolation_level=None 以便手动控制 BEGIN IMMEDIATE，保证多线程抢任务时的原子性
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS publish_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT NOT NULL,
+                    platform INTEGER NOT NULL,
+                    file_path TEXT NOT NULL,
+                    account_file TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    started_at DATETIME,
+                    finished_at DATETIME
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_publish_jobs_status ON publish_jobs (status, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_publish_jobs_batch ON publish_jobs (batch_id)")
+            # 旧版本创建的表补齐新增字段
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(publish_jobs)")}
+            for name, definition in _EXTRA_COLUMNS:
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE publish_jobs ADD COLUMN {name} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_publish_jobs_queue ON publish_jobs (status, priority, id)")
+            # 账号领取记录：用于账号最小发布间隔、滑动窗口配额和公平轮转
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS account_claims (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    account_file TEXT NOT NULL,
+                    platform INTEGER NOT NULL,
+                    job_id INTEGER,
+                    claimed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_account_claims_time ON account_claims (claimed_at)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_account_claims_account ON account_claims (account_file, claimed_at)")
+
+    def enqueue(self, tasks: Iterable[Dict], batch_id: Optional[str] = None) -> Dict:
+        """批量写入任务，返回批次号与任务 id 列表。"""
+        batch_id = batch_id or uuid.uuid4().hex
+        job_ids = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for task in tasks:
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO publish_jobs (batch_id, platform, file_path, account_file, payload, status, priority)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            batch_id,
+                            task["platform"],
+                            task["file"],
+                            task["account"],
+                            json.dumps(task, ensure_ascii=False),
+                            JOB_STATUS_QUEUED,
+                            task_priority(task),
+                        ),
+                    )
+                    job_ids.append(cursor.lastrowid)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return {"batchId": batch_id, "jobIds": job_ids}
+
+    def claim(self, exclude_platforms: Iterable[int] = (), exclude_accounts: Iterable[str] = (),
+              worker_id: Optional[str] = None, lease_seconds: Optional[float] = None) -> Optional[Dict]:
+        """
+        按调度策略领取下一个任务并标记为运行中，没有可执行的任务时返回 None。
+        先按优先级通道（立即发布先于定时发布），同一通道内优先最久未发布的账号，再按入队顺序；
+        达到平台/账号并发上限、账号最小间隔或配额的任务暂时跳过（见 SchedulePolicy）。
+        exclude_platforms / exclude_accounts 可额外跳过调用方本地已满的平台和账号；
+        传入 worker_id 与 lease_seconds 时以租约方式领取，需在到期前 heartbeat 续约。
+        """
+        now = time.time()
+        lease_expires_at = now + lease_seconds if lease_seconds else None
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._next_candidates(conn, now, exclude_platforms, exclude_accounts)
+                if not rows:
+                    conn.execute("COMMIT")
+                    return None
+                row = rows[0]
+                conn.execute(
+                    """
+                    UPDATE publish_jobs
+                    SET status = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP, error = NULL,
+                        phase = NULL, phase_detail = NULL, phase_at = NULL, worker_id = ?, lease_expires_at = ?
+                    WHERE id = ?
+                    """,
+                    (JOB_STATUS_RUNNING, worker_id, lease_expires_at, row["id"]),
+                )
+                conn.execute(
+                    "INSERT INTO account_claims (account_file, platform, job_id, claimed_at) VALUES (?, ?, ?, ?)",
+                    (row["account_file"], row["platform"], row["id"], now),
+                )
+                conn.execute("DELETE FROM account_claims WHERE claimed_at < ?", (now - self.policy.history_window,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        job = _row_to_job(row)
+        job["status"] = JOB_STATUS_RUNNING
+        job["attempts"] += 1
+        job["worker_id"] = worker_id
+        job["lease_expires_at"] = lease_expires_at
+        return job
+
+    def _next_candidates(self, conn, now, exclude_platforms=(), exclude_accounts=(), limit=1):
+        blocked_platforms, blocked_accounts = self.policy.blocked(conn, now)
+        exclude_platforms = set(blocked_platforms) | set(exclude_platforms)
+        exclude_accounts = set(blocked_accounts) | set(exclude_accounts)
+        conditions = ["j.status = ?"]
+        params = [JOB_STATUS_QUEUED]
+        if exclude_platforms:
+            conditions.append(f"j.platform NOT IN ({','.join('?' * len(exclude_platforms))})")
+            params.extend(exclude_platforms)
+        if exclude_accounts:
+            conditions.append(f"j.account_file NOT IN ({','.join('?' * len(exclude_accounts))})")
+            params.extend(exclude_accounts)
+        params.append(limit)
+        rows = conn.execute(
+            f"""
+            SELECT j.* FROM publish_jobs j
+            LEFT JOIN (
+                SELECT account_file, MAX(claimed_at) AS last_claimed FROM account_claims GROUP BY account_file
+            ) c ON c.account_file = j.account_file
+            WHERE {' AND '.join(conditions)}
+            ORDER BY j.priority, COALESCE(c.last_claimed, 0), j.id
+            LIMIT ?
+            """,
+            params,
+        ).fetchall()
+        return rows
+
+    def heartbeat(self, worker_id: str, job_ids: Iterable[int], lease_seconds: float) -> List[int]:
+        """为 worker_id 仍持有的运行中任务续约，返回续约成功的任务 id（租约已被回收的任务不在其中）。"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+        placeholders = ",".join("?" * len(job_ids))
+        with self._connect() as conn:
+            conn.execute(
+                f"""
+                UPDATE publish_jobs SET lease_expires_at = ?
+                WHERE id IN ({placeholders}) AND worker_id = ? AND status = ?
+                """,
+                (time.time() + lease_seconds, *job_ids, worker_id, JOB_STATUS_RUNNING),
+            )
+            rows = conn.execute(
+                f"SELECT id FROM publish_jobs WHERE id IN ({placeholders}) AND worker_id = ? AND status = ?",
+                (*job_ids, worker_id, JOB_STATUS_RUNNING),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def reclaim_expired(self, max_attempts: int = 1) -> int:
+        """
+        回收租约已过期（所属节点宕机或失联）的运行中任务，按检查点处理（见 _resume_interrupted）。
+        返回回收的任务数。
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = self._resume_interrupted(
+                    conn, "lease_expires_at IS NOT NULL AND lease_expires_at < ?", (time.time(),),
+                    max_attempts, "执行节点租约过期")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return total
+
+    def interrupt(self, job_id: int, reason: str, max_attempts: int = 3) -> int:
+        """单个运行中的任务被意外中断（如工作进程崩溃或超时被终止），按检查点处理。"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = self._resume_interrupted(conn, "id = ?", (job_id,), max_attempts, reason)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return total
+
+    def _resume_interrupted(self, conn, condition: str, params, max_attempts: int, reason: str) -> int:
+        """
+        处理中断的运行中任务：已确认发布成功的直接记为成功；
+        其余任务尝试次数未达 max_attempts 的重新排队并保留检查点，下次执行时从头重跑，
+        已点击发布的任务不会重发（先到平台核对或交给人工确认，见 run_publish_task），否则标记为失败。
+        """
+        where = f"status = ? AND {condition}"
+        base_params = (JOB_STATUS_RUNNING, *params)
+        succeeded = conn.execute(
+            f"""
+            UPDATE publish_jobs SET status = ?, error = NULL, finished_at = CURRENT_TIMESTAMP,
+                worker_id = NULL, lease_expires_at = NULL
+            WHERE {where} AND checkpoint = ?
+            """,
+            (JOB_STATUS_SUCCEEDED, *base_params, PHASE_PUBLISH_CONFIRMED),
+        ).rowcount
+        requeued = conn.execute(
+            f"""
+            UPDATE publish_jobs SET status = ?, error = ?, worker_id = NULL, lease_expires_at = NULL
+            WHERE {where} AND attempts < ?
+            """,
+            (JOB_STATUS_QUEUED, f"{reason}，已重新排队", *base_params, max_attempts),
+        ).rowcount
+        failed = conn.execute(
+            f"""
+            UPDATE publish_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP,
+                worker_id = NULL, lease_expires_at = NULL
+            WHERE {where}
+            """,
+            (JOB_STATUS_FAILED, reason, *base_params),
+        ).rowcount
+        return succeeded + requeued + failed
+
+    def peek(self, limit: int = 1) -> List[Dict]:
+        """按当前调度顺序返回接下来可领取的排队任务（不领取），用于提前预热。"""
+        limit = max(0, int(limit))
+        if not limit:
+            return []
+        with self._connect() as conn:
+            rows = self._next_candidates(conn, time.time(), limit=limit)
+        return [_row_to_job(row) for row in rows]
+
+    def update_progress(self, job_id: int, phase: str, detail: Optional[str] = None):
+        """
+        记录运行中任务当前所处的阶段；属于检查点的阶段同时推进 checkpoint（只前进不后退，跨多次执行保留）。
+        checkpoint_detail 保存该检查点的 detail（如发布后平台返回的作品 id），同一检查点再次上报带 detail 时更新，
+        崩溃恢复时用于核对发布结果。
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "UPDATE publish_jobs SET phase = ?, phase_detail = ?, phase_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (phase, detail, job_id),
+                )
+                if phase in CHECKPOINTS:
+                    row = conn.execute("SELECT checkpoint FROM publish_jobs WHERE id = ?", (job_id,)).fetchone()
+                    if row is not None and checkpoint_rank(phase) > checkpoint_rank(row["checkpoint"]):
+                        conn.execute("UPDATE publish_jobs SET checkpoint = ?, checkpoint_detail = ? WHERE id = ?",
+                                     (phase, detail, job_id))
+                    elif row is not None and phase == row["checkpoint"] and detail:
+                        conn.execute("UPDATE publish_jobs SET checkpoint_detail = ? WHERE id = ?", (detail, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def complete(self, job_id: int, worker_id: Optional[str] = None):
+        self._finish(job_id, JOB_STATUS_SUCCEEDED, None, worker_id)
+
+    def fail(self, job_id: int, error: str, worker_id: Optional[str] = None):
+        self._finish(job_id, JOB_STATUS_FAILED, error, worker_id)
+
+    def _finish(self, job_id, status, error, worker_id=None):
+        # 带 worker_id 时只更新自己仍持有租约的任务，租约被回收后迟到的结果不覆盖新的执行
+        sql = "UPDATE publish_jobs SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?"
+        params = [status, error, job_id]
+        if worker_id is not None:
+            sql += " AND worker_id = ? AND status = ?"
+            params.extend([worker_id, JOB_STATUS_RUNNING])
+        with self._connect() as conn:
+            conn.execute(sql, params)
+
+    def recover_interrupted(self, max_attempts: int = 3) -> int:
+        """
+        服务重启时处理上次仍在运行中的任务：按检查点续跑或确认（见 _resume_interrupted），
+        反复中断超过 max_attempts 次的任务标记为失败。
+        由 sau_worker 以租约领取的任务不在此处理，交给 reclaim_expired。
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                total = self._resume_interrupted(conn, "worker_id IS NULL", (), max_attempts, "任务因服务重启中断")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return total
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM publish_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, status: Optional[str] = None, batch_id: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        clauses = []
+        params = []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if batch_id:
+            clauses.append("batch_id = ?")
+            params.append(batch_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM publish_jobs {where} ORDER BY id DESC LIMIT ?",
+                params,
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+
+def load_job_store(spec: Optional[str] = None, **kwargs):
+    """
+    按 "模块路径:类名" 加载任务存储，默认使用本模块的 JobQueue（SQLite，可放在共享卷上）。
+    kwargs 原样传给存储类的构造函数。
+    """
+    if not spec:
+        return JobQueue(**kwargs)
+    module_name, _, class_name = spec.partition(":")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    return store_class(**kwargs)
+
+
+class LeaseKeeper(object):
+    """
+    租约维护：每隔 lease_seconds / 3 为本节点运行中的任务续约，并回收其他节点过期的租约。
+    tick 为同步方法，由发布循环在线程中周期性调用。
+    """
+
+    def __init__(self, job_queue, worker_id: str, lease_seconds: float, max_attempts: int = 1):
+        self.job_queue = job_queue
+        self.worker_id = worker_id
+        self.lease_seconds = float(lease_seconds)
+        self.max_attempts = max(1, int(max_attempts))
+        self.interval = max(1.0, self.lease_seconds / 3)
+        self._last_tick = 0.0
+
+    def claim_kwargs(self) -> Dict:
+        return {"worker_id": self.worker_id, "lease_seconds": self.lease_seconds}
+
+    def tick(self, job_ids: Iterable[int], force: bool = False):
+        if not force and time.monotonic() - self._last_tick < self.interval:
+            return
+        self._last_tick = time.monotonic()
+        job_ids = list(job_ids)
+        try:
+            held = set(self.job_queue.heartbeat(self.worker_id, job_ids, self.lease_seconds))
+            for job_id in job_ids:
+                if job_id not in held:
+                    job_logger.warning(f"[-] 任务 {job_id} 的租约已失效（可能已被其他节点回收），其执行结果将被忽略")
+            reclaimed = self.job_queue.reclaim_expired(self.max_attempts)
+            if reclaimed:
+                job_logger.warning(f"[-] 回收了 {reclaimed} 个租约过期的任务")
+        except Exception as exc:
+            job_logger.error(f"[-] 续约失败: {exc}")
+
+
+# 领取任务遇到暂时性数据库错误时的最长重试间隔（秒）
+CLAIM_MAX_BACKOFF = 30
+
+
+class PublishWorkerPool(object):
+    """
+    后台发布循环：在独立线程中运行一个事件循环，持续从 JobQueue 领取任务并在该循环内并发执行。
+    max_jobs 为同时在执行的任务上限，平台/账号级的并发限制由 handler（PublishDispatcher）负责；
+    传入 limits（通常就是该 PublishDispatcher）时领取任务会跳过已满的平台和账号，避免领到后在信号量上空等占住名额。
+    执行中的任务已满时，把排在最前面的 lookahead 个排队任务交给 prefetch 提前准备（如预热上传页）。
+    传入 lease（LeaseKeeper）时以租约方式领取任务，用于 sau_worker 多节点部署。
+    """
+
+    def __init__(self, job_queue: JobQueue, handler: Callable[[Dict], Awaitable], max_jobs: int = 2,
+                 poll_interval: float = 1.0, lifespan: Optional[Callable[[], AsyncContextManager]] = None,
+                 prefetch: Optional[Callable[[List[Dict]], Awaitable]] = None, lookahead: int = 0,
+                 lease: Optional[LeaseKeeper] = None, limits=None):
+        self.job_queue = job_queue
+        self.handler = handler
+        self.lease = lease
+        self.limits = limits
+        self._running: Dict[int, Dict] = {}
+        self.prefetch = prefetch
+        self.lookahead = max(0, int(lookahead))
+        self._prefetch_task = None
+        # lifespan 在事件循环整个生命周期内保持进入状态，用于持有浏览器池等长期资源
+        self.lifespan = lifespan
+        self.max_jobs = max(1, int(max_jobs))
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._thread_main, name="publish-worker", daemon=True)
+        self._thread.start()
+        job_logger.info(f"[+] 发布任务循环已启动，最多同时执行 {self.max_jobs} 个任务")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _thread_main(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        if self.lifespan is None:
+            await self._run()
+            return
+        async with self.lifespan():
+            await self._run()
+
+    async def _run(self):
+        in_flight = set()
+        claim_failures = 0
+        while not self._stop_event.is_set():
+            if self.lease is not None:
+                await asyncio.to_thread(self.lease.tick, list(self._running))
+            if len(in_flight) >= self.max_jobs:
+                self._maybe_prefetch()
+                await asyncio.wait(in_flight, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            claim_kwargs = self.lease.claim_kwargs() if self.lease is not None else {}
+            if self.limits is not None:
+                full_platforms, full_accounts = saturated_slots(self._running.values(), self.limits)
+                claim_kwargs.update(exclude_platforms=full_platforms, exclude_accounts=full_accounts)
+            try:
+                # sqlite 可能因锁等待阻塞，放到线程里执行，避免卡住正在运行的上传
+                job = await asyncio.to_thread(self.job_queue.claim, **claim_kwargs)
+            except sqlite3.OperationalError as exc:
+                # 数据库被锁等暂时性错误：按 poll_interval 指数退避重试，最长间隔 CLAIM_MAX_BACKOFF 秒
+                claim_failures += 1
+                delay = min(self.poll_interval * 2 ** (claim_failures - 1), CLAIM_MAX_BACKOFF)
+                job_logger.warning(f"[-] 领取任务失败（第 {claim_failures} 次），{delay:g}s 后重试: {exc}")
+                await asyncio.sleep(delay)
+                continue
+            except Exception as exc:
+                # 线程池已关闭（解释器退出中，RuntimeError）、表结构错误等无法通过重试恢复，停止领取
+                job_logger.error(f"[-] 领取任务失败，发布循环停止领取新任务: {exc!r}")
+                break
+            claim_failures = 0
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            # 领取后立即登记，下一轮领取时按它计算已满的平台和账号
+            self._running[job["id"]] = job
+            task = asyncio.create_task(self._execute(job))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if self._prefetch_task is not None:
+            in_flight.add(self._prefetch_task)
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    def _maybe_prefetch(self):
+        if self.prefetch is None or self.lookahead <= 0:
+            return
+        if self._prefetch_task is not None and not self._prefetch_task.done():
+            return
+        self._prefetch_task = asyncio.create_task(self._prefetch())
+
+    async def _prefetch(self):
+        try:
+            jobs = await asyncio.to_thread(self.job_queue.peek, self.lookahead)
+            if jobs:
+                await self.prefetch(jobs)
+        except Exception as exc:
+            job_logger.warning(f"[-] 预热排队任务失败: {exc}")
+
+    async def _execute(self, job):
+        job_logger.info(f"[+] 开始执行任务 {job['id']}: {job['file_path']} -> {job['account_file']}")
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        # 进度写库放到线程池，不阻塞事件循环；durable 的检查点由上传器 await 返回的 future，确认写入后才继续
+        set_progress_reporter(lambda phase, detail=None, durable=False: loop.run_in_executor(
+            None, self.job_queue.update_progress, job["id"], phase, detail))
+        worker_id = job.get("worker_id")
+        try:
+            await self.handler(job)
+        except Exception as exc:
+            job_logger.exception(f"[-] 任务 {job['id']} 执行失败: {exc}")
+            await asyncio.to_thread(self.job_queue.fail, job["id"], str(exc) or exc.__class__.__name__, worker_id)
+        else:
+            job_logger.success(f"[+] 任务 {job['id']} 执行完成，耗时 {time.monotonic() - started:.1f}s")
+            await asyncio.to_thread(self.job_queue.complete, job["id"], worker_id)
+        finally:
+            self._running.pop(job["id"], None)
+
+
+def saturated_slots(running: Iterable[Dict], limits) -> Tuple[List[int], List[str]]:
+    """按执行中的任务统计已达到并发上限的平台和账号，limits 提供 platform_limit(platform) 与 account_limit。"""
+    platform_counts, account_counts = {}, {}
+    for job in running:
+        platform_counts[job["platform"]] = platform_counts.get(job["platform"], 0) + 1
+        account_counts[job["account_file"]] = account_counts.get(job["account_file"], 0) + 1
+    full_platforms = [platform for platform, count in platform_counts.items()
+                      if count >= limits.platform_limit(platform)]
+    full_accounts = [account for account, count in account_counts.items() if count >= limits.account_limit]
+    return full_platforms, full_accounts
+
+
+def _row_to_job(row) -> Dict:
+    job = dict(row)
+    try:
+        job["payload"] = json.loads(job.get("payload") or "{}")
+    except ValueError:
+        job["payload"] = {}
+    return job
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from myUtils.account_status import AccountStatusStore
+from utils.base_social_media import set_init_script
+from utils.browser_pool import get_browser_pool, use_browser_pool
+from utils.log import account_logger
+
+try:
+    from conf import KEEPALIVE_SETTINGS
+except ImportError:
+    KEEPALIVE_SETTINGS = {}
+
+# 保活时访问的页面（平台标识：1 小红书 2 视频号 3 抖音 4 快手 5 TikTok），与 cookie 校验访问的页面一致
+KEEPALIVE_URLS = {
+    1: "https://creator.xiaohongshu.com/creator-micro/content/upload",
+    2: "https://channels.weixin.qq.com/platform/post/create",
+    3: "https://creator.douyin.com/creator-micro/content/upload",
+    4: "https://cp.kuaishou.com/article/publish/video",
+    5: "https://www.tiktok.com/tiktokstudio/upload?lang=en",
+}
+
+
+class SessionKeeper(object):
+    """
+    会话保活线程：每隔 interval 秒重新索引所有账号的 cookie 过期时间，
+    对登录 cookie 将在 lead 秒内过期的有效账号，用其 cookie 打开一次平台页面，让平台续期会话，
+    再把浏览器中的最新状态写回 cookie 文件并更新索引。每个账号至少间隔 min_gap 秒才会再次保活，
+    平台不续期的账号不会被反复打开，仍会出现在 /getExpiringAccounts 中等待重新登录。
+    """
+
+    def __init__(self, store: AccountStatusStore, lead: Optional[float] = None, interval: Optional[float] = None,
+                 min_gap: Optional[float] = None, batch_size: Optional[int] = None):
+        settings = KEEPALIVE_SETTINGS
+        self.store = store
+        self.lead = float(lead if lead is not None else settings.get("lead_hours", 24) * 3600)
+        self.interval = float(interval if interval is not None else settings.get("interval_seconds", 300))
+        self.min_gap = float(min_gap if min_gap is not None else settings.get("min_gap_seconds", 21600))
+        self.batch_size = int(batch_size if batch_size is not None else settings.get("batch_size", 5))
+        self.settle_seconds = float(settings.get("settle_seconds", 3))
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="session-keeper", daemon=True)
+        self._thread.start()
+        account_logger.info(f"[+] 会话保活线程已启动，提前 {self.lead / 3600:.1f} 小时保活")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                # cookie 文件会被上传、登录等流程改写，每轮先重新索引，代价只是解析 JSON
+                self.store.index_expiry()
+                accounts = self.store.keepalive_candidates(self.lead, self.min_gap, self.batch_size)
+            except Exception as exc:
+                account_logger.error(f"[-] 读取待保活账号失败: {exc}")
+                accounts = []
+            if accounts:
+                async with use_browser_pool():
+                    for account in accounts:
+                        if self._stop_event.is_set():
+                            break
+                        await self.touch(account)
+            await asyncio.to_thread(self._stop_event.wait, self.interval)
+
+    async def touch(self, account: Dict) -> bool:
+        """打开一次平台页面并写回 cookie，返回登录 cookie 的过期时间是否被延长。"""
+        url = KEEPALIVE_URLS.get(account["type"])
+        if not url:
+            return False
+        account_file = self.store.cookies_dir / account["filePath"]
+        pool = get_browser_pool()
+        try:
+            async with pool.account_context(account_file, headless=True) as context:
+                context = await set_init_script(context)
+                page = await context.new_page()
+                try:
+                    await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                    # 等待页面里的接口请求完成，平台通常在这些请求的响应中下发续期后的 cookie
+                    await asyncio.sleep(self.settle_seconds)
+                finally:
+                    # profile 模式下上下文会继续保留，页面需要单独关闭
+                    await page.close()
+                # profile 模式默认只标记待同步，这里需要立即写回，下面才能按新 cookie 计算过期时间
+                await pool.save_storage_state(context, account_file, force=True)
+        except Exception as exc:
+            account_logger.error(f"[-] 账号 {account['id']} 保活失败: {exc}")
+            return False
+        finally:
+            self.store.mark_keepalive(account["id"])
+        expires_at = self.store.index_expiry([account["id"]]).get(account["id"])
+        extended = expires_at is None or expires_at > (account["cookie_expires_at"] or 0)
+        if extended:
+            account_logger.success(f"[+] 账号 {account['id']} 保活完成")
+        else:
+            account_logger.warning(f"[-] 账号 {account['id']} 保活后 cookie 仍将于 "
+                                   f"{datetime.fromtimestamp(account['cookie_expires_at']):%Y-%m-%d %H:%M} 过期，需要重新登录")
+        return extended
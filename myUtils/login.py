@@ -1,15 +1,56 @@
 import asyncio
 import base64
 import sqlite3
+import time
 import uuid
 from pathlib import Path
 
 from playwright.async_api import async_playwright
 
-from myUtils.auth import check_cookie
+from myUtils.auth import validate_context
+from myUtils.cookie_cache import get_cookie_cache
+from myUtils.cookie_check import critical_expiry, new_http_client
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
 from conf import BASE_DIR
 
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
+
+
+async def save_login(type, user_name, context):
+    """
+    扫码登录完成后，在同一个已登录的上下文中校验登录态（cookie 预检查、HTTP 探测，必要时在该上下文中打开页面），
+    有效时保存 cookie 并写入 user_info，返回 cookie 文件名；校验失败返回 None。
+    """
+    fast_path = ACCOUNT_CHECK_SETTINGS.get("http_fast_path", True)
+    async with new_http_client() as client:
+        valid, reason, method, state = await validate_context(type, context, client if fast_path else None)
+    if not valid:
+        print(f"❌ 登录校验失败（{method}）: {reason}")
+        return None
+    file_name = f"{uuid.uuid1()}.json"
+    print(f"UUID v1: {file_name}")
+    # 确保cookiesFile目录存在
+    cookies_dir = Path(BASE_DIR / "cookiesFile")
+    cookies_dir.mkdir(exist_ok=True)
+    store = get_cookie_store()
+    await asyncio.to_thread(store.save, cookies_dir / file_name, state)
+    # 校验结果写入短期缓存，登录后紧接着的账号校验直接复用
+    get_cookie_cache().put(type, cookies_dir / file_name, store.stamp(cookies_dir / file_name), True, reason)
+    with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+                            INSERT INTO user_info (type, filePath, userName, status, last_checked_at, status_reason,
+                                                   cookie_expires_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ''', (type, file_name, user_name, 1, time.time(), "登录成功", critical_expiry(type, state)))
+        conn.commit()
+        print("✅ 用户状态已记录")
+    return file_name
+
 # 抖音登录
 async def douyin_cookie_gen(id,status_queue):
     url_changed_event = asyncio.Event()
@@ -25,7 +66,7 @@ async def douyin_cookie_gen(id,status_queue):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://creator.douyin.com/")
@@ -49,31 +90,12 @@ async def douyin_cookie_gen(id,status_queue):
             await browser.close()
             status_queue.put("500")
             return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(3, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
+        # 在当前已登录的上下文中校验并写入账号，不再另开浏览器
+        file_name = await save_login(3, id, context)
         await page.close()
         await context.close()
         await browser.close()
-        with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (3, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+        status_queue.put("200" if file_name else "500")
 
 
 # 视频号登录
@@ -96,7 +118,7 @@ async def get_tencent_cookie(id,status_queue):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         # Pause the page, and start recording manually.
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         page = await context.new_page()
         await page.goto("https://channels.weixin.qq.com")
         original_url = page.url
@@ -127,32 +149,12 @@ async def get_tencent_cookie(id,status_queue):
             await context.close()
             await browser.close()
             return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(2,f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
+        # 在当前已登录的上下文中校验并写入账号，不再另开浏览器
+        file_name = await save_login(2, id, context)
         await page.close()
         await context.close()
         await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (2, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+        status_queue.put("200" if file_name else "500")
 
 # 快手登录
 async def get_ks_cookie(id,status_queue):
@@ -172,7 +174,7 @@ async def get_ks_cookie(id,status_queue):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://cp.kuaishou.com")
@@ -201,32 +203,12 @@ async def get_ks_cookie(id,status_queue):
             await context.close()
             await browser.close()
             return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(4, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
+        # 在当前已登录的上下文中校验并写入账号，不再另开浏览器
+        file_name = await save_login(4, id, context)
         await page.close()
         await context.close()
         await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (4, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+        status_queue.put("200" if file_name else "500")
 
 # 小红书登录
 async def xiaohongshu_cookie_gen(id,status_queue):
@@ -248,7 +230,7 @@ async def xiaohongshu_cookie_gen(id,status_queue):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://creator.xiaohongshu.com/")
@@ -275,32 +257,12 @@ async def xiaohongshu_cookie_gen(id,status_queue):
             await context.close()
             await browser.close()
             return None
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        # 确保cookiesFile目录存在
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(1, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
+        # 在当前已登录的上下文中校验并写入账号，不再另开浏览器
+        file_name = await save_login(1, id, context)
         await page.close()
         await context.close()
         await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO user_info (type, filePath, userName, status)
-                                VALUES (?, ?, ?, ?)
-                                ''', (1, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ 用户状态已记录")
-        status_queue.put("200")
+        status_queue.put("200" if file_name else "500")
 
 async def tiktok_cookie_gen(id, status_queue):
     async def wait_for_login(target_context, target_page, timeout_seconds=200):
@@ -380,7 +342,7 @@ async def tiktok_cookie_gen(id, status_queue):
         }
         browser = await playwright.chromium.launch(**options)
         context = await browser.new_context()
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         page = await context.new_page()
         await page.goto("https://www.tiktok.com/login?lang=en")
         try:
@@ -457,31 +419,12 @@ async def tiktok_cookie_gen(id, status_queue):
             await browser.close()
             return None
 
-        uuid_v1 = uuid.uuid1()
-        cookies_dir = Path(BASE_DIR / "cookiesFile")
-        cookies_dir.mkdir(exist_ok=True)
-        await context.storage_state(path=cookies_dir / f"{uuid_v1}.json")
-        result = await check_cookie(5, f"{uuid_v1}.json")
-        if not result:
-            status_queue.put("500")
-            await page.close()
-            await context.close()
-            await browser.close()
-            return None
-
+        # 在当前已登录的上下文中校验并写入账号，不再另开浏览器
+        file_name = await save_login(5, id, context)
         await page.close()
         await context.close()
         await browser.close()
-
-        with sqlite3.connect(Path(BASE_DIR / "database.db")) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                           INSERT INTO user_info (type, filePath, userName, status)
-                           VALUES (?, ?, ?, ?)
-                           ''', (5, f"{uuid_v1}.json", id, 1))
-            conn.commit()
-            print("✅ TikTok 用户状态已记录")
-        status_queue.put("200")
+        status_queue.put("200" if file_name else "500")
 
 # a = asyncio.run(xiaohongshu_cookie_gen(4,None))
 # print(a)
@@ -0,0 +1,279 @@
+import json
+import math
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from conf import BASE_DIR
+from utils.log import upload_logger
+
+try:
+    from conf import MEDIA_PROBE_SETTINGS
+except ImportError:
+    MEDIA_PROBE_SETTINGS = {}
+
+MEDIA_OK = "ok"
+MEDIA_ERROR = "error"
+
+# media_info 中的元数据字段，/getFiles 与发布任务中的 media 字段按此顺序返回
+MEDIA_COLUMNS = ("duration", "width", "height", "video_codec", "audio_codec", "bitrate", "fps", "aspect_ratio",
+                 "format_name")
+
+
+class MediaProbeError(Exception):
+    """文件无法解析（不是音视频文件、文件损坏或 ffprobe 超时）。"""
+
+
+class MediaProbeUnavailable(MediaProbeError):
+    """找不到 ffprobe，稍后安装后重启服务即可补齐。"""
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _frame_rate(value) -> Optional[float]:
+    # ffprobe 的帧率是分数形式，如 30000/1001；无法得知时为 0/0
+    try:
+        rate = Fraction(str(value))
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(float(rate), 3) if rate > 0 else None
+
+
+def _rotation(stream: Dict) -> int:
+    rotate = (stream.get("tags") or {}).get("rotate")
+    for side_data in stream.get("side_data_list") or []:
+        if "rotation" in side_data:
+            rotate = side_data["rotation"]
+    try:
+        return int(float(rotate or 0)) % 360
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_probe(probe: Dict) -> Dict:
+    """把 ffprobe -show_format -show_streams 的 JSON 输出整理为 MEDIA_COLUMNS 中的字段。"""
+    streams = probe.get("streams") or []
+    fmt = probe.get("format") or {}
+    # 封面图（attached_pic）也是 video 类型的流，跳过
+    video = next((s for s in streams if s.get("codec_type") == "video"
+                  and not (s.get("disposition") or {}).get("attached_pic")), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video is None and audio is None:
+        raise MediaProbeError("没有音视频流")
+
+    info = dict.fromkeys(MEDIA_COLUMNS)
+    info["format_name"] = fmt.get("format_name")
+    info["duration"] = _to_float(fmt.get("duration")) or _to_float((video or audio).get("duration"))
+    bitrate = _to_float(fmt.get("bit_rate"))
+    info["bitrate"] = int(bitrate) if bitrate else None
+    if audio is not None:
+        info["audio_codec"] = audio.get("codec_name")
+    if video is not None:
+        width, height = video.get("width"), video.get("height")
+        # 手机竖拍的视频常以横向分辨率存储并带旋转标记，按显示方向记录宽高
+        if width and height and _rotation(video) in (90, 270):
+            width, height = height, width
+        info["width"], info["height"] = width, height
+        info["video_codec"] = video.get("codec_name")
+        info["fps"] = _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate"))
+        if width and height:
+            divisor = math.gcd(int(width), int(height))
+            info["aspect_ratio"] = f"{int(width) // divisor}:{int(height) // divisor}"
+    return info
+
+
+def probe_media(path, ffprobe: Optional[str] = None, timeout: Optional[float] = None) -> Dict:
+    """对单个文件运行一次 ffprobe，返回 parse_probe 的结果。"""
+    ffprobe = ffprobe or MEDIA_PROBE_SETTINGS.get("ffprobe") or "ffprobe"
+    timeout = float(timeout if timeout is not None else MEDIA_PROBE_SETTINGS.get("timeout_seconds", 60))
+    command = [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)]
+    try:
+        proc = subprocess.run(command, capture_output=True, timeout=timeout)
+    except FileNotFoundError:
+        raise MediaProbeUnavailable(f"找不到 {ffprobe}，请安装 ffmpeg")
+    except subprocess.TimeoutExpired:
+        raise MediaProbeError(f"ffprobe 超过 {timeout:g}s 未完成")
+    if proc.returncode != 0:
+        message = proc.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise MediaProbeError(message[-1] if message else f"ffprobe 退出码 {proc.returncode}")
+    try:
+        return parse_probe(json.loads(proc.stdout or b"{}"))
+    except ValueError:
+        raise MediaProbeError("无法解析 ffprobe 输出")
+
+
+class MediaInfoStore(object):
+    """
+    素材的音视频元数据，按内容哈希（file_records.sha256）保存，内容相同的素材只解析一次。
+    status 为 ok 时 MEDIA_COLUMNS 有效；为 error 时 error 为失败原因（不是音视频文件、文件损坏等）。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS media_info (
+                    sha256 TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    duration REAL,
+                    width INTEGER,
+                    height INTEGER,
+                    video_codec TEXT,
+                    audio_codec TEXT,
+                    bitrate INTEGER,
+                    fps REAL,
+                    aspect_ratio TEXT,
+                    format_name TEXT,
+                    error TEXT,
+                    probed_at REAL NOT NULL
+                )
+                """
+            )
+
+    @staticmethod
+    def _describe(row) -> Dict:
+        info = {name: row[name] for name in MEDIA_COLUMNS}
+        info["status"] = row["status"]
+        info["error"] = row["error"]
+        return info
+
+    def save(self, sha256: str, info: Optional[Dict] = None, error: Optional[str] = None):
+        values = dict.fromkeys(MEDIA_COLUMNS)
+        values.update({name: (info or {}).get(name) for name in MEDIA_COLUMNS})
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO media_info (sha256, status, {', '.join(MEDIA_COLUMNS)}, error, probed_at) "
+                f"VALUES ({', '.join('?' * (len(MEDIA_COLUMNS) + 4))})",
+                (sha256, MEDIA_ERROR if error else MEDIA_OK, *(values[name] for name in MEDIA_COLUMNS),
+                 error, time.time()),
+            )
+
+    def get(self, sha256: str) -> Optional[Dict]:
+        return self.get_many([sha256]).get(sha256)
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Dict]:
+        hashes = list({value for value in hashes if value})
+        if not hashes:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM media_info WHERE sha256 IN ({', '.join('?' * len(hashes))})",
+                                hashes).fetchall()
+        return {row["sha256"]: self._describe(row) for row in rows}
+
+    def for_files(self, file_paths: Iterable[str]) -> Dict[str, Dict]:
+        """按 videoFile 下的文件名查询元数据，没有记录或尚未解析的文件不在结果中。"""
+        file_paths = list(set(file_paths))
+        if not file_paths:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT f.file_path, m.* FROM file_records f JOIN media_info m ON m.sha256 = f.sha256 "
+                f"WHERE f.file_path IN ({', '.join('?' * len(file_paths))})",
+                file_paths,
+            ).fetchall()
+        return {row["file_path"]: self._describe(row) for row in rows}
+
+    def pending(self, limit: int = 1000) -> List[Tuple[str, str]]:
+        """已有哈希但尚未解析的素材：每个哈希取一个文件，返回 [(sha256, file_path)]。"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT f.sha256, MIN(f.file_path) FROM file_records f
+                LEFT JOIN media_info m ON m.sha256 = f.sha256
+                WHERE f.sha256 IS NOT NULL AND m.sha256 IS NULL
+                GROUP BY f.sha256 LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def prune(self) -> int:
+        """删除已没有素材记录引用的元数据，返回删除的条数。"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM media_info WHERE sha256 NOT IN "
+                "(SELECT sha256 FROM file_records WHERE sha256 IS NOT NULL)"
+            ).rowcount
+
+
+class MediaProber(object):
+    """
+    素材入库后的元数据解析：workers 个线程并发运行 ffprobe（每个文件一个子进程），每个内容哈希只解析一次。
+    上传完成后调用 submit；服务启动时调用 scan 补齐历史素材。找不到 ffprobe 时停止提交并只记录一次警告。
+    """
+
+    def __init__(self, store: MediaInfoStore, video_dir=None, workers: Optional[int] = None):
+        self.store = store
+        self.video_dir = Path(video_dir or BASE_DIR / "videoFile")
+        self.workers = max(1, int(workers if workers is not None else MEDIA_PROBE_SETTINGS.get("workers", 2)))
+        self.available = True
+        self._executor = None
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._executor is None and MEDIA_PROBE_SETTINGS.get("enabled", True):
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="media-probe")
+        return self
+
+    def stop(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+
+    def submit(self, sha256: Optional[str], file_path: str) -> bool:
+        """提交一个待解析的素材，已在解析中或未启动时返回 False。"""
+        if not sha256 or self._executor is None or not self.available:
+            return False
+        with self._lock:
+            if sha256 in self._inflight:
+                return False
+            self._inflight.add(sha256)
+        self._executor.submit(self._probe, sha256, file_path)
+        return True
+
+    def scan(self) -> int:
+        """提交所有尚未解析的素材，返回提交的数量。"""
+        return sum(self.submit(sha256, file_path) for sha256, file_path in self.store.pending())
+
+    def _probe(self, sha256: str, file_path: str):
+        try:
+            if self.store.get(sha256) is not None:
+                return
+            info = probe_media(self.video_dir / file_path)
+        except MediaProbeUnavailable as exc:
+            # 不写入失败记录，安装 ffmpeg 并重启后 scan 会重新提交
+            if self.available:
+                upload_logger.warning(f"[-] 无法解析素材元数据: {exc}")
+            self.available = False
+        except MediaProbeError as exc:
+            self.store.save(sha256, error=str(exc))
+            upload_logger.warning(f"[-] 解析 {file_path} 失败: {exc}")
+        except Exception as exc:
+            upload_logger.error(f"[-] 解析 {file_path} 出错: {exc}")
+        else:
+            self.store.save(sha256, info)
+            upload_logger.info(f"[+] 已解析 {file_path}: {info['width']}x{info['height']} {info['duration']}s "
+                               f"{info['video_codec']}/{info['audio_codec']}")
+        finally:
+            with self._lock:
+                self._inflight.discard(sha256)
@@ -1,4 +1,5 @@
 import asyncio
+from datetime import datetime
 from pathlib import Path
 
 from conf import BASE_DIR
@@ -8,104 +9,221 @@ from uploader.tencent_uploader.main import TencentVideo
 from uploader.tk_uploader.main_chrome import TiktokVideo
 from uploader.xiaohongshu_uploader.main import XiaoHongShuVideo
 from utils.constant import TencentZoneTypes
+from utils.browser_pool import get_browser_pool, use_browser_pool
 from utils.files_times import generate_schedule_time_next_day
+from utils.log import job_logger
+from utils.progress import report_progress, checkpoint_reached, PHASE_WAITING, PHASE_RUNNING, PHASE_PUBLISH_CLICKED
+
+try:
+    from conf import PUBLISH_CONCURRENCY
+except ImportError:
+    PUBLISH_CONCURRENCY = {}
+
+# 平台标识：1 小红书 2 视频号 3 抖音 4 快手 5 TikTok
+PLATFORM_NAMES = {
+    1: "xiaohongshu",
+    2: "tencent",
+    3: "douyin",
+    4: "kuaishou",
+    5: "tiktok",
+}
+PUBLISH_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
 def post_video_tencent(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
-    # 生成文件的完整路径
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
-    if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
-    else:
-        publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = TencentVideo(title, str(file), tags, publish_datetimes[index], cookie, category)
-            asyncio.run(app.main(), debug=False)
+    tasks = build_publish_tasks(2, title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                daily_times, start_days)
+    publish_tasks(tasks)
 
 
 def post_video_DouYin(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0,
                       thumbnail_path = '',
                       productLink = '', productTitle = ''):
-    # 生成文件的完整路径
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
-    if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
-    else:
-        publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = DouYinVideo(title, str(file), tags, publish_datetimes[index], cookie, thumbnail_path, productLink, productTitle)
-            asyncio.run(app.main(), debug=False)
+    tasks = build_publish_tasks(3, title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                daily_times, start_days, thumbnail_path, productLink, productTitle)
+    publish_tasks(tasks)
 
 
 def post_video_ks(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
-    # 生成文件的完整路径
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
-    if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times,start_days)
-    else:
-        publish_datetimes = [0 for i in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = KSVideo(title, str(file), tags, publish_datetimes[index], cookie)
-            asyncio.run(app.main(), debug=False)
+    tasks = build_publish_tasks(4, title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                daily_times, start_days)
+    publish_tasks(tasks)
 
 def post_video_tiktok(title, files, tags, account_file, category=None, enableTimer=False,
                       videos_per_day=1, daily_times=None, start_days=0, thumbnail_path='', is_ai_content=None):
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
-    if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day, daily_times, start_days)
-    else:
-        publish_datetimes = [0 for _ in range(len(files))]
-    for index, file in enumerate(files):
-        for cookie in account_file:
-            print(f"文件路径{str(file)}")
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = TiktokVideo(title, str(file), tags or [], publish_datetimes[index], cookie, thumbnail_path,
-                              is_ai_content=is_ai_content)
-            asyncio.run(app.main(), debug=False)
+    tasks = build_publish_tasks(5, title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                daily_times, start_days, thumbnail_path, is_ai_content=is_ai_content)
+    publish_tasks(tasks)
 
 def post_video_xhs(title,files,tags,account_file,category=TencentZoneTypes.LIFESTYLE.value,enableTimer=False,videos_per_day = 1, daily_times=None,start_days = 0):
-    # 生成文件的完整路径
-    account_file = [Path(BASE_DIR / "cookiesFile" / file) for file in account_file]
-    files = [Path(BASE_DIR / "videoFile" / file) for file in files]
-    file_num = len(files)
+    tasks = build_publish_tasks(1, title, files, tags, account_file, category, enableTimer, videos_per_day,
+                                daily_times, start_days)
+    publish_tasks(tasks)
+
+
+def publish_tasks(tasks, dispatcher=None):
+    """在单个事件循环内执行整批任务，耗时约等于最慢的一条并发通道。"""
+    dispatcher = dispatcher or PublishDispatcher()
+
+    async def _run():
+        # 整批任务共用一个浏览器池，结束时统一关闭
+        async with use_browser_pool():
+            return await dispatcher.run(tasks)
+
+    return asyncio.run(_run(), debug=False)
+
+
+def build_publish_tasks(platform, title, files, tags, account_file, category=None, enableTimer=False,
+                        videos_per_day=1, daily_times=None, start_days=0, thumbnail_path='',
+                        productLink='', productTitle='', is_ai_content=None, media_info=None):
+    """
+    将一次发布请求展开为 (文件, 账号) 维度的任务列表，任务内容可直接 JSON 序列化后入队。
+    定时发布时间按文件下标分配，同一文件在各账号上的发布时间一致。
+    media_info 为 {文件名: 元数据}（见 myUtils/media_info.py），写入任务的 media 字段，执行时无需再解析文件。
+    """
+    media_info = media_info or {}
+    if platform not in PLATFORM_NAMES:
+        raise ValueError(f"不支持的平台类型: {platform}")
     if enableTimer:
-        publish_datetimes = generate_schedule_time_next_day(file_num, videos_per_day, daily_times,start_days)
+        publish_datetimes = generate_schedule_time_next_day(len(files), videos_per_day or 1, daily_times,
+                                                            start_days=start_days or 0)
+        publish_dates = [item.strftime(PUBLISH_DATE_FORMAT) for item in publish_datetimes]
     else:
-        publish_datetimes = 0
+        publish_dates = [0 for _ in range(len(files))]
+    tasks = []
     for index, file in enumerate(files):
         for cookie in account_file:
-            # 打印视频文件名、标题和 hashtag
-            print(f"视频文件名：{file}")
-            print(f"标题：{title}")
-            print(f"Hashtag：{tags}")
-            app = XiaoHongShuVideo(title, file, tags, publish_datetimes, cookie)
-            asyncio.run(app.main(), debug=False)
+            tasks.append({
+                "platform": platform,
+                "title": title,
+                "tags": tags or [],
+                "file": file,
+                "account": cookie,
+                "publish_date": publish_dates[index],
+                "category": category,
+                "thumbnail": thumbnail_path or '',
+                "product_link": productLink or '',
+                "product_title": productTitle or '',
+                "is_ai_content": is_ai_content,
+                "media": media_info.get(file),
+            })
+    return tasks
+
+
+def create_uploader(task):
+    """根据任务内容构造对应平台的上传器实例。"""
+    platform = task["platform"]
+    file = str(Path(BASE_DIR / "videoFile" / task["file"]))
+    cookie = Path(BASE_DIR / "cookiesFile" / task["account"])
+    publish_date = task.get("publish_date") or 0
+    if publish_date:
+        publish_date = datetime.strptime(publish_date, PUBLISH_DATE_FORMAT)
+    title = task.get("title")
+    tags = task.get("tags") or []
+    if platform == 1:
+        return XiaoHongShuVideo(title, file, tags, publish_date, cookie)
+    if platform == 2:
+        return TencentVideo(title, file, tags, publish_date, cookie, task.get("category"))
+    if platform == 3:
+        return DouYinVideo(title, file, tags, publish_date, cookie, task.get("thumbnail"),
+                           task.get("product_link", ''), task.get("product_title", ''))
+    if platform == 4:
+        return KSVideo(title, file, tags, publish_date, cookie)
+    if platform == 5:
+        return TiktokVideo(title, file, tags, publish_date, cookie, task.get("thumbnail"),
+                           is_ai_content=task.get("is_ai_content"))
+    raise ValueError(f"不支持的平台类型: {platform}")
+
+
+async def run_publish_task(task):
+    message = f"[+] {PLATFORM_NAMES.get(task['platform'])} 发布 {task['file']}，标题：{task.get('title')}，Hashtag：{task.get('tags')}"
+    media = task.get("media")
+    if media:
+        message += (f"，视频信息：{media.get('width')}x{media.get('height')} {media.get('duration')}s "
+                    f"{media.get('video_codec')}/{media.get('audio_codec')}")
+    job_logger.info(message)
+    app = create_uploader(task)
+    # 防重复发布：上次执行已点击发布但未确认结果时，实现了 is_published 的上传器（目前只有抖音）先核对作品列表，
+    # 其他平台直接失败交给人工确认；点击发布之前的检查点不影响重跑，任务从头执行
+    if checkpoint_reached(task.get("resume_checkpoint"), PHASE_PUBLISH_CLICKED):
+        if not hasattr(app, "is_published"):
+            raise RuntimeError("上次执行已点击发布但未确认结果，为避免重复发布请到平台确认后重新提交")
+        app.verify_before_publish = True
+        app.resume_detail = task.get("resume_detail")
+    await app.main()
+
+
+class PublishDispatcher(object):
+    """
+    在同一个事件循环内并发执行发布任务。
+    同一平台同时运行的任务数受 platform_limits 限制，同一账号同时运行的任务数受 account_limit 限制，
+    先占账号再占平台，避免排队等账号的任务白白占用平台名额。
+    """
+
+    def __init__(self, platform_limits=None, account_limit=None, default_platform_limit=None):
+        self.platform_limits = dict(PUBLISH_CONCURRENCY.get("platforms") or {})
+        self.platform_limits.update(platform_limits or {})
+        if default_platform_limit is None:
+            default_platform_limit = PUBLISH_CONCURRENCY.get("default_platform", 2)
+        self.default_platform_limit = max(1, int(default_platform_limit))
+        if account_limit is None:
+            account_limit = PUBLISH_CONCURRENCY.get("per_account", 1)
+        self.account_limit = max(1, int(account_limit))
+        self._platform_semaphores = {}
+        self._account_semaphores = {}
+
+    def platform_limit(self, platform) -> int:
+        limit = self.platform_limits.get(platform, self.platform_limits.get(str(platform), self.default_platform_limit))
+        return max(1, int(limit))
+
+    def _platform_semaphore(self, platform):
+        semaphore = self._platform_semaphores.get(platform)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.platform_limit(platform))
+            self._platform_semaphores[platform] = semaphore
+        return semaphore
+
+    def _account_semaphore(self, account):
+        semaphore = self._account_semaphores.get(account)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.account_limit)
+            self._account_semaphores[account] = semaphore
+        return semaphore
+
+    async def run_task(self, task):
+        report_progress(PHASE_WAITING)
+        async with self._account_semaphore(task["account"]):
+            async with self._platform_semaphore(task["platform"]):
+                report_progress(PHASE_RUNNING)
+                await run_publish_task(task)
 
+    async def prewarm_jobs(self, jobs):
+        """
+        为即将执行的排队任务预热上传页，暂不支持预热的平台（未提供 upload_url）直接跳过。
+        headless 与浏览器路径取自上传器自身的设置，与上传时借用的浏览器池键一致，预热的页面才会被取用。
+        """
+        pool = get_browser_pool()
+        for job in jobs:
+            uploader = create_uploader(job["payload"])
+            upload_url = getattr(uploader, "upload_url", None)
+            if not upload_url:
+                continue
+            await pool.prewarm(uploader.account_file, upload_url, headless=uploader.headless,
+                               executable_path=uploader.local_executable_path,
+                               **getattr(uploader, "context_options", {}))
 
+    async def run_job(self, job):
+        """供后台发布循环调用，执行队列中的单个任务；中断后重新排队的任务带上已到达的检查点。"""
+        task = dict(job["payload"])
+        if job.get("checkpoint"):
+            task["resume_checkpoint"] = job["checkpoint"]
+            task["resume_detail"] = job.get("checkpoint_detail")
+        await self.run_task(task)
 
-# post_video("333",["demo.mp4"],"d","d")
-# post_video_DouYin("333",["demo.mp4"],"d","d")
+    async def run(self, tasks):
+        results = await asyncio.gather(*(self.run_task(task) for task in tasks), return_exceptions=True)
+        for task, result in zip(tasks, results):
+            if isinstance(result, BaseException):
+                job_logger.error(f"[-] {PLATFORM_NAMES.get(task['platform'])} 发布失败 "
+                                 f"{task['file']} -> {task['account']}: {result}")
+        return results
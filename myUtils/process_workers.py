@@ -0,0 +1,270 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional
+
+from myUtils.job_queue import JobQueue, LeaseKeeper, saturated_slots
+from myUtils.postVideo import PublishDispatcher
+from utils.browser_pool import use_browser_pool
+from utils.log import job_logger
+from utils.progress import set_progress_reporter, reset_progress_reporter
+
+# 工作进程 -> 主进程的事件类型
+EVENT_PROGRESS = "progress"
+EVENT_DONE = "done"
+EVENT_FAILED = "failed"
+# 主进程 -> 工作进程：durable 进度已写入（或写入失败）的确认，经派发任务的管道发送
+EVENT_ACK = "ack"
+
+
+def _worker_main(job_conn, event_conn):
+    """工作进程入口：运行独立的事件循环，逐个执行主进程派发的任务。"""
+    try:
+        asyncio.run(_worker_serve(job_conn, event_conn))
+    except (KeyboardInterrupt, EOFError):
+        pass
+
+
+def _make_reporter(job_id, job_conn, event_conn):
+    """
+    工作进程的进度回调：进度经 event_conn 发给主进程写库。durable 时返回的协程等待主进程经 job_conn 回复确认，
+    执行任务期间 job_conn 上不会有新任务，只会收到确认。
+    """
+
+    async def _wait_ack():
+        reply = await asyncio.to_thread(job_conn.recv)
+        if not isinstance(reply, tuple) or reply[0] != EVENT_ACK:
+            raise RuntimeError("未收到主进程的进度写入确认")
+        if reply[1]:
+            raise RuntimeError(f"进度写入失败: {reply[1]}")
+
+    def _reporter(phase, detail=None, durable=False):
+        event_conn.send((EVENT_PROGRESS, job_id, phase, detail, durable))
+        if durable:
+            return _wait_ack()
+        return None
+
+    return _reporter
+
+
+async def _worker_serve(job_conn, event_conn):
+    dispatcher = PublishDispatcher()
+    # 浏览器池在进程生命周期内一直保持，连续的任务复用同一个浏览器
+    async with use_browser_pool():
+        while True:
+            try:
+                job = await asyncio.to_thread(job_conn.recv)
+            except EOFError:
+                return
+            if job is None:
+                return
+            token = set_progress_reporter(_make_reporter(job["id"], job_conn, event_conn))
+            job_id = job["id"]
+            try:
+                await dispatcher.run_job(job)
+            except Exception as exc:
+                event_conn.send((EVENT_FAILED, job_id, str(exc) or exc.__class__.__name__))
+            else:
+                event_conn.send((EVENT_DONE, job_id, None))
+            finally:
+                reset_progress_reporter(token)
+
+
+class _WorkerProcess(object):
+    """一个工作进程及与其通信的两条单向管道：job_conn 派发任务，event_conn 接收进度与结果。"""
+
+    def __init__(self, mp_context, index: int):
+        self.index = index
+        job_recv, self.job_conn = mp_context.Pipe(duplex=False)
+        self.event_conn, event_send = mp_context.Pipe(duplex=False)
+        self.process = mp_context.Process(target=_worker_main, args=(job_recv, event_send),
+                                          name=f"publish-worker-{index}", daemon=True)
+        self.process.start()
+        # 子进程已持有这两端，主进程关闭自己的副本，子进程退出时 event_conn 才能读到 EOF
+        job_recv.close()
+        event_send.close()
+        self.job: Optional[Dict] = None
+        self.started_at = 0.0
+
+    def dispatch(self, job: Dict):
+        self.job = job
+        self.started_at = time.monotonic()
+        self.job_conn.send(job)
+
+    def stop(self, timeout: float = 5.0):
+        try:
+            self.job_conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self._close_conns()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self._close_conns()
+
+    def _close_conns(self):
+        for conn in (self.job_conn, self.event_conn):
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class ProcessWorkerPool(object):
+    """
+    多进程发布模式：每个工作进程各自运行事件循环与浏览器，一次执行一个任务，
+    通过管道把阶段进度和结果回报给主进程，由主进程写回 JobQueue。
+    上传器崩溃或卡死只会影响所在的工作进程：进程退出的任务记为失败，超过 job_timeout 的任务连同进程一起终止，
+    随后补起新的工作进程，API 进程不受影响。平台/账号并发上限由主进程在派发时统一控制。
+    传入 lease（LeaseKeeper）时以租约方式领取任务，用于 sau_worker 多节点部署。
+    """
+
+    def __init__(self, job_queue: JobQueue, processes: int = 2, poll_interval: float = 1.0,
+                 job_timeout: Optional[float] = None, dispatcher: Optional[PublishDispatcher] = None,
+                 lease: Optional[LeaseKeeper] = None):
+        self.job_queue = job_queue
+        self.lease = lease
+        self.processes = max(1, int(processes))
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        # 仅用于读取平台/账号并发上限，任务在工作进程里执行
+        self.limits = dispatcher or PublishDispatcher()
+        # spawn 启动的子进程不会继承主进程的线程与事件循环，与 Windows 行为一致
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._workers: List[_WorkerProcess] = []
+        self._next_index = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._supervise, name="publish-supervisor", daemon=True)
+        self._thread.start()
+        job_logger.info(f"[+] 多进程发布模式已启动，工作进程数 {self.processes}")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _spawn(self) -> _WorkerProcess:
+        self._next_index += 1
+        return _WorkerProcess(self._mp_context, self._next_index)
+
+    def _supervise(self):
+        self._workers = [self._spawn() for _ in range(self.processes)]
+        try:
+            while not self._stop_event.is_set():
+                if self.lease is not None:
+                    self.lease.tick([worker.job["id"] for worker in self._workers if worker.job is not None])
+                self._check_workers()
+                self._dispatch_jobs()
+                busy = [worker for worker in self._workers if worker.job is not None]
+                if not busy:
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                for conn in wait([worker.event_conn for worker in busy], timeout=self.poll_interval):
+                    worker = next(worker for worker in busy if worker.event_conn is conn)
+                    self._read_events(worker)
+        finally:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+
+    def _check_workers(self):
+        """补起已退出的工作进程，终止执行超时的任务。"""
+        for index, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                if worker.job is None or not self.job_timeout:
+                    continue
+                if time.monotonic() - worker.started_at < self.job_timeout:
+                    continue
+                job_logger.error(f"[-] 任务 {worker.job['id']} 超过 {self.job_timeout}s 未完成，终止工作进程")
+                worker.kill()
+                self._interrupt(worker.job, f"任务执行超时（{self.job_timeout}s），已终止")
+            else:
+                if worker.job is not None:
+                    job_logger.error(f"[-] 工作进程 {worker.process.name} 异常退出，exitcode={worker.process.exitcode}")
+                    self._interrupt(worker.job, f"工作进程异常退出（exitcode={worker.process.exitcode}）")
+                worker.kill()
+            self._workers[index] = self._spawn()
+
+    def _dispatch_jobs(self):
+        idle = [worker for worker in self._workers if worker.job is None]
+        while idle:
+            running = [worker.job for worker in self._workers if worker.job is not None]
+            full_platforms, full_accounts = saturated_slots(running, self.limits)
+            claim_kwargs = self.lease.claim_kwargs() if self.lease is not None else {}
+            try:
+                job = self.job_queue.claim(exclude_platforms=full_platforms, exclude_accounts=full_accounts,
+                                           **claim_kwargs)
+            except Exception as exc:
+                job_logger.error(f"[-] 领取任务失败: {exc}")
+                return
+            if job is None:
+                return
+            worker = idle.pop()
+            job_logger.info(f"[+] 任务 {job['id']} 派发到 {worker.process.name}: "
+                            f"{job['file_path']} -> {job['account_file']}")
+            try:
+                worker.dispatch(job)
+            except (OSError, ValueError) as exc:
+                # 管道已断开，进程稍后由 _check_workers 处理，任务记为失败
+                self._fail(job, f"派发到工作进程失败: {exc}")
+                worker.job = None
+
+    def _read_events(self, worker: _WorkerProcess):
+        while worker.job is not None:
+            try:
+                if not worker.event_conn.poll():
+                    return
+                event, job_id, *rest = worker.event_conn.recv()
+            except (EOFError, OSError):
+                # 进程已退出，交给 _check_workers
+                return
+            if event == EVENT_PROGRESS:
+                phase, detail, durable = rest
+                job_logger.info(f"[+] 任务 {job_id} 进度: {phase}" + (f" {detail}" if detail else ""))
+                if not durable:
+                    self.job_queue.update_progress(job_id, phase, detail)
+                    continue
+                error = None
+                try:
+                    self.job_queue.update_progress(job_id, phase, detail)
+                except Exception as exc:
+                    error = str(exc) or exc.__class__.__name__
+                try:
+                    worker.job_conn.send((EVENT_ACK, error))
+                except (OSError, ValueError):
+                    # 进程已退出，交给 _check_workers
+                    return
+                continue
+            elapsed = time.monotonic() - worker.started_at
+            if event == EVENT_DONE:
+                job_logger.success(f"[+] 任务 {job_id} 执行完成，耗时 {elapsed:.1f}s")
+                self.job_queue.complete(job_id, worker.job.get("worker_id"))
+            else:
+                job_logger.error(f"[-] 任务 {job_id} 执行失败: {rest[0]}")
+                self.job_queue.fail(job_id, rest[0], worker.job.get("worker_id"))
+            worker.job = None
+
+    def _interrupt(self, job: Dict, reason: str):
+        """工作进程崩溃或超时：按检查点重新排队或确认，避免浪费已完成的上传或重复发布。"""
+        try:
+            self.job_queue.interrupt(job["id"], reason)
+        except Exception as exc:
+            job_logger.error(f"[-] 处理中断任务 {job['id']} 出错: {exc}")
+
+    def _fail(self, job: Dict, error: str):
+        try:
+            self.job_queue.fail(job["id"], error, job.get("worker_id"))
+        except Exception as exc:
+            job_logger.error(f"[-] 记录任务 {job['id']} 失败状态出错: {exc}")
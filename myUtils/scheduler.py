@@ -0,0 +1,107 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from conf import SCHEDULER_SETTINGS
+except ImportError:
+    SCHEDULER_SETTINGS = {}
+
+# 优先级通道：数值越小越先执行
+PRIORITY_NOW = 0
+PRIORITY_SCHEDULED = 1
+
+
+def task_priority(task: Dict) -> int:
+    """立即发布的任务走高优先级通道，定时发布（平台侧定时）的任务排在其后；任务可通过 priority 显式指定。"""
+    if task.get("priority") is not None:
+        return int(task["priority"])
+    return PRIORITY_SCHEDULED if task.get("publish_date") else PRIORITY_NOW
+
+
+class SchedulePolicy(object):
+    """
+    任务领取的公平调度策略，所有计数都来自数据库（publish_jobs 与 account_claims），
+    服务重启后依然有效，多个 worker / 节点共享同一套限制：
+    - platform_limits：每个平台同时运行的任务数上限（未配置的平台使用 default_platform_limit，0 表示不限）
+    - account_limit：每个账号同时运行的任务数上限
+    - account_min_gap：同一账号两次开始发布之间的最小间隔（秒）
+    - daily_quota：每个账号在 quota_window 秒滑动窗口内最多开始的任务数（按平台配置，0 表示不限）
+    同一优先级通道内，优先领取最久未发布过的账号的任务，避免连续压在同一个账号上。
+    """
+
+    def __init__(self, platform_limits: Optional[Dict] = None, default_platform_limit: Optional[int] = None,
+                 account_limit: Optional[int] = None, account_min_gap: Optional[float] = None,
+                 daily_quota: Optional[Dict] = None, quota_window: Optional[float] = None):
+        settings = SCHEDULER_SETTINGS
+        self.platform_limits = dict(settings.get("platform_limits") or {})
+        self.platform_limits.update(platform_limits or {})
+        if default_platform_limit is None:
+            default_platform_limit = settings.get("default_platform_limit", 0)
+        self.default_platform_limit = int(default_platform_limit or 0)
+        if account_limit is None:
+            account_limit = settings.get("account_limit", 1)
+        self.account_limit = int(account_limit or 0)
+        if account_min_gap is None:
+            account_min_gap = settings.get("account_min_gap_seconds", 0)
+        self.account_min_gap = float(account_min_gap or 0)
+        quota = dict(settings.get("daily_quota") or {})
+        quota.update(daily_quota or {})
+        self.default_quota = int(quota.get("default", 0) or 0)
+        self.platform_quotas = dict(quota.get("platforms") or {})
+        if quota_window is None:
+            quota_window = settings.get("quota_window_seconds", 86400)
+        self.quota_window = float(quota_window)
+
+    def platform_limit(self, platform) -> int:
+        return int(self.platform_limits.get(platform, self.platform_limits.get(str(platform),
+                                                                               self.default_platform_limit)) or 0)
+
+    def quota(self, platform) -> int:
+        return int(self.platform_quotas.get(platform, self.platform_quotas.get(str(platform),
+                                                                               self.default_quota)) or 0)
+
+    @property
+    def history_window(self) -> float:
+        """account_claims 需要保留的时长。"""
+        return max(self.quota_window, self.account_min_gap)
+
+    def blocked(self, conn, now: Optional[float] = None) -> Tuple[List[int], List[str]]:
+        """
+        根据当前运行中的任务和领取记录，返回本次领取需要跳过的 (平台列表, 账号列表)。
+        conn 为已开启事务的 sqlite 连接。
+        """
+        now = time.time() if now is None else now
+        blocked_platforms = set()
+        blocked_accounts = set()
+
+        platform_running = {}
+        account_running = {}
+        for row in conn.execute(
+                "SELECT platform, account_file, COUNT(*) AS total FROM publish_jobs "
+                "WHERE status = 'running' GROUP BY platform, account_file"):
+            platform_running[row["platform"]] = platform_running.get(row["platform"], 0) + row["total"]
+            account_running[row["account_file"]] = account_running.get(row["account_file"], 0) + row["total"]
+        for platform, total in platform_running.items():
+            limit = self.platform_limit(platform)
+            if limit and total >= limit:
+                blocked_platforms.add(platform)
+        if self.account_limit:
+            blocked_accounts.update(account for account, total in account_running.items()
+                                    if total >= self.account_limit)
+
+        if self.account_min_gap or self.default_quota or self.platform_quotas:
+            for row in conn.execute(
+                    """
+                    SELECT account_file, platform, MAX(claimed_at) AS last_claimed,
+                           SUM(CASE WHEN claimed_at >= ? THEN 1 ELSE 0 END) AS in_window
+                    FROM account_claims WHERE claimed_at >= ?
+                    GROUP BY account_file, platform
+                    """,
+                    (now - self.quota_window, now - self.history_window)):
+                if self.account_min_gap and now - row["last_claimed"] < self.account_min_gap:
+                    blocked_accounts.add(row["account_file"])
+                    continue
+                quota = self.quota(row["platform"])
+                if quota and row["in_window"] >= quota:
+                    blocked_accounts.add(row["account_file"])
+        return list(blocked_platforms), list(blocked_accounts)
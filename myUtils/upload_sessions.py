@@ -0,0 +1,375 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from conf import BASE_DIR
+from myUtils.ingest import hash_file
+from utils.log import upload_logger
+
+try:
+    from conf import UPLOAD_SETTINGS
+except ImportError:
+    UPLOAD_SETTINGS = {}
+
+SESSION_OPEN = "open"
+SESSION_COMPLETE = "complete"
+
+PART_SUFFIX = ".part"
+
+
+class UploadError(ValueError):
+    """分片上传请求不合法，status 为对应的 HTTP 状态码，data 为需要返回给客户端的数据（如当前已提交的偏移量）。"""
+
+    def __init__(self, message: str, status: int = 400, data: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.data = data
+
+
+def safe_filename(filename) -> str:
+    """只保留文件名部分，去掉路径分隔符，避免写到 videoFile 之外。"""
+    name = os.path.basename(str(filename or "").replace("\\", "/")).strip()
+    if not name or name in (".", ".."):
+        raise UploadError("文件名不合法")
+    return name
+
+
+def insert_file_record(conn, filename: str, file_path: str, size_bytes: int, sha256: Optional[str] = None) -> int:
+    """写入素材库记录（file_records），filesize 与 /uploadSave 一致以 MB 为单位，返回记录 id。"""
+    cursor = conn.execute(
+        "INSERT INTO file_records (filename, filesize, file_path, sha256) VALUES (?, ?, ?, ?)",
+        (filename, round(float(size_bytes) / (1024 * 1024), 2), file_path, sha256),
+    )
+    return cursor.lastrowid
+
+
+def normalize_sha256(value) -> str:
+    """客户端提供的 SHA-256：64 位十六进制，统一为小写。"""
+    value = str(value or "").strip().lower()
+    if len(value) != 64 or any(ch not in "0123456789abcdef" for ch in value):
+        raise UploadError("sha256 必须是 64 位十六进制字符串")
+    return value
+
+
+def find_file_by_sha256(conn, sha256: str, video_dir=None) -> Optional[str]:
+    """素材库中内容相同、文件仍然存在的记录的 file_path，没有时返回 None。"""
+    video_dir = Path(video_dir or BASE_DIR / "videoFile")
+    rows = conn.execute("SELECT file_path FROM file_records WHERE sha256 = ? ORDER BY id", (sha256,)).fetchall()
+    for (file_path,) in rows:
+        if file_path and (video_dir / file_path).is_file():
+            return file_path
+    return None
+
+
+def record_upload(conn, filename: str, file_path: str, size_bytes: int, sha256: Optional[str], video_dir=None) -> Dict:
+    """
+    把刚保存到 videoFile 的文件记入素材库，按内容去重：已有相同 SHA-256 的文件时删除新文件，
+    新记录直接引用已有文件（多条 file_records 共用一个 file_path）。返回 {id, filename, filepath, size, sha256, deduplicated}。
+    """
+    video_dir = Path(video_dir or BASE_DIR / "videoFile")
+    existing = None
+    if sha256 and UPLOAD_SETTINGS.get("dedup", True):
+        existing = find_file_by_sha256(conn, sha256, video_dir)
+    deduplicated = existing is not None and existing != file_path
+    if deduplicated:
+        (video_dir / file_path).unlink(missing_ok=True)
+        upload_logger.info(f"[+] {file_path} 与已有文件 {existing} 内容相同，改为引用已有文件")
+        file_path = existing
+    record_id = insert_file_record(conn, filename, file_path, size_bytes, sha256)
+    return {"id": record_id, "filename": filename, "filepath": file_path, "size": size_bytes,
+            "sha256": sha256, "deduplicated": deduplicated}
+
+
+def link_existing(conn, sha256: str, filename: str, size_bytes: Optional[int] = None, video_dir=None) -> Optional[Dict]:
+    """
+    秒传：素材库已有该内容时直接新增一条引用已有文件的记录，返回值同 record_upload；没有时返回 None。
+    客户端同时给出 size 时要求与已有文件大小一致。
+    """
+    if not UPLOAD_SETTINGS.get("dedup", True):
+        return None
+    video_dir = Path(video_dir or BASE_DIR / "videoFile")
+    file_path = find_file_by_sha256(conn, sha256, video_dir)
+    if file_path is None:
+        return None
+    size = (video_dir / file_path).stat().st_size
+    if size_bytes is not None and size_bytes != size:
+        return None
+    record_id = insert_file_record(conn, filename, file_path, size, sha256)
+    return {"id": record_id, "filename": filename, "filepath": file_path, "size": size,
+            "sha256": sha256, "deduplicated": True}
+
+
+def release_file(conn, file_path: str, video_dir=None) -> bool:
+    """删除素材记录之后调用：已没有记录引用该文件时删除文件，返回是否删除了文件。"""
+    if not file_path or conn.execute("SELECT 1 FROM file_records WHERE file_path = ? LIMIT 1", (file_path,)).fetchone():
+        return False
+    path = Path(video_dir or BASE_DIR / "videoFile") / file_path
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class UploadSessionStore(object):
+    """
+    可续传的分片上传（素材库大文件）：
+    1. create 创建会话，分片直接写入 videoFile/<uuid>_<文件名>.part；
+    2. write_chunk 从请求体流式写入指定偏移量，偏移量必须等于已提交的偏移量，否则返回 409 与当前偏移量；
+       连接中途断开时已收到的字节照常提交，客户端查询偏移量后从断点继续，不需要重发；
+    3. get 查询已提交的偏移量；
+    4. complete 校验大小后改名为最终文件并写入 file_records，内容与已有文件相同时改为引用已有文件。
+    每累计 fsync_bytes 字节才 fsync 一次，完成时再 fsync；断电后查询到的偏移量取数据库记录与文件实际大小的较小值。
+    单个分片受 MAX_CONTENT_LENGTH 与 max_chunk_bytes 限制，整个文件大小不设上限。
+    """
+
+    def __init__(self, db_path, video_dir=None):
+        settings = UPLOAD_SETTINGS
+        self.db_path = Path(db_path)
+        self.video_dir = Path(video_dir or BASE_DIR / "videoFile")
+        self.buffer_bytes = int(settings.get("buffer_bytes", 1024 * 1024))
+        self.fsync_bytes = int(settings.get("fsync_bytes", 64 * 1024 * 1024))
+        self.max_chunk_bytes = int(settings.get("max_chunk_bytes", 64 * 1024 * 1024))
+        self.session_ttl = float(settings.get("session_ttl_hours", 72)) * 3600
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    total_size INTEGER,
+                    committed INTEGER NOT NULL DEFAULT 0,
+                    synced INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'open',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _lock(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(session_id, threading.Lock())
+
+    def _part_path(self, row) -> Path:
+        return self.video_dir / (row["file_path"] + PART_SUFFIX)
+
+    def _row(self, conn, session_id: str):
+        row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            raise UploadError("上传会话不存在或已过期", 404)
+        return row
+
+    def _describe(self, row, committed: Optional[int] = None) -> Dict:
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "filepath": row["file_path"],
+            "size": row["total_size"],
+            "offset": row["committed"] if committed is None else committed,
+            "status": row["status"],
+        }
+
+    def create(self, filename: str, total_size: Optional[int] = None) -> Dict:
+        filename = safe_filename(filename)
+        if total_size is not None and (not isinstance(total_size, int) or total_size < 0):
+            raise UploadError("size 必须是非负整数")
+        self.prune()
+        session_id = uuid.uuid4().hex
+        file_path = f"{uuid.uuid1()}_{filename}"
+        self.video_dir.mkdir(parents=True, exist_ok=True)
+        (self.video_dir / (file_path + PART_SUFFIX)).touch()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO upload_sessions (id, filename, file_path, total_size, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, filename, file_path, total_size, now, now),
+            )
+            row = self._row(conn, session_id)
+        upload_logger.info(f"[+] 创建上传会话 {session_id}: {filename} size={total_size}")
+        return self._describe(row)
+
+    def get(self, session_id: str) -> Dict:
+        with self._connect() as conn:
+            row = self._row(conn, session_id)
+        if row["status"] != SESSION_OPEN:
+            return self._describe(row)
+        return self._describe(row, self._durable_offset(row))
+
+    def _durable_offset(self, row) -> int:
+        """已提交的偏移量；断电可能丢失最后一次 fsync 之后的数据，以文件实际大小为上限。"""
+        try:
+            size = self._part_path(row).stat().st_size
+        except OSError:
+            size = 0
+        return min(int(row["committed"]), size)
+
+    def write_chunk(self, session_id: str, offset: int, stream: BinaryIO, length: Optional[int] = None) -> Dict:
+        """
+        把 stream 中的数据写到 offset 处，length 为请求体长度（分块传输编码时为 None）。
+        返回写入后的会话信息；读取请求体中途出错时提交已收到的部分后重新抛出异常。
+        """
+        if length is not None and length > self.max_chunk_bytes:
+            raise UploadError(f"单个分片不能超过 {self.max_chunk_bytes} 字节", 413)
+        lock = self._lock(session_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("该会话正在写入其他分片", 409)
+        try:
+            with self._connect() as conn:
+                row = self._row(conn, session_id)
+            if row["status"] != SESSION_OPEN:
+                raise UploadError("上传会话已完成", 409, self._describe(row))
+            committed = self._durable_offset(row)
+            if offset != committed:
+                raise UploadError("偏移量与已提交的偏移量不一致", 409, self._describe(row, committed))
+            total_size = row["total_size"]
+            synced = min(int(row["synced"]), committed)
+            position = committed
+            error = None
+            with open(self._part_path(row), "r+b") as f:
+                # 丢弃上次提交点之后的残留数据（断电或未提交的写入）
+                f.seek(committed)
+                f.truncate()
+                try:
+                    while True:
+                        limit = self.buffer_bytes
+                        if length is not None:
+                            limit = min(limit, committed + length - position)
+                            if limit <= 0:
+                                break
+                        buf = stream.read(limit)
+                        if not buf:
+                            break
+                        if total_size is not None and position + len(buf) > total_size:
+                            raise UploadError("写入的数据超过了声明的文件大小", 400)
+                        if position - committed + len(buf) > self.max_chunk_bytes:
+                            raise UploadError(f"单个分片不能超过 {self.max_chunk_bytes} 字节", 413)
+                        f.write(buf)
+                        position += len(buf)
+                except Exception as exc:
+                    error = exc
+                if isinstance(error, UploadError):
+                    # 本次分片整体作废
+                    f.truncate(committed)
+                    position = committed
+                f.flush()
+                if position - synced >= self.fsync_bytes:
+                    os.fsync(f.fileno())
+                    synced = position
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE upload_sessions SET committed = ?, synced = ?, updated_at = ? WHERE id = ?",
+                    (position, synced, time.time(), session_id),
+                )
+                row = self._row(conn, session_id)
+            if error is not None:
+                raise error
+            return self._describe(row)
+        finally:
+            lock.release()
+
+    def complete(self, session_id: str) -> Dict:
+        """校验大小、fsync 并计算哈希，写入 file_records（按内容去重）后改名为最终文件，返回值同 record_upload。"""
+        lock = self._lock(session_id)
+        with lock:
+            with self._connect() as conn:
+                row = self._row(conn, session_id)
+            if row["status"] != SESSION_OPEN:
+                raise UploadError("上传会话已完成", 409, self._describe(row))
+            committed = self._durable_offset(row)
+            if row["total_size"] is not None and committed != row["total_size"]:
+                raise UploadError("文件尚未上传完整", 409, self._describe(row, committed))
+            part_path = self._part_path(row)
+            with open(part_path, "r+b") as f:
+                f.truncate(committed)
+                os.fsync(f.fileno())
+            # 分片可能跨进程、跨多次请求写入，完成时再统一计算一次哈希
+            _, sha256 = hash_file(part_path, self.buffer_bytes)
+            final_path = self.video_dir / row["file_path"]
+            # 记录与改名在同一事务内：任何一步失败都保留 .part 且会话仍为 open，重试 /uploadComplete 即可完成
+            try:
+                with self._connect() as conn:
+                    record = record_upload(conn, row["filename"], row["file_path"], committed, sha256, self.video_dir)
+                    conn.execute(
+                        "UPDATE upload_sessions SET status = ?, committed = ?, synced = ?, updated_at = ? WHERE id = ?",
+                        (SESSION_COMPLETE, committed, committed, time.time(), session_id),
+                    )
+                    if not record["deduplicated"]:
+                        os.replace(part_path, final_path)
+            except Exception:
+                # 改名后提交失败时把文件放回 .part
+                if final_path.exists() and not part_path.exists():
+                    os.replace(final_path, part_path)
+                raise
+            # 与已有文件内容相同时新记录引用已有文件，上传的 .part 不再需要
+            part_path.unlink(missing_ok=True)
+        with self._locks_guard:
+            self._locks.pop(session_id, None)
+        upload_logger.success(f"[+] 上传会话 {session_id} 完成: {record['filepath']} ({committed} 字节)")
+        return record
+
+    def abort(self, session_id: str) -> bool:
+        with self._lock(session_id):
+            with self._connect() as conn:
+                row = self._row(conn, session_id)
+                conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session_id,))
+            if row["status"] == SESSION_OPEN:
+                self._part_path(row).unlink(missing_ok=True)
+        with self._locks_guard:
+            self._locks.pop(session_id, None)
+        return True
+
+    def prune(self, ttl: Optional[float] = None) -> int:
+        """删除超过 ttl 秒未更新的未完成会话及其 .part 文件，以及已完成会话的记录。"""
+        ttl = self.session_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return 0
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM upload_sessions WHERE updated_at < ?", (time.time() - ttl,)).fetchall()
+            for row in rows:
+                if row["status"] == SESSION_OPEN:
+                    self._part_path(row).unlink(missing_ok=True)
+                conn.execute("DELETE FROM upload_sessions WHERE id = ?", (row["id"],))
+        return len(rows)
+
+
+def backfill_sha256(db_path, video_dir=None) -> int:
+    """
+    为历史素材（没有 sha256 的记录）补算哈希，之后上传的相同内容即可去重；
+    只补哈希，不合并已有的重复文件（排队中的发布任务可能正引用它们）。返回补算的记录数。
+    """
+    video_dir = Path(video_dir or BASE_DIR / "videoFile")
+    with sqlite3.connect(db_path, timeout=30) as conn:
+        rows = conn.execute("SELECT DISTINCT file_path FROM file_records WHERE sha256 IS NULL").fetchall()
+    updated = 0
+    for (file_path,) in rows:
+        path = video_dir / (file_path or "")
+        if not file_path or not path.is_file():
+            continue
+        try:
+            _, sha256 = hash_file(path)
+        except OSError as exc:
+            upload_logger.warning(f"[-] 计算 {file_path} 的哈希失败: {exc}")
+            continue
+        with sqlite3.connect(db_path, timeout=30) as conn:
+            updated += conn.execute(
+                "UPDATE file_records SET sha256 = ? WHERE file_path = ? AND sha256 IS NULL", (sha256, file_path)
+            ).rowcount
+    if updated:
+        upload_logger.info(f"[+] 已为 {updated} 条历史素材补算 SHA-256")
+    return updated
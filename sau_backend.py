@@ -1,4 +1,6 @@
 import asyncio
+import json
+import multiprocessing
 import os
 import sqlite3
 import threading
@@ -7,12 +9,46 @@ import uuid
 from pathlib import Path
 from queue import Queue
 from flask_cors import CORS
-from myUtils.auth import check_cookie
-from flask import Flask, request, jsonify, Response, send_from_directory
+from myUtils.auth import check_cookies, iter_check_cookies
+from flask import Flask, request, jsonify, Response, send_from_directory, stream_with_context
+from werkzeug.security import safe_join
 from conf import BASE_DIR
 from myUtils.ai_client import AIServiceError, generate_ai_content
 from myUtils.login import get_tencent_cookie, douyin_cookie_gen, get_ks_cookie, xiaohongshu_cookie_gen, tiktok_cookie_gen
-from myUtils.postVideo import post_video_tencent, post_video_DouYin, post_video_ks, post_video_xhs, post_video_tiktok
+from myUtils.account_status import AccountStatusStore, AccountRefresher
+from myUtils.job_queue import JobQueue, PublishWorkerPool, JOB_STATUSES
+from myUtils.keepalive import SessionKeeper
+from myUtils.process_workers import ProcessWorkerPool
+from myUtils.upload_sessions import (UploadSessionStore, UploadError, backfill_sha256, find_file_by_sha256, link_existing,
+                                    normalize_sha256, record_upload, release_file, safe_filename)
+from myUtils.file_serving import send_library_file
+from myUtils.media_info import MEDIA_ERROR, MediaInfoStore, MediaProber
+from myUtils.ingest import IngestFile, IngestRequest, hash_file, ingest_stream, prune_ingest_files
+from utils.browser_pool import use_browser_pool, prune_profiles, remove_profile
+from utils.cookie_store import get_cookie_store
+from utils.resource_policy import get_routing_stats
+from utils.storage_state import get_compaction_stats
+from myUtils.postVideo import build_publish_tasks, PublishDispatcher
+
+try:
+    from conf import PUBLISH_QUEUE_SETTINGS
+except ImportError:
+    PUBLISH_QUEUE_SETTINGS = {}
+
+try:
+    from conf import PREWARM_SETTINGS
+except ImportError:
+    PREWARM_SETTINGS = {}
+
+try:
+    from conf import ACCOUNT_CHECK_SETTINGS
+except ImportError:
+    ACCOUNT_CHECK_SETTINGS = {}
+
+try:
+    from conf import KEEPALIVE_SETTINGS
+except ImportError:
+    KEEPALIVE_SETTINGS = {}
 
 active_queues = {}
 
@@ -46,6 +82,11 @@ def _ensure_database():
             )
             """
         )
+        # 旧版本创建的 file_records 补齐内容哈希字段
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(file_records)")}
+        if "sha256" not in columns:
+            cursor.execute("ALTER TABLE file_records ADD COLUMN sha256 TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_records_sha256 ON file_records (sha256)")
         conn.commit()
 
 
@@ -59,12 +100,105 @@ def _to_bool(value):
         return value.strip().lower() in {"1", "true", "yes", "on"}
     return False
 app = Flask(__name__)
+# /upload 与 /uploadSave 的文件在解析请求时直接写入 videoFile，避免 Werkzeug 临时文件再复制一次
+IngestRequest.ingest_endpoints = frozenset({"upload_file", "upload_save"})
+app.request_class = IngestRequest
 
 #允许所有来源跨域访问
 CORS(app)
 
 _ensure_database()
 
+# 发布任务队列：/postVideo 只负责入队，由后台发布循环执行
+job_queue = JobQueue(_get_db_path())
+job_queue.ensure_schema()
+
+# 账号有效性缓存：/getValidAccounts 直接读取，由后台线程按 TTL 刷新
+account_store = AccountStatusStore(_get_db_path())
+account_store.ensure_schema()
+account_store.index_expiry()
+
+# 素材库分片续传会话
+upload_sessions = UploadSessionStore(_get_db_path())
+upload_sessions.ensure_schema()
+
+# 素材元数据（时长、分辨率、编码等）：入库后由后台线程运行 ffprobe，按内容哈希缓存
+media_store = MediaInfoStore(_get_db_path())
+media_store.ensure_schema()
+media_prober = MediaProber(media_store)
+
+
+def _backfill_library():
+    backfill_sha256(_get_db_path())
+    media_prober.scan()
+
+
+def _start_background_workers():
+    interrupted_jobs = job_queue.recover_interrupted()
+    if interrupted_jobs:
+        print(f"⚠️ {interrupted_jobs} 个发布任务因服务重启中断，已按检查点重新排队或确认")
+    mode = PUBLISH_QUEUE_SETTINGS.get("mode")
+    if mode == "external":
+        # 由独立部署的 sau_worker 节点执行任务，API 只负责入队
+        workers = None
+    elif mode == "process":
+        # 多进程模式：每个工作进程独立运行事件循环和浏览器，上传器崩溃或卡死不影响 API 进程
+        workers = ProcessWorkerPool(
+            job_queue,
+            processes=PUBLISH_QUEUE_SETTINGS.get("workers", 2),
+            poll_interval=PUBLISH_QUEUE_SETTINGS.get("poll_interval", 1.0),
+            job_timeout=PUBLISH_QUEUE_SETTINGS.get("job_timeout"),
+        )
+    else:
+        # 线程模式：在同一个事件循环内并发执行
+        dispatcher = PublishDispatcher()
+        workers = PublishWorkerPool(
+            job_queue,
+            dispatcher.run_job,
+            max_jobs=PUBLISH_QUEUE_SETTINGS.get("workers", 2),
+            poll_interval=PUBLISH_QUEUE_SETTINGS.get("poll_interval", 1.0),
+            lifespan=use_browser_pool,
+            prefetch=dispatcher.prewarm_jobs,
+            lookahead=PREWARM_SETTINGS.get("lookahead", 1),
+            limits=dispatcher,
+        )
+    if workers is not None:
+        workers.start()
+
+    # 清理已删除账号或长期未使用账号的浏览器 profile
+    with sqlite3.connect(_get_db_path()) as conn:
+        prune_profiles([row[0] for row in conn.execute("SELECT filePath FROM user_info")])
+    # 清理上传中途中断遗留的临时文件
+    prune_ingest_files()
+    # 为历史素材补算内容哈希（之后上传的相同内容即可去重），再解析尚无元数据的素材
+    media_prober.start()
+    threading.Thread(target=_backfill_library, name="library-backfill", daemon=True).start()
+    # 压缩历史 cookie 中累积的过期 cookie 与无关 localStorage（逐个账号在锁内经 cookie 存储写回）
+    threading.Thread(target=get_cookie_store().compact_all, name="storage-compactor", daemon=True).start()
+    return workers
+
+
+def _start_account_refresher():
+    if not ACCOUNT_CHECK_SETTINGS.get("enabled", True):
+        return None
+    refresher = AccountRefresher(account_store, check_cookies)
+    refresher.start()
+    return refresher
+
+
+def _start_session_keeper():
+    if not KEEPALIVE_SETTINGS.get("enabled", True):
+        return None
+    keeper = SessionKeeper(account_store)
+    keeper.start()
+    return keeper
+
+
+# 多进程模式下工作进程以 spawn 方式启动，会重新导入本模块，只在主进程中启动后台任务
+publish_workers = _start_background_workers() if multiprocessing.parent_process() is None else None
+account_refresher = _start_account_refresher() if multiprocessing.parent_process() is None else None
+session_keeper = _start_session_keeper() if multiprocessing.parent_process() is None else None
+
 # 限制上传文件大小为160MB
 app.config['MAX_CONTENT_LENGTH'] = 160 * 1024 * 1024
 
@@ -94,6 +228,18 @@ def healthz():
 def hello_world():
     return jsonify({"code": 200, "msg": "Social Uploader Backend is running"}), 200
 
+def _save_upload(upload, filepath):
+    """
+    保存 multipart 上传的文件，返回 (字节数, SHA-256)。文件部分由 IngestRequest 直接写入 videoFile 时只需改名；
+    否则（例如请求类被替换）退回到复制保存，并补算大小与哈希。
+    """
+    if isinstance(upload.stream, IngestFile):
+        upload.stream.commit(filepath)
+        return upload.stream.size, upload.stream.sha256
+    upload.save(filepath)
+    return hash_file(filepath)
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -114,7 +260,7 @@ def upload_file():
         uuid_v1 = uuid.uuid1()
         print(f"UUID v1: {uuid_v1}")
         filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{file.filename}")
-        file.save(filepath)
+        _save_upload(file, filepath)
         return jsonify({"code":200,"msg": "File uploaded successfully", "data": f"{uuid_v1}_{file.filename}"}), 200
     except Exception as e:
         return jsonify({"code":200,"msg": str(e),"data":None}), 500
@@ -132,35 +278,70 @@ def get_file():
         return {"error": "Invalid filename"}, 400
 
     # 拼接完整路径
-    file_path = str(Path(BASE_DIR / "videoFile"))
+    file_path = safe_join(str(Path(BASE_DIR / "videoFile")), filename)
+    if file_path is None or not os.path.isfile(file_path):
+        return {"error": "File not found"}, 404
+
+    # 素材库记录的内容哈希作为 ETag；/upload 直接上传的文件没有记录时按修改时间与大小生成
+    with sqlite3.connect(_get_db_path()) as conn:
+        row = conn.execute(
+            "SELECT sha256 FROM file_records WHERE file_path = ? AND sha256 IS NOT NULL LIMIT 1", (filename,)
+        ).fetchone()
 
-    # 返回文件
-    return send_from_directory(file_path,filename)
+    # 返回文件（支持 Range 与 304）
+    return send_library_file(file_path, filename, row[0] if row else None)
 
 
 @app.route('/uploadSave', methods=['POST'])
 def upload_save():
-    if 'file' not in request.files:
-        return jsonify({
-            "code": 400,
-            "data": None,
-            "msg": "No file part in the request"
-        }), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({
-            "code": 400,
-            "data": None,
-            "msg": "No selected file"
-        }), 400
-
-    # 获取表单中的自定义文件名（可选）
-    custom_filename = request.form.get('filename', None)
-    if custom_filename:
-        filename = custom_filename + "." + file.filename.split('.')[-1]
+    """
+    上传素材并记入素材库。两种方式：
+    - multipart：字段 file，可选字段 filename 为自定义文件名；
+    - 原始字节：请求体即文件内容，?filename= 为原文件名，可选 ?customName= 为自定义文件名。
+    文件在接收时直接写入 videoFile（见 myUtils/ingest.py），同时计算大小与 SHA-256，保存时只需改名。
+    内容与素材库中已有文件相同时不再保留新文件，新记录引用已有文件。
+    请求头 X-Content-SHA256 给出文件哈希且带 ?filename= 时，素材库已有该内容则不读取请求体直接返回（秒传）；
+    否则接收完成后校验哈希，不一致返回 400。
+    """
+    expected_sha256 = request.headers.get('X-Content-SHA256')
+    if expected_sha256:
+        try:
+            expected_sha256 = normalize_sha256(expected_sha256)
+            filename = safe_filename(request.args.get('filename')) if request.args.get('filename') else None
+        except UploadError as exc:
+            return _upload_error(exc)
+        if filename:
+            hit = _link_existing(expected_sha256, _library_filename(filename, request.args.get('customName')))
+            if hit is not None:
+                return hit
+
+    if request.mimetype != 'multipart/form-data' and request.args.get('filename'):
+        try:
+            original_filename = safe_filename(request.args.get('filename'))
+        except UploadError as exc:
+            return _upload_error(exc)
+        custom_filename = request.args.get('customName')
+        upload = None
     else:
-        filename = file.filename
+        if 'file' not in request.files:
+            return jsonify({
+                "code": 400,
+                "data": None,
+                "msg": "No file part in the request"
+            }), 400
+
+        upload = request.files['file']
+        if upload.filename == '':
+            return jsonify({
+                "code": 400,
+                "data": None,
+                "msg": "No selected file"
+            }), 400
+        original_filename = upload.filename
+        # 获取表单中的自定义文件名（可选）
+        custom_filename = request.form.get('filename', None)
+
+    filename = _library_filename(original_filename, custom_filename)
 
     try:
         # 生成 UUID v1
@@ -171,25 +352,32 @@ def upload_save():
         final_filename = f"{uuid_v1}_{filename}"
         filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{filename}")
 
-        # 保存文件
-        file.save(filepath)
+        # 保存文件：请求体已在接收时写入 videoFile，这里只做改名
+        if upload is None:
+            with ingest_stream(request.stream, request.content_length) as ingested:
+                ingested.commit(filepath)
+            size, sha256 = ingested.size, ingested.sha256
+        else:
+            size, sha256 = _save_upload(upload, filepath)
+
+        if expected_sha256 and sha256 != expected_sha256:
+            filepath.unlink(missing_ok=True)
+            return jsonify({
+                "code": 400,
+                "msg": "文件内容与 X-Content-SHA256 不一致",
+                "data": {"sha256": sha256}
+            }), 400
 
         with sqlite3.connect(_get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                                INSERT INTO file_records (filename, filesize, file_path)
-            VALUES (?, ?, ?)
-                                ''', (filename, round(float(os.path.getsize(filepath)) / (1024 * 1024),2), final_filename))
+            record = record_upload(conn, filename, final_filename, size, sha256)
             conn.commit()
             print("✅ 上传文件已记录")
+        media_prober.submit(record["sha256"], record["filepath"])
 
         return jsonify({
             "code": 200,
             "msg": "File uploaded and saved successfully",
-            "data": {
-                "filename": filename,
-                "filepath": final_filename
-            }
+            "data": record
         }), 200
 
     except Exception as e:
@@ -200,6 +388,140 @@ def upload_save():
         }), 500
 
 
+def _library_filename(original_filename, custom_filename=None):
+    """素材库中显示的文件名：有自定义文件名时沿用原文件的扩展名。"""
+    if custom_filename:
+        return custom_filename + "." + str(original_filename).split('.')[-1]
+    return original_filename
+
+
+def _link_existing(sha256, filename, size=None):
+    """素材库已有该内容时新增引用记录并返回响应，没有时返回 None。"""
+    with sqlite3.connect(_get_db_path()) as conn:
+        record = link_existing(conn, sha256, filename, size)
+        conn.commit()
+    if record is None:
+        return None
+    return jsonify({
+        "code": 200,
+        "msg": "File already exists",
+        "data": record
+    }), 200
+
+
+@app.route('/uploadCheck', methods=['POST'])
+def upload_check():
+    """
+    上传前按内容哈希查询素材库，JSON {sha256, size（可选）, filename（可选）, customName（可选）}。
+    已有该内容且给出了 filename 时直接新增一条引用已有文件的记录（秒传），返回值同 /uploadSave；
+    只查询时返回 {exists, sha256}，不存在时客户端再正常上传。
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        sha256 = normalize_sha256(data.get('sha256'))
+        size = data.get('size')
+        if size is not None and (not isinstance(size, int) or size < 0):
+            raise UploadError("size 必须是非负整数")
+        filename = safe_filename(data.get('filename')) if data.get('filename') else None
+    except UploadError as exc:
+        return _upload_error(exc)
+    _ensure_database()
+    if filename:
+        hit = _link_existing(sha256, _library_filename(filename, data.get('customName')), size)
+        if hit is not None:
+            return hit
+        exists = False
+    else:
+        with sqlite3.connect(_get_db_path()) as conn:
+            file_path = find_file_by_sha256(conn, sha256)
+        exists = file_path is not None and (
+            size is None or Path(BASE_DIR / "videoFile" / file_path).stat().st_size == size)
+    return jsonify({
+        "code": 200,
+        "msg": "success",
+        "data": {"exists": exists, "sha256": sha256}
+    }), 200
+
+
+def _upload_error(exc: UploadError):
+    return jsonify({
+        "code": exc.status,
+        "msg": str(exc),
+        "data": exc.data
+    }), exc.status
+
+
+def _upload_session_id():
+    session_id = request.args.get('id') or ''
+    if not session_id.isalnum():
+        raise UploadError("缺少或非法的会话 id")
+    return session_id
+
+
+@app.route('/uploadSession', methods=['POST', 'GET', 'DELETE'])
+def upload_session():
+    """
+    分片续传会话：POST 创建（JSON {filename, size, customName}），GET ?id= 查询已提交的偏移量，DELETE ?id= 放弃上传。
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            filename = data.get('filename')
+            custom_filename = data.get('customName')
+            if custom_filename and filename:
+                filename = _library_filename(filename, custom_filename)
+            session = upload_sessions.create(filename, data.get('size'))
+        elif request.method == 'GET':
+            session = upload_sessions.get(_upload_session_id())
+        else:
+            upload_sessions.abort(_upload_session_id())
+            session = None
+    except UploadError as exc:
+        return _upload_error(exc)
+    return jsonify({
+        "code": 200,
+        "msg": "success",
+        "data": session
+    }), 200
+
+
+@app.route('/uploadChunk', methods=['PUT'])
+def upload_chunk():
+    """
+    上传一个分片：请求体为原始字节，偏移量由 ?offset= 或 Upload-Offset 请求头给出，必须等于当前已提交的偏移量，
+    不一致时返回 409 与当前偏移量。返回写入后的会话信息（offset 为新的已提交偏移量）。
+    """
+    try:
+        session_id = _upload_session_id()
+        offset = request.args.get('offset', request.headers.get('Upload-Offset', ''))
+        if not str(offset).isdigit():
+            raise UploadError("缺少或非法的 offset")
+        session = upload_sessions.write_chunk(session_id, int(offset), request.stream, request.content_length)
+    except UploadError as exc:
+        return _upload_error(exc)
+    return jsonify({
+        "code": 200,
+        "msg": "success",
+        "data": session
+    }), 200
+
+
+@app.route('/uploadComplete', methods=['POST'])
+def upload_complete():
+    """全部分片上传完成后调用，文件改名为最终文件并记入素材库，返回值与 /uploadSave 一致并附带 id 与 size（字节）。"""
+    try:
+        _ensure_database()
+        record = upload_sessions.complete(_upload_session_id())
+    except UploadError as exc:
+        return _upload_error(exc)
+    media_prober.submit(record["sha256"], record["filepath"])
+    return jsonify({
+        "code": 200,
+        "msg": "File uploaded and saved successfully",
+        "data": record
+    }), 200
+
+
 @app.route('/ai/generate', methods=['POST'])
 def ai_generate():
     request_body = request.get_json(silent=True) or {}
@@ -250,8 +572,11 @@ def get_all_files():
             cursor.execute("SELECT * FROM file_records")
             rows = cursor.fetchall()
 
-            # 将结果转为字典列表
+            # 将结果转为字典列表，附带已解析的元数据（media 为空表示尚未解析）
             data = [dict(row) for row in rows]
+        media = media_store.get_many(row["sha256"] for row in data)
+        for row in data:
+            row["media"] = media.get(row["sha256"])
 
         return jsonify({
             "code": 200,
@@ -268,48 +593,16 @@ def get_all_files():
 
 @app.route("/getValidAccounts",methods=['GET'])
 def getValidAccounts():
+    """
+    直接返回缓存的账号状态，不再逐个启动浏览器校验。每行字段依次为 ACCOUNT_COLUMNS，
+    last_checked_at 为空表示尚未校验。refresh=1 时把全部账号标记为过期并唤醒后台校验线程。
+    """
     _ensure_database()
-    with sqlite3.connect(_get_db_path()) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM user_info")
-        rows = cursor.fetchall()
-
-    rows_list = [list(row) for row in rows]
-
-    async def _check_all_accounts():
-        results = []
-        for row in rows_list:
-            try:
-                results.append(await check_cookie(row[1], row[2]))
-            except Exception:
-                results.append(False)
-        return results
-
-    try:
-        flags = asyncio.run(_check_all_accounts())
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        try:
-            flags = loop.run_until_complete(_check_all_accounts())
-        finally:
-            loop.close()
-    except Exception:
-        flags = [False] * len(rows_list)
-
-    invalid_ids = []
-    for row, ok in zip(rows_list, flags):
-        if not ok:
-            row[4] = 0
-            invalid_ids.append(row[0])
-
-    if invalid_ids:
-        with sqlite3.connect(_get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.executemany(
-                "UPDATE user_info SET status = ? WHERE id = ?",
-                [(0, account_id) for account_id in invalid_ids],
-            )
-            conn.commit()
+    if _to_bool(request.args.get('refresh')):
+        account_store.mark_stale()
+        if account_refresher:
+            account_refresher.wake()
+    rows_list = account_store.list_accounts()
 
     return jsonify(
         {
@@ -319,6 +612,135 @@ def getValidAccounts():
         }
     ), 200
 
+def _iter_account_checks(rows, use_cache):
+    """
+    在后台线程的事件循环中并发校验 rows 中的账号，每完成一个就写回缓存并产出 (账号行, 校验结果)。
+    生成器被提前关闭（客户端断开）时取消剩余的校验。
+    """
+    events = Queue()
+    runner = {}
+
+    async def _run():
+        runner["loop"] = asyncio.get_running_loop()
+        runner["task"] = asyncio.current_task()
+        try:
+            async for result in iter_check_cookies([(row[1], row[2]) for row in rows], use_cache=use_cache):
+                row = list(rows[result["index"]])
+                account_store.record(row[0], result["valid"], result["reason"])
+                row[4] = 1 if result["valid"] else 0
+                row[5] = time.time()
+                row[6] = result["reason"]
+                events.put((row, result))
+            account_store.index_expiry([row[0] for row in rows])
+        finally:
+            events.put(None)
+
+    def _thread_main():
+        try:
+            asyncio.run(_run())
+        except asyncio.CancelledError:
+            pass
+
+    threading.Thread(target=_thread_main, name="account-check-stream", daemon=True).start()
+    try:
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+    finally:
+        if "task" in runner and not runner["task"].done():
+            runner["loop"].call_soon_threadsafe(runner["task"].cancel)
+
+
+@app.route("/getValidAccountsStream", methods=['GET'])
+def getValidAccountsStream():
+    """
+    /getValidAccounts 的流式版本：实时校验账号，每个账号校验完成就推送一条结果，不必等待全部完成。
+    type 按平台类型过滤，ids 为逗号分隔的账号 id；format 为 sse（默认）或 ndjson；
+    fresh=1 时忽略短期校验缓存，强制重新校验。
+    """
+    try:
+        platform = int(request.args['type']) if request.args.get('type') else None
+        account_ids = [int(item) for item in request.args['ids'].split(',') if item.strip()] \
+            if request.args.get('ids') else None
+    except ValueError:
+        return jsonify({
+            "code": 400,
+            "msg": "type 和 ids 必须是数字",
+            "data": None
+        }), 400
+    stream_format = request.args.get('format') or \
+        ('ndjson' if request.accept_mimetypes.best == 'application/x-ndjson' else 'sse')
+    if stream_format not in ('sse', 'ndjson'):
+        return jsonify({
+            "code": 400,
+            "msg": "format 仅支持 sse 或 ndjson",
+            "data": None
+        }), 400
+    _ensure_database()
+    rows = account_store.list_accounts(platform, account_ids)
+    use_cache = not _to_bool(request.args.get('fresh'))
+
+    def generate():
+        valid = 0
+        for row, result in _iter_account_checks(rows, use_cache):
+            valid += row[4]
+            payload = {"row": row, "method": result["method"], "latency": result["latency"]}
+            if stream_format == 'sse':
+                yield f"event: account\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            else:
+                yield json.dumps(payload, ensure_ascii=False) + "\n"
+        summary = {"total": len(rows), "valid": valid}
+        if stream_format == 'sse':
+            yield f"event: done\ndata: {json.dumps(summary)}\n\n"
+        else:
+            yield json.dumps(dict(summary, done=True)) + "\n"
+
+    if stream_format == 'ndjson':
+        return Response(generate(), mimetype='application/x-ndjson')
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁用 Nginx 缓冲，结果逐条到达前端
+    return response
+
+@app.route("/getExpiringAccounts", methods=['GET'])
+def getExpiringAccounts():
+    """列出登录 cookie 将在 hours 小时内过期（含已过期）的账号，便于提前重新登录。"""
+    try:
+        hours = float(request.args.get('hours', 24))
+    except ValueError:
+        return jsonify({
+            "code": 400,
+            "msg": "hours 必须是数字",
+            "data": None
+        }), 400
+    # 重新索引只需解析 cookie 文件，保证返回的是最新的过期时间
+    account_store.index_expiry()
+    return jsonify({
+        "code": 200,
+        "msg": None,
+        "data": account_store.expiring(hours * 3600)
+    }), 200
+
+@app.route("/routingStats", methods=['GET'])
+def routingStats():
+    """本进程内资源路由策略的拦截统计（多进程发布模式下工作进程的统计不在其中）。"""
+    return jsonify({
+        "code": 200,
+        "msg": None,
+        "data": get_routing_stats()
+    }), 200
+
+@app.route("/storageStats", methods=['GET'])
+def storageStats():
+    """本进程内 cookie 文件压缩的统计：处理文件数、压缩前后字节数、节省字节数与丢弃的 cookie / origin / localStorage 项数。"""
+    return jsonify({
+        "code": 200,
+        "msg": None,
+        "data": get_compaction_stats()
+    }), 200
+
 @app.route('/deleteFile', methods=['GET'])
 def delete_file():
     file_id = request.args.get('id')
@@ -349,9 +771,11 @@ def delete_file():
 
             record = dict(record)
 
-            # 删除数据库记录
+            # 删除数据库记录；去重后多条记录可能共用一个文件，没有其他记录引用时才删除文件
             cursor.execute("DELETE FROM file_records WHERE id = ?", (file_id,))
+            release_file(conn, record['file_path'])
             conn.commit()
+        media_store.prune()
 
         return jsonify({
             "code": 200,
@@ -396,6 +820,9 @@ def delete_account():
             cursor.execute("DELETE FROM user_info WHERE id = ?", (account_id,))
             conn.commit()
 
+        # 删除账号对应的浏览器 profile
+        remove_profile(record['filePath'])
+
         return jsonify({
             "code": 200,
             "msg": "account deleted successfully",
@@ -435,11 +862,13 @@ def login():
     response.headers['Connection'] = 'keep-alive'
     return response
 
-@app.route('/postVideo', methods=['POST'])
-def postVideo():
-    # 获取JSON数据
-    data = request.get_json()
-
+def _publish_tasks_from_payload(data, exists_cache=None):
+    """
+    校验一条发布请求并展开为任务列表，不合法时抛出 ValueError。
+    exists_cache 用于批量请求中缓存文件是否存在的检查结果，避免对同一文件重复访问磁盘。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("发布请求必须是 JSON 对象")
     # 从JSON数据中提取fileList和accountList
     file_list = data.get('fileList', [])
     account_list = data.get('accountList', [])
@@ -458,15 +887,37 @@ def postVideo():
     videos_per_day = data.get('videosPerDay')
     daily_times = data.get('dailyTimes')
     start_days = data.get('startDays')
-    # 打印获取到的数据（仅作为示例）
-    print("File List:", file_list)
-    print("Account List:", account_list)
-    if type == 1:
-        post_video_xhs(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days)
-    elif type == 2:
-        post_video_tencent(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days)
-    elif type == 3:
-        post_video_DouYin(
+    if not isinstance(file_list, list) or not file_list or not isinstance(account_list, list) or not account_list:
+        raise ValueError("fileList 和 accountList 不能为空")
+    if tags is not None and not isinstance(tags, list):
+        raise ValueError("tags 必须是列表")
+
+    # 文件和账号在入队前检查，避免任务在执行阶段才失败
+    exists_cache = {} if exists_cache is None else exists_cache
+    for folder, names, label in (("videoFile", file_list, "视频文件"), ("cookiesFile", account_list, "账号文件")):
+        for name in names:
+            if not isinstance(name, str) or not name:
+                raise ValueError(f"{label}名称不合法: {name!r}")
+            key = (folder, name)
+            if key not in exists_cache:
+                path = Path(BASE_DIR / folder / name)
+                exists_cache[key] = get_cookie_store().exists(path) if folder == "cookiesFile" else path.is_file()
+            if not exists_cache[key]:
+                raise ValueError(f"{label}不存在: {name}")
+
+    # 按入库时解析的元数据检查，无法解析或没有视频画面的文件不入队，不用等上传到平台后才失败；
+    # 尚未解析的文件不阻塞发布
+    media_info = media_store.for_files(file_list)
+    for name in file_list:
+        info = media_info.get(name)
+        if info and info["status"] == MEDIA_ERROR:
+            raise ValueError(f"视频文件无法解析: {name}（{info['error']}）")
+        if info and not info["width"]:
+            raise ValueError(f"视频文件没有视频画面: {name}")
+
+    try:
+        return build_publish_tasks(
+            type,
             title,
             file_list,
             tags,
@@ -479,32 +930,79 @@ def postVideo():
             thumbnail_path,
             productLink,
             productTitle,
+            is_ai_content if type == 5 else None,
+            media_info,
         )
-    elif type == 4:
-        post_video_ks(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days)
-    elif type == 5:
-        post_video_tiktok(
-            title,
-            file_list,
-            tags,
-            account_list,
-            category,
-            enableTimer,
-            videos_per_day,
-            daily_times,
-            start_days,
-            thumbnail_path,
-            is_ai_content,
-        )
-    # 返回响应给客户端
+    except ValueError:
+        raise
+    except Exception as exc:
+        # 定时参数不合法等情况
+        raise ValueError(f"发布参数不合法: {exc}")
+
+
+@app.route('/postVideo', methods=['POST'])
+def postVideo():
+    # 获取JSON数据
+    data = request.get_json(silent=True) or {}
+    # 打印获取到的数据（仅作为示例）
+    print("File List:", data.get('fileList', []))
+    print("Account List:", data.get('accountList', []))
+    try:
+        tasks = _publish_tasks_from_payload(data)
+    except ValueError as exc:
+        return jsonify({
+            "code": 400,
+            "msg": str(exc),
+            "data": None
+        }), 400
+
+    # 每个 (文件, 账号) 组合入队为一个任务，立即返回批次号，进度通过 /jobs 查询
+    result = job_queue.enqueue(tasks)
     return jsonify(
         {
             "code": 200,
             "msg": None,
-            "data": None
+            "data": result
         }), 200
 
 
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            "code": 404,
+            "msg": "job not found",
+            "data": None
+        }), 404
+    return jsonify({
+        "code": 200,
+        "msg": "success",
+        "data": job
+    }), 200
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    status = request.args.get('status')
+    batch_id = request.args.get('batchId')
+    if status and status not in JOB_STATUSES:
+        return jsonify({
+            "code": 400,
+            "msg": f"status 仅支持: {', '.join(JOB_STATUSES)}",
+            "data": None
+        }), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        limit = 100
+    return jsonify({
+        "code": 200,
+        "msg": "success",
+        "data": job_queue.list(status=status, batch_id=batch_id, limit=limit)
+    }), 200
+
+
 @app.route('/updateUserinfo', methods=['POST'])
 def updateUserinfo():
     # 获取JSON数据
@@ -520,11 +1018,12 @@ def updateUserinfo():
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
-            # 更新数据库记录
+            # 更新数据库记录，平台类型可能变化，清除校验时间让后台重新校验
             cursor.execute('''
                            UPDATE user_info
                            SET type     = ?,
-                               userName = ?
+                               userName = ?,
+                               last_checked_at = NULL
                            WHERE id = ?;
                            ''', (type, userName, user_id))
             conn.commit()
@@ -542,74 +1041,98 @@ def updateUserinfo():
             "data": None
         }), 500
 
+def _is_ndjson(mimetype):
+    return mimetype in ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+def _iter_ndjson_items(stream):
+    """逐行解析 NDJSON 请求体，解析失败的行以异常对象返回，不影响后续行。"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield ValueError(f"JSON 解析失败: {exc}")
+
+
+def _enqueue_batch(items, batch_id):
+    """
+    逐条校验批量发布请求，合法的按块写入任务队列（入队后即可被发布循环并发执行），
+    按输入顺序为每一条生成 accepted / rejected 结果，最后生成一条汇总。
+    单条请求不合法只会被拒绝，不影响其他请求。
+    """
+    chunk_size = max(1, int(PUBLISH_QUEUE_SETTINGS.get("batch_chunk_size", 500)))
+    exists_cache = {}
+    accepted = rejected = 0
+    buffer = []  # 按输入顺序待输出的结果
+    pending = []  # [(结果, 任务列表)]，随下一块一起入队
+
+    def flush():
+        tasks = [task for _, item_tasks in pending for task in item_tasks]
+        if tasks:
+            job_ids = job_queue.enqueue(tasks, batch_id)["jobIds"]
+            for result, item_tasks in pending:
+                result["jobIds"], job_ids = job_ids[:len(item_tasks)], job_ids[len(item_tasks):]
+        pending.clear()
+        output = list(buffer)
+        buffer.clear()
+        return output
+
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, Exception):
+                raise item
+            tasks = _publish_tasks_from_payload(item, exists_cache)
+        except ValueError as exc:
+            rejected += 1
+            buffer.append({"index": index, "status": "rejected", "error": str(exc)})
+        else:
+            accepted += 1
+            result = {"index": index, "status": "accepted", "jobIds": []}
+            buffer.append(result)
+            pending.append((result, tasks))
+        if len(buffer) >= chunk_size:
+            yield from flush()
+    yield from flush()
+    yield {"batchId": batch_id, "accepted": accepted, "rejected": rejected}
+
+
 @app.route('/postVideoBatch', methods=['POST'])
 def postVideoBatch():
-    data_list = request.get_json()
-
-    if not isinstance(data_list, list):
-        return jsonify({"error": "Expected a JSON array"}), 400
-    for data in data_list:
-        # 从JSON数据中提取fileList和accountList
-        file_list = data.get('fileList', [])
-        account_list = data.get('accountList', [])
-        type = data.get('type')
-        title = data.get('title')
-        tags = data.get('tags')
-        category = data.get('category')
-        enableTimer = data.get('enableTimer')
-        if category == 0:
-            category = None
-        productLink = data.get('productLink', '')
-        productTitle = data.get('productTitle', '')
-        thumbnail_path = data.get('thumbnail', '')
-        is_ai_content = _to_bool(data.get('isAiContent'))
-
-        videos_per_day = data.get('videosPerDay')
-        daily_times = data.get('dailyTimes')
-        start_days = data.get('startDays')
-        # 打印获取到的数据（仅作为示例）
-        print("File List:", file_list)
-        print("Account List:", account_list)
-        if type == 1:
-            return
-        elif type == 2:
-            post_video_tencent(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days)
-        elif type == 3:
-            post_video_DouYin(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                enableTimer,
-                videos_per_day,
-                daily_times,
-                start_days,
-                productLink,
-                productTitle,
-            )
-        elif type == 4:
-            post_video_ks(title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days)
-        elif type == 5:
-            post_video_tiktok(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                enableTimer,
-                videos_per_day,
-                daily_times,
-                start_days,
-                thumbnail_path,
-                is_ai_content,
-            )
-    # 返回响应给客户端
+    """
+    批量发布：请求体为 JSON 数组，或 NDJSON（Content-Type: application/x-ndjson，每行一条 /postVideo 请求）。
+    NDJSON 请求边读边校验入队，以 NDJSON 逐条返回结果，适合上万条的大批量提交；
+    JSON 数组请求默认一次性返回全部结果，Accept 为 application/x-ndjson 时同样以流式返回。
+    """
+    batch_id = uuid.uuid4().hex
+    streaming_input = _is_ndjson(request.mimetype)
+    if streaming_input:
+        items = _iter_ndjson_items(request.stream)
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return jsonify({
+                "code": 400,
+                "msg": "请求体必须是 JSON 数组或 NDJSON",
+                "data": None
+            }), 400
+
+    if streaming_input or request.accept_mimetypes.best == "application/x-ndjson":
+        def generate():
+            for result in _enqueue_batch(items, batch_id):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    results = list(_enqueue_batch(items, batch_id))
+    summary = results.pop()
     return jsonify(
         {
             "code": 200,
             "msg": None,
-            "data": None
+            "data": dict(summary, results=results)
         }), 200
 
 # 包装函数：在线程中运行异步函数
@@ -6,6 +6,14 @@ export const accountApi = {
   getValidAccounts() {
     return http.get('/getValidAccounts')
   },
+
+  // 实时校验账号（SSE），每个账号校验完成即推送一条 account 事件，全部完成后推送 done 事件
+  // params 可选：type 平台类型，ids 逗号分隔的账号 id，fresh 为 1 时忽略校验缓存
+  validateAccountsStream(params = {}) {
+    const baseUrl = import.meta.env.PROD ? '/api' : (import.meta.env.VITE_API_BASE_URL || '/api')
+    const query = new URLSearchParams(params).toString()
+    return new EventSource(`${baseUrl}/getValidAccountsStream${query ? `?${query}` : ''}`)
+  },
   
   // 添加账号
   addAccount(data) {
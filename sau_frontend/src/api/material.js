@@ -13,6 +13,57 @@ export const materialApi = {
     return http.upload('/uploadSave', formData)
   },
   
+  // 上传前按 SHA-256 查询素材库：已有该内容且带 filename 时直接记入素材库（秒传），data.deduplicated 为 true
+  checkUpload: (data) => {
+    return http.post('/uploadCheck', data)
+  },
+
+  // 分片续传：创建会话
+  createUploadSession: (data) => {
+    return http.post('/uploadSession', data)
+  },
+
+  // 分片续传：查询已提交的偏移量
+  getUploadSession: (id) => {
+    return http.get('/uploadSession', { id })
+  },
+
+  // 分片续传：上传一个分片
+  uploadChunk: (id, offset, blob) => {
+    return http.put(`/uploadChunk?id=${id}&offset=${offset}`, blob, {
+      headers: { 'Content-Type': 'application/octet-stream' }
+    })
+  },
+
+  // 分片续传：完成上传
+  completeUpload: (id) => {
+    return http.post(`/uploadComplete?id=${id}`)
+  },
+
+  // 分片续传上传大文件：失败的分片先查询服务端已提交的偏移量，再从断点继续，最多重试 retries 次
+  async uploadResumable(file, { customName, chunkSize = 8 * 1024 * 1024, retries = 5, onProgress } = {}) {
+    const { data: session } = await materialApi.createUploadSession({
+      filename: file.name,
+      size: file.size,
+      customName
+    })
+    let offset = 0
+    let failures = 0
+    while (offset < file.size) {
+      try {
+        const { data } = await materialApi.uploadChunk(session.id, offset, file.slice(offset, offset + chunkSize))
+        offset = data.offset
+        failures = 0
+        onProgress && onProgress(offset, file.size)
+      } catch (error) {
+        if (++failures > retries) throw error
+        const { data } = await materialApi.getUploadSession(session.id)
+        offset = data.offset
+      }
+    }
+    return materialApi.completeUpload(session.id)
+  },
+
   // 删除素材
   deleteMaterial: (id) => {
     return http.get(`/deleteFile?id=${id}`)
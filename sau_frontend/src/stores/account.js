@@ -24,6 +24,8 @@ export const useAccountStore = defineStore('account', () => {
         filePath: item[2],
         name: item[3],
         status: item[4] === 1 ? '正常' : '异常',
+        lastCheckedAt: item[5] ? new Date(item[5] * 1000) : null,
+        statusReason: item[6] || '',
         platform: platformTypes[item[1]] || '未知',
         avatar: '/vite.svg' // 默认使用vite.svg作为头像
       }
@@ -0,0 +1,95 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+
+from conf import BASE_DIR
+from myUtils.job_queue import LeaseKeeper, PublishWorkerPool, load_job_store
+from myUtils.postVideo import PublishDispatcher
+from myUtils.process_workers import ProcessWorkerPool
+from utils.browser_pool import use_browser_pool
+from utils.log import job_logger
+
+try:
+    from conf import PUBLISH_QUEUE_SETTINGS
+except ImportError:
+    PUBLISH_QUEUE_SETTINGS = {}
+
+try:
+    from conf import WORKER_SETTINGS
+except ImportError:
+    WORKER_SETTINGS = {}
+
+try:
+    from conf import PREWARM_SETTINGS
+except ImportError:
+    PREWARM_SETTINGS = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Publish worker node: claim jobs enqueued by sau_backend from the shared job store and run them.")
+    parser.add_argument("--worker-id", default=WORKER_SETTINGS.get("worker_id") or f"{socket.gethostname()}-{os.getpid()}",
+                        help="Unique id of this node, defaults to <hostname>-<pid>")
+    parser.add_argument("--store", default=WORKER_SETTINGS.get("store") or "",
+                        help="Job store class as module:Class, defaults to the SQLite JobQueue")
+    parser.add_argument("--db", default=str(WORKER_SETTINGS.get("db_path") or BASE_DIR / "database.db"),
+                        help="SQLite database shared with sau_backend (used by the default store)")
+    parser.add_argument("--mode", choices=["thread", "process"], default=PUBLISH_QUEUE_SETTINGS.get("mode", "thread"),
+                        help="thread: run jobs concurrently on one event loop; process: one worker process per job")
+    parser.add_argument("--workers", type=int, default=PUBLISH_QUEUE_SETTINGS.get("workers", 2),
+                        help="Max jobs running at the same time on this node")
+    parser.add_argument("--lease", type=float, default=WORKER_SETTINGS.get("lease_seconds", 60),
+                        help="Lease length in seconds, renewed by heartbeats while a job runs")
+    parser.add_argument("--max-attempts", type=int, default=WORKER_SETTINGS.get("max_attempts", 2),
+                        help="Jobs whose lease expired are re-queued until they were claimed this many times")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    store_kwargs = {} if args.store else {"db_path": args.db}
+    job_queue = load_job_store(args.store, **store_kwargs)
+    if hasattr(job_queue, "ensure_schema"):
+        job_queue.ensure_schema()
+    lease = LeaseKeeper(job_queue, args.worker_id, args.lease, args.max_attempts)
+    # 启动时先回收一次失联节点遗留的任务
+    lease.tick([], force=True)
+
+    if args.mode == "process":
+        workers = ProcessWorkerPool(
+            job_queue,
+            processes=args.workers,
+            poll_interval=PUBLISH_QUEUE_SETTINGS.get("poll_interval", 1.0),
+            job_timeout=PUBLISH_QUEUE_SETTINGS.get("job_timeout"),
+            lease=lease,
+        )
+    else:
+        dispatcher = PublishDispatcher()
+        workers = PublishWorkerPool(
+            job_queue,
+            dispatcher.run_job,
+            max_jobs=args.workers,
+            poll_interval=PUBLISH_QUEUE_SETTINGS.get("poll_interval", 1.0),
+            lifespan=use_browser_pool,
+            prefetch=dispatcher.prewarm_jobs,
+            lookahead=PREWARM_SETTINGS.get("lookahead", 1),
+            limits=dispatcher,
+            lease=lease,
+        )
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    job_logger.info(f"[+] sau_worker {args.worker_id} 已启动，模式 {args.mode}，租约 {args.lease}s")
+    workers.start()
+    while not stop_event.wait(1):
+        pass
+    job_logger.info(f"[+] sau_worker {args.worker_id} 正在退出，等待运行中的任务结束")
+    workers.stop()
+
+
+if __name__ == '__main__':
+    main()
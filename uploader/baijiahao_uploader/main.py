@@ -3,12 +3,12 @@ import random
 from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright, Page
-import os
 import time
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
 from utils.log import baijiahao_logger
 from utils.network import async_retry
 
@@ -25,20 +25,20 @@ async def baijiahao_cookie_gen(account_file):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://baijiahao.baidu.com/builder/theme/bjh/login")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
         baijiahao_logger.success("cookie saved")
 
 
 async def cookie_auth(account_file):
     async with async_playwright() as playwright:
         browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
+        context = await browser.new_context(storage_state=get_cookie_store().load(account_file))
         context = await set_init_script(context)
         # 创建一个新的页面
         page = await context.new_page()
@@ -55,7 +55,7 @@ async def cookie_auth(account_file):
 
 
 async def baijiahao_setup(account_file, handle=False):
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await cookie_auth(account_file):
         if not handle:
             return False
         baijiahao_logger.error("cookie文件不存在或已失效，即将自动打开浏览器，请扫码登录，登陆后会自动生成cookie文件")
@@ -120,8 +120,8 @@ class BaiJiaHaoVideo(object):
     async def upload(self, playwright: Playwright) -> None:
         # 使用 Chromium 浏览器启动一个浏览器实例
         browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, proxy=self.proxy_setting)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}", user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
+        # 创建一个浏览器上下文，使用指定的 cookie 文件（读取时压缩，去掉历史积累的无关数据）
+        context = await browser.new_context(storage_state=get_cookie_store().load(self.account_file), user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36')
         # context = await set_init_script(context)
         await context.grant_permissions(['geolocation'])
 
@@ -176,7 +176,7 @@ class BaiJiaHaoVideo(object):
         await page.wait_for_url("https://baijiahao.baidu.com/builder/rc/clue**", timeout=5000)
         baijiahao_logger.success("视频发布成功")
 
-        await context.storage_state(path=self.account_file)  # 保存cookie
+        await get_cookie_store().save_context(context, self.account_file)  # 保存cookie
         baijiahao_logger.info('cookie更新完毕！')
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         # 关闭浏览器上下文和浏览器实例
@@ -253,10 +253,10 @@ class BaiJiaHaoVideo(object):
     async def ai2video(self, playwright: Playwright) -> None:
         # 使用 Chromium 浏览器启动一个浏览器实例
         browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path, proxy=self.proxy_setting)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
+        # 创建一个浏览器上下文，使用指定的 cookie 文件（读取时压缩，AI 成片的历史批次记录会不断累积）
         context = await browser.new_context(
             viewport={"width": 1600, "height": 900},
-            storage_state=f"{self.account_file}",
+            storage_state=get_cookie_store().load(self.account_file),
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.4324.150 Safari/537.36'
         )
         # context = await set_init_script(context)
@@ -492,7 +492,7 @@ class BaiJiaHaoVideo(object):
         await asyncio.sleep(1000)  # 这里延迟是为了方便眼睛直观的观看
 
         # 退出前保存 storage 信息
-        await context.storage_state(path=self.account_file)  # 保存cookie
+        await get_cookie_store().save_context(context, self.account_file)  # 保存cookie
         baijiahao_logger.info('cookie更新完毕！')
         await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
         # 关闭浏览器上下文和浏览器实例
@@ -1,42 +1,45 @@
 # -*- coding: utf-8 -*-
+import re
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright, Page, TimeoutError as PlaywrightTimeoutError
-import os
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
+from myUtils.auth import check_cookie
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
+from utils.browser_pool import get_browser_pool, use_browser_pool
+from utils.progress import report_progress, commit_progress, PHASE_PAGE_OPENED, PHASE_FILE_ATTACHED, PHASE_UPLOAD_COMPLETE, \
+    PHASE_METADATA_FILLED, PHASE_SCHEDULE_SET, PHASE_PUBLISH_CLICKED, PHASE_PUBLISH_CONFIRMED
 from utils.log import douyin_logger
 
-
-async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.douyin.com/creator-micro/content/upload")
-        try:
-            await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload", timeout=5000)
-        except:
-            print("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
-            return False
-        # 2024.06.17 抖音创作者中心改版
-        if await page.get_by_text('手机号登录').count() or await page.get_by_text('扫码登录').count():
-            print("[+] 等待5秒 cookie 失效")
-            return False
-        else:
-            print("[+] cookie 有效")
-            return True
+# 点击发布后创作者平台创建作品的接口，响应中带新作品的 id
+PUBLISH_API_PATTERN = re.compile(r"/aweme/create")
+# 检查点 detail 中记录作品 id 的格式
+ITEM_ID_DETAIL = "item_id="
+
+
+def _find_item_id(data):
+    """在发布接口的 JSON 响应中查找新作品的 id（item_id / aweme_id），找不到时返回 None。"""
+    if isinstance(data, dict):
+        for key in ("item_id", "aweme_id"):
+            if data.get(key) not in (None, "", 0, "0"):
+                return str(data[key])
+        values = data.values()
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+    for value in values:
+        item_id = _find_item_id(value)
+        if item_id:
+            return item_id
+    return None
 
 
 async def douyin_setup(account_file, handle=False):
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await check_cookie(3, account_file):
         if not handle:
             # Todo alert message
             return False
@@ -54,13 +57,13 @@ async def douyin_cookie_gen(account_file):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://creator.douyin.com/")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
 
 
 class DouYinVideo(object):
@@ -72,6 +75,13 @@ class DouYinVideo(object):
         self.account_file = account_file
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = False
+        self.upload_url = "https://creator.douyin.com/creator-micro/content/upload"
+        self.manage_url = "https://creator.douyin.com/creator-micro/content/manage"
+        # 崩溃恢复时由发布任务设置：上次已点击发布但未确认结果，需先核对作品管理页；
+        # resume_detail 为上次记录的检查点 detail（点击发布后拿到作品 id 时为 item_id=<id>）
+        self.verify_before_publish = False
+        self.resume_detail = None
         self.thumbnail_path = thumbnail_path
         self.productLink = productLink
         self.productTitle = productTitle
@@ -96,161 +106,186 @@ class DouYinVideo(object):
         douyin_logger.info('视频出错了，重新上传中')
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-        else:
-            browser = await playwright.chromium.launch(headless=False)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.douyin.com/creator-micro/content/upload")
-        douyin_logger.info(f'[+]正在上传-------{self.title}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        douyin_logger.info(f'[-] 正在打开主页...')
-        await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload")
-        # 点击 "上传视频" 按钮
-        await page.locator("div[class^='container'] input").set_input_files(self.file_path)
-
-        # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
-        while True:
-            try:
-                # 尝试等待第一个 URL
-                await page.wait_for_url(
-                    "https://creator.douyin.com/creator-micro/content/publish?enter_from=publish_page", timeout=3000)
-                douyin_logger.info("[+] 成功进入version_1发布页面!")
-                break  # 成功进入页面后跳出循环
-            except Exception:
+    async def upload(self) -> None:
+        # 从浏览器池借用该账号的浏览器上下文（开启 profile 模式时复用账号的持久化 profile）
+        pool = get_browser_pool()
+        async with pool.account_context(self.account_file, headless=self.headless,
+                                        executable_path=self.local_executable_path) as context:
+            context = await set_init_script(context)
+
+            # 打开上传页（该任务已被预热时直接复用加载好的页面）
+            page = await pool.open_page(context, self.upload_url)
+            douyin_logger.info(f'[+]正在上传-------{self.title}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            douyin_logger.info(f'[-] 正在打开主页...')
+            await page.wait_for_url("https://creator.douyin.com/creator-micro/content/upload")
+            report_progress(PHASE_PAGE_OPENED)
+            if self.verify_before_publish and await self.is_published(context):
+                douyin_logger.success("  [-]作品管理页已存在该视频，跳过重复发布")
+                report_progress(PHASE_PUBLISH_CONFIRMED)
+                return
+            # 点击 "上传视频" 按钮
+            await page.locator("div[class^='container'] input").set_input_files(self.file_path)
+            report_progress(PHASE_FILE_ATTACHED)
+
+            # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
+            while True:
                 try:
-                    # 如果第一个 URL 超时，再尝试等待第二个 URL
+                    # 尝试等待第一个 URL
                     await page.wait_for_url(
-                        "https://creator.douyin.com/creator-micro/content/post/video?enter_from=publish_page",
-                        timeout=3000)
-                    douyin_logger.info("[+] 成功进入version_2发布页面!")
-
+                        "https://creator.douyin.com/creator-micro/content/publish?enter_from=publish_page", timeout=3000)
+                    douyin_logger.info("[+] 成功进入version_1发布页面!")
                     break  # 成功进入页面后跳出循环
-                except:
-                    print("  [-] 超时未进入视频发布页面，重新尝试...")
-                    await asyncio.sleep(0.5)  # 等待 0.5 秒后重新尝试
-        # 填充标题和话题
-        # 检查是否存在包含输入框的元素
-        # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
-        await asyncio.sleep(1)
-        douyin_logger.info(f'  [-] 正在填充标题和作品简介...')
-        title_selectors = [
-            "input.semi-input[placeholder*='作品标题']",
-            "input.semi-input[placeholder*='填写作品标题']",
-            "input[placeholder*='作品标题']",
-            ".editor-comp-publish-container-d4oeQI input.semi-input",
-        ]
-        title_container = await self.locate_first_visible(page, title_selectors, timeout=15000)
-        if title_container:
-            await title_container.fill(self.title[:30])
-        else:
-            titlecontainer = page.locator(".notranslate")
-            await titlecontainer.click()
-            await page.keyboard.press("Backspace")
-            await page.keyboard.press("Control+KeyA")
-            await page.keyboard.press("Delete")
-            await page.keyboard.type(self.title)
-            await page.keyboard.press("Enter")
-
-        description_selectors = [
-            ".editor-kit-editor-container .zone-container.editor[contenteditable='true']",
-            ".zone-container.editor[contenteditable='true']",
-            ".editor-kit-editor-container [contenteditable='true']",
-            ".editor-comp-publish-container-d4oeQI [contenteditable='true']",
-            "[contenteditable='true'][data-placeholder*='作品简介']",
-            "[contenteditable='true'][data-placeholder*='正文']",
-        ]
-        description_editor = await self.locate_first_visible(page, description_selectors, timeout=15000)
-        if description_editor is None:
-            raise RuntimeError("未找到抖音作品简介输入框，请检查页面结构是否发生变化。")
-        await description_editor.click()
-        try:
-            await description_editor.press("Control+KeyA")
-            await description_editor.press("Delete")
-        except Exception:
-            pass
-
-        if self.title:
-            await description_editor.type(self.title)
-            await description_editor.type("\n")
-
-        for index, tag in enumerate(self.tags, start=1):
-            await description_editor.type(f"#{tag} ")
-            await page.wait_for_timeout(200)  # brief pause to let Douyin suggestion panel settle
-        await page.wait_for_timeout(1000)  # ensure the editor syncs before proceeding
-        douyin_logger.info(f'总共添加{len(self.tags)}个话题')
-        while True:
-            # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
+                except Exception:
+                    try:
+                        # 如果第一个 URL 超时，再尝试等待第二个 URL
+                        await page.wait_for_url(
+                            "https://creator.douyin.com/creator-micro/content/post/video?enter_from=publish_page",
+                            timeout=3000)
+                        douyin_logger.info("[+] 成功进入version_2发布页面!")
+
+                        break  # 成功进入页面后跳出循环
+                    except:
+                        print("  [-] 超时未进入视频发布页面，重新尝试...")
+                        await asyncio.sleep(0.5)  # 等待 0.5 秒后重新尝试
+            # 填充标题和话题
+            # 检查是否存在包含输入框的元素
+            # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
+            await asyncio.sleep(1)
+            douyin_logger.info(f'  [-] 正在填充标题和作品简介...')
+            title_selectors = [
+                "input.semi-input[placeholder*='作品标题']",
+                "input.semi-input[placeholder*='填写作品标题']",
+                "input[placeholder*='作品标题']",
+                ".editor-comp-publish-container-d4oeQI input.semi-input",
+            ]
+            title_container = await self.locate_first_visible(page, title_selectors, timeout=15000)
+            if title_container:
+                await title_container.fill(self.title[:30])
+            else:
+                titlecontainer = page.locator(".notranslate")
+                await titlecontainer.click()
+                await page.keyboard.press("Backspace")
+                await page.keyboard.press("Control+KeyA")
+                await page.keyboard.press("Delete")
+                await page.keyboard.type(self.title)
+                await page.keyboard.press("Enter")
+
+            description_selectors = [
+                ".editor-kit-editor-container .zone-container.editor[contenteditable='true']",
+                ".zone-container.editor[contenteditable='true']",
+                ".editor-kit-editor-container [contenteditable='true']",
+                ".editor-comp-publish-container-d4oeQI [contenteditable='true']",
+                "[contenteditable='true'][data-placeholder*='作品简介']",
+                "[contenteditable='true'][data-placeholder*='正文']",
+            ]
+            description_editor = await self.locate_first_visible(page, description_selectors, timeout=15000)
+            if description_editor is None:
+                raise RuntimeError("未找到抖音作品简介输入框，请检查页面结构是否发生变化。")
+            await description_editor.click()
             try:
-                #  新版：定位重新上传
-                number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
-                if number > 0:
-                    douyin_logger.success("  [-]视频上传完毕")
-                    break
-                else:
+                await description_editor.press("Control+KeyA")
+                await description_editor.press("Delete")
+            except Exception:
+                pass
+
+            if self.title:
+                await description_editor.type(self.title)
+                await description_editor.type("\n")
+
+            for index, tag in enumerate(self.tags, start=1):
+                await description_editor.type(f"#{tag} ")
+                await page.wait_for_timeout(200)  # brief pause to let Douyin suggestion panel settle
+            await page.wait_for_timeout(1000)  # ensure the editor syncs before proceeding
+            douyin_logger.info(f'总共添加{len(self.tags)}个话题')
+            while True:
+                # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
+                try:
+                    #  新版：定位重新上传
+                    number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
+                    if number > 0:
+                        douyin_logger.success("  [-]视频上传完毕")
+                        report_progress(PHASE_UPLOAD_COMPLETE)
+                        break
+                    else:
+                        douyin_logger.info("  [-] 正在上传视频中...")
+                        await asyncio.sleep(2)
+
+                        if await page.locator('div.progress-div > div:has-text("上传失败")').count():
+                            douyin_logger.error("  [-] 发现上传出错了... 准备重试")
+                            await self.handle_upload_error(page)
+                except:
                     douyin_logger.info("  [-] 正在上传视频中...")
                     await asyncio.sleep(2)
 
-                    if await page.locator('div.progress-div > div:has-text("上传失败")').count():
-                        douyin_logger.error("  [-] 发现上传出错了... 准备重试")
-                        await self.handle_upload_error(page)
-            except:
-                douyin_logger.info("  [-] 正在上传视频中...")
-                await asyncio.sleep(2)
-
-        if self.productLink and self.productTitle:
-            douyin_logger.info(f'  [-] 正在设置商品链接...')
-            await self.set_product_link(page, self.productLink, self.productTitle)
-            douyin_logger.info(f'  [+] 完成设置商品链接...')
+            if self.productLink and self.productTitle:
+                douyin_logger.info(f'  [-] 正在设置商品链接...')
+                await self.set_product_link(page, self.productLink, self.productTitle)
+                douyin_logger.info(f'  [+] 完成设置商品链接...')
         
-        #上传视频封面
-        await self.set_thumbnail(page, self.thumbnail_path)
+            #上传视频封面
+            await self.set_thumbnail(page, self.thumbnail_path)
 
-        # 更换可见元素
-        await self.set_location(page, "")
+            # 更换可见元素
+            await self.set_location(page, "")
 
 
-        # 頭條/西瓜
-        third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
-        # 定位是否有第三方平台
-        if await page.locator(third_part_element).count():
-            # 检测是否是已选中状态
-            if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
-                await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
+            # 頭條/西瓜
+            third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
+            # 定位是否有第三方平台
+            if await page.locator(third_part_element).count():
+                # 检测是否是已选中状态
+                if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
+                    await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
 
-        if self.publish_date != 0:
-            await self.set_schedule_time_douyin(page, self.publish_date)
+            report_progress(PHASE_METADATA_FILLED)
+            if self.publish_date != 0:
+                await self.set_schedule_time_douyin(page, self.publish_date)
+                report_progress(PHASE_SCHEDULE_SET)
 
-        # 判断视频是否发布成功
-        while True:
+            # 记录发布接口返回的作品 id：同一批次的文件标题相同，崩溃恢复时只能按作品 id 核对。
+            # 事件回调不在本任务的上下文中执行（拿不到进度回调），只暂存 id，由下面的发布循环写入检查点
+            item_ids = []
+
+            async def capture_item_id(response):
+                if item_ids or not PUBLISH_API_PATTERN.search(response.url):
+                    return
+                try:
+                    item_id = _find_item_id(await response.json())
+                except Exception:
+                    return
+                if item_id and not item_ids:
+                    item_ids.append(item_id)
+
+            page.on("response", capture_item_id)
+            item_id_recorded = False
+            # 检查点落库后才点击发布，崩溃恢复时不会从更早的检查点重跑而重复发布
+            await commit_progress(PHASE_PUBLISH_CLICKED)
             # 判断视频是否发布成功
-            try:
-                publish_button = page.get_by_role('button', name="发布", exact=True)
-                if await publish_button.count():
-                    await publish_button.click()
-                await page.wait_for_url("https://creator.douyin.com/creator-micro/content/manage**",
-                                        timeout=3000)  # 如果自动跳转到作品页面，则代表发布成功
-                douyin_logger.success("  [-]视频发布成功")
-                break
-            except:
-                douyin_logger.info("  [-] 视频正在发布中...")
-                await page.screenshot(full_page=True)
-                await asyncio.sleep(0.5)
-
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        douyin_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+            while True:
+                # 判断视频是否发布成功
+                try:
+                    publish_button = page.get_by_role('button', name="发布", exact=True)
+                    if await publish_button.count():
+                        await publish_button.click()
+                    try:
+                        await page.wait_for_url("https://creator.douyin.com/creator-micro/content/manage**",
+                                                timeout=3000)  # 如果自动跳转到作品页面，则代表发布成功
+                    finally:
+                        if item_ids and not item_id_recorded:
+                            await commit_progress(PHASE_PUBLISH_CLICKED, f"{ITEM_ID_DETAIL}{item_ids[0]}")
+                            item_id_recorded = True
+                    douyin_logger.success("  [-]视频发布成功" + (f"，作品 id: {item_ids[0]}" if item_ids else ""))
+                    report_progress(PHASE_PUBLISH_CONFIRMED, f"{ITEM_ID_DETAIL}{item_ids[0]}" if item_ids else None)
+                    break
+                except:
+                    douyin_logger.info("  [-] 视频正在发布中...")
+                    await page.screenshot(full_page=True)
+                    await asyncio.sleep(0.5)
+
+            await pool.save_storage_state(context, self.account_file)  # 保存cookie
+            douyin_logger.success('  [-]cookie更新完毕！')
+            await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
     
     async def set_thumbnail(self, page: Page, thumbnail_path: str):
         if thumbnail_path:
@@ -392,8 +427,49 @@ class DouYinVideo(object):
                 continue
         return None
 
+    async def is_published(self, context) -> bool:
+        """
+        核对上次中断前的发布是否已经生效。同一批次的文件共用一个标题，不能按标题判断，
+        只认上次点击发布后记录的作品 id：在作品管理页加载的作品列表中找到该 id 才视为已发布。
+        没有记录作品 id（点击后、接口返回前中断）或找不到该作品时抛出异常，任务失败并交给人工确认，不盲目重发也不误判为成功。
+        """
+        detail = self.resume_detail or ""
+        if not detail.startswith(ITEM_ID_DETAIL):
+            raise RuntimeError("上次执行已点击发布但未拿到作品 id，无法确认是否已发布，请到抖音作品管理页人工确认")
+        item_id = detail[len(ITEM_ID_DETAIL):]
+        page = await context.new_page()
+        bodies = []
+
+        async def collect(response):
+            if "json" in (response.headers.get("content-type") or ""):
+                try:
+                    bodies.append(await response.text())
+                except Exception:
+                    pass
+
+        page.on("response", collect)
+        try:
+            douyin_logger.info(f'  [-] 正在作品管理页核对上次发布的作品 {item_id}...')
+            await page.goto(self.manage_url)
+            await page.wait_for_url(f"{self.manage_url}**", timeout=15000)
+            try:
+                await page.wait_for_load_state('networkidle', timeout=15000)
+            except Exception:
+                pass
+            await page.wait_for_timeout(2000)  # 等待作品列表渲染
+            # 按完整的 id 匹配，避免命中其他更长数字的一部分
+            pattern = re.compile(rf"(?<![0-9]){re.escape(item_id)}(?![0-9])")
+            found = any(pattern.search(body) for body in bodies) or bool(pattern.search(await page.content()))
+        except Exception as exc:
+            raise RuntimeError(f"核对抖音作品管理页失败，为避免重复发布已中止: {exc}") from exc
+        finally:
+            await page.close()
+        if not found:
+            raise RuntimeError(f"作品管理页未找到上次发布的作品 {item_id}，请到抖音作品管理页人工确认")
+        return True
+
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        async with use_browser_pool():
+            await self.upload()
 
 
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright
-import os
+from playwright.async_api import async_playwright
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
+from myUtils.auth import check_cookie
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
+from utils.browser_pool import get_browser_pool, use_browser_pool
 from utils.files_times import get_absolute_path
+from utils.progress import report_progress, commit_progress, PHASE_PAGE_OPENED, PHASE_FILE_ATTACHED, PHASE_UPLOAD_COMPLETE, \
+    PHASE_METADATA_FILLED, PHASE_SCHEDULE_SET, PHASE_PUBLISH_CLICKED, PHASE_PUBLISH_CONFIRMED
 from utils.log import tencent_logger
 
 
@@ -31,24 +35,6 @@ def format_str_for_short_title(origin_title: str) -> str:
     return formatted_string
 
 
-async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
-        try:
-            await page.wait_for_selector('div.title-name:has-text("微信小店")', timeout=5000)  # 等待5秒
-            tencent_logger.error("[+] 等待5秒 cookie 失效")
-            return False
-        except:
-            tencent_logger.success("[+] cookie 有效")
-            return True
-
-
 async def get_tencent_cookie(account_file):
     async with async_playwright() as playwright:
         options = {
@@ -62,17 +48,17 @@ async def get_tencent_cookie(account_file):
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
         # Pause the page, and start recording manually.
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         page = await context.new_page()
         await page.goto("https://channels.weixin.qq.com")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
 
 
 async def weixin_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tencent_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await check_cookie(2, account_file):
         if not handle:
             # Todo alert message
             return False
@@ -90,6 +76,8 @@ class TencentVideo(object):
         self.account_file = account_file
         self.category = category
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = False
+        self.upload_url = "https://channels.weixin.qq.com/platform/post/create"
 
     async def set_schedule_time_tencent(self, page, publish_date):
         label_element = page.locator("label").filter(has_text="定时").nth(1)
@@ -133,46 +121,49 @@ class TencentVideo(object):
         file_input = page.locator('input[type="file"]')
         await file_input.set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium (这里使用系统内浏览器，用chromium 会造成h264错误
-        browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://channels.weixin.qq.com/platform/post/create")
-        tencent_logger.info(f'[+]正在上传-------{self.title}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
-        # await page.wait_for_selector('input[type="file"]', timeout=10000)
-        file_input = page.locator('input[type="file"]')
-        await file_input.set_input_files(self.file_path)
-        # 填充标题和话题
-        await self.add_title_tags(page)
-        # 添加商品
-        # await self.add_product(page)
-        # 合集功能
-        await self.add_collection(page)
-        # 原创选择
-        await self.add_original(page)
-        # 检测上传状态
-        await self.detect_upload_status(page)
-        if self.publish_date != 0:
-            await self.set_schedule_time_tencent(page, self.publish_date)
-        # 添加短标题
-        await self.add_short_title(page)
-
-        await self.click_publish(page)
-
-        await context.storage_state(path=f"{self.account_file}")  # 保存cookie
-        tencent_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+    async def upload(self) -> None:
+        # 从浏览器池借用该账号的浏览器上下文（开启 profile 模式时复用账号的持久化 profile）
+        pool = get_browser_pool()
+        # 视频号需使用系统内浏览器（LOCAL_CHROME_PATH），用 chromium 会造成 h264 错误
+        async with pool.account_context(self.account_file, headless=self.headless,
+                                        executable_path=self.local_executable_path) as context:
+            context = await set_init_script(context)
+
+            # 打开上传页（该任务已被预热时直接复用加载好的页面）
+            page = await pool.open_page(context, self.upload_url)
+            tencent_logger.info(f'[+]正在上传-------{self.title}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            await page.wait_for_url("https://channels.weixin.qq.com/platform/post/create")
+            report_progress(PHASE_PAGE_OPENED)
+            # await page.wait_for_selector('input[type="file"]', timeout=10000)
+            file_input = page.locator('input[type="file"]')
+            await file_input.set_input_files(self.file_path)
+            report_progress(PHASE_FILE_ATTACHED)
+            # 填充标题和话题
+            await self.add_title_tags(page)
+            # 添加商品
+            # await self.add_product(page)
+            # 合集功能
+            await self.add_collection(page)
+            # 原创选择
+            await self.add_original(page)
+            # 检测上传状态
+            await self.detect_upload_status(page)
+            report_progress(PHASE_METADATA_FILLED)
+            if self.publish_date != 0:
+                await self.set_schedule_time_tencent(page, self.publish_date)
+                report_progress(PHASE_SCHEDULE_SET)
+            # 添加短标题
+            await self.add_short_title(page)
+
+            # 检查点落库后才点击发布，崩溃恢复时不会从更早的检查点重跑而重复发布
+            await commit_progress(PHASE_PUBLISH_CLICKED)
+            await self.click_publish(page)
+            report_progress(PHASE_PUBLISH_CONFIRMED)
+
+            await pool.save_storage_state(context, self.account_file)  # 保存cookie
+            tencent_logger.success('  [-]cookie更新完毕！')
+            await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
 
     async def add_short_title(self, page):
         short_title_element = page.get_by_text("短标题", exact=True).locator("..").locator(
@@ -209,6 +200,7 @@ class TencentVideo(object):
                 if "weui-desktop-btn_disabled" not in await page.get_by_role("button", name="发表").get_attribute(
                         'class'):
                     tencent_logger.info("  [-]视频上传完毕")
+                    report_progress(PHASE_UPLOAD_COMPLETE)
                     break
                 else:
                     tencent_logger.info("  [-] 正在上传视频中...")
@@ -263,5 +255,5 @@ class TencentVideo(object):
                 await page.locator('button:has-text("声明原创"):visible').click()
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        async with use_browser_pool():
+            await self.upload()
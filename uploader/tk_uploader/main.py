@@ -1,45 +1,19 @@
 # -*- coding: utf-8 -*-
-import re
 from datetime import datetime
 
 from playwright.async_api import Playwright, async_playwright
-import os
 import asyncio
+from myUtils.auth import check_cookie
 from uploader.tk_uploader.tk_config import Tk_Locator
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
 from utils.files_times import get_absolute_path
 from utils.log import tiktok_logger
 
 
-async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.firefox.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
-        await page.wait_for_load_state('networkidle')
-        try:
-            # 选择所有的 select 元素
-            select_elements = await page.query_selector_all('select')
-            for element in select_elements:
-                class_name = await element.get_attribute('class')
-                # 使用正则表达式匹配特定模式的 class 名称
-                if re.match(r'tiktok-.*-SelectFormContainer.*', class_name):
-                    tiktok_logger.error("[+] cookie expired")
-                    return False
-            tiktok_logger.success("[+] cookie valid")
-            return True
-        except:
-            tiktok_logger.success("[+] cookie valid")
-            return True
-
-
 async def tiktok_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tk_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await check_cookie(5, account_file):
         if not handle:
             return False
         tiktok_logger.info('[+] cookie file is not existed or expired. Now open the browser auto. Please login with your way(gmail phone, whatever, the cookie file will generated after login')
@@ -59,13 +33,13 @@ async def get_tiktok_cookie(account_file):
         browser = await playwright.firefox.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://www.tiktok.com/login?lang=en")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
 
 
 class TiktokVideo(object):
@@ -141,7 +115,7 @@ class TiktokVideo(object):
 
     async def upload(self, playwright: Playwright) -> None:
         browser = await playwright.firefox.launch(headless=False)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
+        context = await browser.new_context(storage_state=get_cookie_store().load(self.account_file))
         context = await set_init_script(context)
         page = await context.new_page()
 
@@ -175,7 +149,7 @@ class TiktokVideo(object):
 
         await self.click_publish(page)
 
-        await context.storage_state(path=f"{self.account_file}")  # save cookie
+        await get_cookie_store().save_context(context, f"{self.account_file}")  # save cookie
         tiktok_logger.info('  [-] update cookie！')
         await asyncio.sleep(2)  # close delay for look the video status
         # close all
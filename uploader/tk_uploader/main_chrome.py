@@ -4,46 +4,24 @@ from datetime import datetime
 import time
 from pathlib import Path
 
-from playwright.async_api import Playwright, async_playwright
-import os
+from playwright.async_api import async_playwright
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
+from myUtils.auth import check_cookie
 from uploader.tk_uploader.tk_config import Tk_Locator
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
+from utils.browser_pool import get_browser_pool, use_browser_pool
 from utils.files_times import get_absolute_path
+from utils.progress import report_progress, commit_progress, PHASE_PAGE_OPENED, PHASE_FILE_ATTACHED, PHASE_UPLOAD_COMPLETE, \
+    PHASE_METADATA_FILLED, PHASE_SCHEDULE_SET, PHASE_PUBLISH_CLICKED, PHASE_PUBLISH_CONFIRMED
 from utils.log import tiktok_logger
 
 
-async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload?lang=en")
-        await page.wait_for_load_state('networkidle')
-        try:
-            # 选择所有的 select 元素
-            select_elements = await page.query_selector_all('select')
-            for element in select_elements:
-                class_name = await element.get_attribute('class')
-                # 使用正则表达式匹配特定模式的 class 名称
-                if re.match(r'tiktok-.*-SelectFormContainer.*', class_name):
-                    tiktok_logger.error("[+] cookie expired")
-                    return False
-            tiktok_logger.success("[+] cookie valid")
-            return True
-        except:
-            tiktok_logger.success("[+] cookie valid")
-            return True
-
-
 async def tiktok_setup(account_file, handle=False):
     account_file = get_absolute_path(account_file, "tk_uploader")
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await check_cookie(5, account_file):
         if not handle:
             return False
         tiktok_logger.info('[+] cookie file is not existed or expired. Now open the browser auto. Please login with your way(gmail phone, whatever, the cookie file will generated after login')
@@ -63,13 +41,13 @@ async def get_tiktok_cookie(account_file):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://www.tiktok.com/login?lang=en")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
 
 
 class TiktokVideo(object):
@@ -81,6 +59,7 @@ class TiktokVideo(object):
         self.thumbnail_path = thumbnail_path
         self.account_file = account_file
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = False
         self.locator_base = None
         self.is_ai_content = is_ai_content
 
@@ -148,106 +127,96 @@ class TiktokVideo(object):
         file_chooser = await fc_info.value
         await file_chooser.set_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # Guard executable_path: only use if non-empty, exists and is executable; otherwise fallback.
-        launch_kwargs = {"headless": False}
-        path = (self.local_executable_path or "").strip()
-        try:
-            if path and os.path.isfile(path) and os.access(path, os.X_OK):
-                launch_kwargs["executable_path"] = path
-            else:
-                # Fallback to Playwright-managed browser or system Chrome channel
-                # Avoid passing an invalid path like '' which results in spawn . EACCES
-                tiktok_logger.info("[browser] LOCAL_CHROME_PATH 未设置或不可执行，使用默认浏览器/Chrome 渠道")
-                # launch_kwargs["channel"] = "chrome"
-        except Exception:
-            # Any unexpected error falls back to default
-            tiktok_logger.info("[browser] 解析浏览器路径失败，回退到默认设置")
-
-        browser = await playwright.chromium.launch(**launch_kwargs)
-        context = await browser.new_context(storage_state=f"{self.account_file}")
-        context = await set_init_script(context)
-        page = await context.new_page()
-        page.set_default_navigation_timeout(45000)
-
-        await self.change_language(page)
-        try:
-            if page.is_closed():
-                page = await context.new_page()
-                page.set_default_navigation_timeout(45000)
-        except Exception:
-            pass
-        await page.goto("https://www.tiktok.com/tiktokstudio/upload")
-        tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
-
-        await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=20000)
-
-        # 等待页面加载完成
-        try:
-            await page.wait_for_load_state('networkidle', timeout=30000)
-        except Exception:
-            tiktok_logger.info("Page load timeout (networkidle), continuing anyway...")
-        tiktok_logger.info("Page load state: networkidle (or timeout)")
-
-        try:
-            await self.wait_for_upload_surface(page)
-        except Exception as exc:
-            tiktok_logger.error(f"Upload surface not detected in time: {exc}")
-            await self.save_debug_artifacts(page, base_name='debug_upload_page')
-            raise Exception("Failed to load TikTok upload page") from exc
-
-        await self.choose_base_locator(page)
+    async def upload(self) -> None:
+        # 从浏览器池借用该账号的浏览器上下文（开启 profile 模式时复用账号的持久化 profile）
+        pool = get_browser_pool()
+        async with pool.account_context(self.account_file, headless=self.headless,
+                                        executable_path=self.local_executable_path) as context:
+            context = await set_init_script(context)
+            page = await context.new_page()
+            page.set_default_navigation_timeout(45000)
 
-        # 添加额外延迟确保页面完全加载
-        await page.wait_for_timeout(2000)
+            await self.change_language(page)
+            try:
+                if page.is_closed():
+                    page = await context.new_page()
+                    page.set_default_navigation_timeout(45000)
+            except Exception:
+                pass
+            await page.goto("https://www.tiktok.com/tiktokstudio/upload")
+            tiktok_logger.info(f'[+]Uploading-------{self.title}.mp4')
 
-        upload_button = self.locator_base.locator(
-            'button:has-text("Select video"):visible')
+            await page.wait_for_url("https://www.tiktok.com/tiktokstudio/upload", timeout=20000)
+            report_progress(PHASE_PAGE_OPENED)
 
-        try:
-            await upload_button.wait_for(state='visible', timeout=30000)  # 增加等待时间
-            tiktok_logger.info("Upload button is visible")
-        except Exception as e:
-            tiktok_logger.error(f"Upload button not found: {e}")
-            # 尝试查找其他可能的按钮
-            alternative_button = self.locator_base.locator('button[aria-label="Select video"]')
-            if await alternative_button.count():
-                tiktok_logger.info("Found alternative upload button")
-                upload_button = alternative_button
-            else:
-                # 截图以帮助调试
-                try:
-                    await page.screenshot(path='debug_button_missing.png')
-                    tiktok_logger.info("Screenshot saved to debug_button_missing.png")
-                except:
-                    pass
-                raise Exception("Upload button not found")
+            # 等待页面加载完成
+            try:
+                await page.wait_for_load_state('networkidle', timeout=30000)
+            except Exception:
+                tiktok_logger.info("Page load timeout (networkidle), continuing anyway...")
+            tiktok_logger.info("Page load state: networkidle (or timeout)")
 
-        async with page.expect_file_chooser() as fc_info:
-            await upload_button.click()
-        file_chooser = await fc_info.value
-        await file_chooser.set_files(self.file_path)
+            try:
+                await self.wait_for_upload_surface(page)
+            except Exception as exc:
+                tiktok_logger.error(f"Upload surface not detected in time: {exc}")
+                await self.save_debug_artifacts(page, base_name='debug_upload_page')
+                raise Exception("Failed to load TikTok upload page") from exc
 
-        await self.add_title_tags(page)
-        # detect upload status
-        await self.detect_upload_status(page)
-        if self.thumbnail_path:
-            tiktok_logger.info(f'[+] Uploading thumbnail file {self.title}.png')
-            await self.upload_thumbnails(page)
-        await self.configure_ai_generated_flag(page)
+            await self.choose_base_locator(page)
 
-        if self.publish_date != 0:
-            await self.set_schedule_time(page, self.publish_date)
+            # 添加额外延迟确保页面完全加载
+            await page.wait_for_timeout(2000)
 
-        await self.click_publish(page)
-        tiktok_logger.success(f"video_id: {await self.get_last_video_id(page)}")
+            upload_button = self.locator_base.locator(
+                'button:has-text("Select video"):visible')
 
-        await context.storage_state(path=f"{self.account_file}")  # save cookie
-        tiktok_logger.info('  [-] update cookie！')
-        await asyncio.sleep(2)  # close delay for look the video status
-        # close all
-        await context.close()
-        await browser.close()
+            try:
+                await upload_button.wait_for(state='visible', timeout=30000)  # 增加等待时间
+                tiktok_logger.info("Upload button is visible")
+            except Exception as e:
+                tiktok_logger.error(f"Upload button not found: {e}")
+                # 尝试查找其他可能的按钮
+                alternative_button = self.locator_base.locator('button[aria-label="Select video"]')
+                if await alternative_button.count():
+                    tiktok_logger.info("Found alternative upload button")
+                    upload_button = alternative_button
+                else:
+                    # 截图以帮助调试
+                    try:
+                        await page.screenshot(path='debug_button_missing.png')
+                        tiktok_logger.info("Screenshot saved to debug_button_missing.png")
+                    except:
+                        pass
+                    raise Exception("Upload button not found")
+
+            async with page.expect_file_chooser() as fc_info:
+                await upload_button.click()
+            file_chooser = await fc_info.value
+            await file_chooser.set_files(self.file_path)
+            report_progress(PHASE_FILE_ATTACHED)
+
+            await self.add_title_tags(page)
+            # detect upload status
+            await self.detect_upload_status(page)
+            if self.thumbnail_path:
+                tiktok_logger.info(f'[+] Uploading thumbnail file {self.title}.png')
+                await self.upload_thumbnails(page)
+            await self.configure_ai_generated_flag(page)
+
+            report_progress(PHASE_METADATA_FILLED)
+            if self.publish_date != 0:
+                await self.set_schedule_time(page, self.publish_date)
+                report_progress(PHASE_SCHEDULE_SET)
+
+            # 检查点落库后才点击发布，崩溃恢复时不会从更早的检查点重跑而重复发布
+            await commit_progress(PHASE_PUBLISH_CLICKED)
+            await self.click_publish(page)
+            tiktok_logger.success(f"video_id: {await self.get_last_video_id(page)}")
+
+            await pool.save_storage_state(context, self.account_file)  # save cookie
+            tiktok_logger.info('  [-] update cookie！')
+            await asyncio.sleep(2)  # close delay for look the video status
 
     async def add_title_tags(self, page):
         await self.ensure_modal_closed(page, wait_seconds=5)
@@ -555,6 +524,7 @@ class TiktokVideo(object):
 
                 await page.wait_for_url("https://www.tiktok.com/tiktokstudio/content",  timeout=30000)
                 tiktok_logger.success("  [-] video published success")
+                report_progress(PHASE_PUBLISH_CONFIRMED)
                 break
             except Exception as e:
                 tiktok_logger.exception(f"  [-] Exception: {e}")
@@ -577,6 +547,7 @@ class TiktokVideo(object):
                 if await self.locator_base.locator(
                         'div.button-group > button >> text=Post').get_attribute("disabled") is None:
                     tiktok_logger.info("  [-]video uploaded.")
+                    report_progress(PHASE_UPLOAD_COMPLETE)
                     await self.ensure_modal_closed(page, wait_seconds=5)
                     break
                 else:
@@ -764,5 +735,5 @@ class TiktokVideo(object):
             tiktok_logger.info("Using default page locator") 
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        async with use_browser_pool():
+            await self.upload()
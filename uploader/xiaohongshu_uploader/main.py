@@ -1,42 +1,21 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
-from playwright.async_api import Playwright, async_playwright, Page, TimeoutError as PlaywrightTimeoutError
-import os
+from playwright.async_api import async_playwright, Page, TimeoutError as PlaywrightTimeoutError
 import asyncio
 
 from conf import LOCAL_CHROME_PATH
+from myUtils.auth import check_cookie
 from utils.base_social_media import set_init_script
+from utils.cookie_store import get_cookie_store
+from utils.browser_pool import get_browser_pool, use_browser_pool
+from utils.progress import report_progress, commit_progress, PHASE_PAGE_OPENED, PHASE_FILE_ATTACHED, PHASE_UPLOAD_COMPLETE, \
+    PHASE_METADATA_FILLED, PHASE_SCHEDULE_SET, PHASE_PUBLISH_CLICKED, PHASE_PUBLISH_CONFIRMED
 from utils.log import xiaohongshu_logger
 
 
-async def cookie_auth(account_file):
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=account_file)
-        context = await set_init_script(context)
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.xiaohongshu.com/creator-micro/content/upload")
-        try:
-            await page.wait_for_url("https://creator.xiaohongshu.com/creator-micro/content/upload", timeout=5000)
-        except:
-            print("[+] 等待5秒 cookie 失效")
-            await context.close()
-            await browser.close()
-            return False
-        # 2024.06.17 抖音创作者中心改版
-        if await page.get_by_text('手机号登录').count() or await page.get_by_text('扫码登录').count():
-            print("[+] 等待5秒 cookie 失效")
-            return False
-        else:
-            print("[+] cookie 有效")
-            return True
-
-
 async def xiaohongshu_setup(account_file, handle=False):
-    if not os.path.exists(account_file) or not await cookie_auth(account_file):
+    if not get_cookie_store().exists(account_file) or not await check_cookie(1, account_file):
         if not handle:
             # Todo alert message
             return False
@@ -54,13 +33,13 @@ async def xiaohongshu_cookie_gen(account_file):
         browser = await playwright.chromium.launch(**options)
         # Setup context however you like.
         context = await browser.new_context()  # Pass any options
-        context = await set_init_script(context)
+        context = await set_init_script(context, block_resources=False)
         # Pause the page, and start recording manually.
         page = await context.new_page()
         await page.goto("https://creator.xiaohongshu.com/")
         await page.pause()
         # 点击调试器的继续，保存cookie
-        await context.storage_state(path=account_file)
+        await get_cookie_store().save_context(context, account_file)
 
 
 class XiaoHongShuVideo(object):
@@ -72,6 +51,9 @@ class XiaoHongShuVideo(object):
         self.account_file = account_file
         self.date_format = '%Y年%m月%d日 %H:%M'
         self.local_executable_path = LOCAL_CHROME_PATH
+        self.headless = False
+        self.upload_url = "https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video"
+        self.context_options = {"viewport": {"width": 1600, "height": 900}}
         self.thumbnail_path = thumbnail_path
 
     async def set_schedule_time_xiaohongshu(self, page, publish_date):
@@ -105,178 +87,175 @@ class XiaoHongShuVideo(object):
         xiaohongshu_logger.info('视频出错了，重新上传中')
         await page.locator('div.progress-div [class^="upload-btn-input"]').set_input_files(self.file_path)
 
-    async def upload(self, playwright: Playwright) -> None:
-        # 使用 Chromium 浏览器启动一个浏览器实例
-        if self.local_executable_path:
-            browser = await playwright.chromium.launch(headless=False, executable_path=self.local_executable_path)
-        else:
-            browser = await playwright.chromium.launch(headless=False)
-        # 创建一个浏览器上下文，使用指定的 cookie 文件
-        context = await browser.new_context(
-            viewport={"width": 1600, "height": 900},
-            storage_state=f"{self.account_file}"
-        )
-        context = await set_init_script(context)
-
-        # 创建一个新的页面
-        page = await context.new_page()
-        # 访问指定的 URL
-        await page.goto("https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video")
-        xiaohongshu_logger.info(f'[+]正在上传-------{self.title}.mp4')
-        # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
-        xiaohongshu_logger.info(f'[-] 正在打开主页...')
-        await page.wait_for_url("https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video")
-        # 点击 "上传视频" 按钮
-        await page.locator("div[class^='upload-content'] input[class='upload-input']").set_input_files(self.file_path)
-
-        # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
-        while True:
-            try:
-                # 等待upload-input元素出现
-                upload_input = await page.wait_for_selector('input.upload-input', timeout=3000)
-                # 获取下一个兄弟元素
-                preview_new = await upload_input.query_selector(
-                    'xpath=following-sibling::div[contains(@class, "preview-new")]')
-                if preview_new:
-                    # 在preview-new元素中查找包含"上传成功"的stage元素
-                    stage_elements = await preview_new.query_selector_all('div.stage')
-                    upload_success = False
-                    for stage in stage_elements:
-                        text_content = await page.evaluate('(element) => element.textContent', stage)
-                        if '上传成功' in text_content:
-                            upload_success = True
-                            break
-                    if upload_success:
-                        xiaohongshu_logger.info("[+] 检测到上传成功标识!")
-                        break  # 成功检测到上传成功后跳出循环
+    async def upload(self) -> None:
+        # 从浏览器池借用该账号的浏览器上下文（开启 profile 模式时复用账号的持久化 profile）
+        pool = get_browser_pool()
+        async with pool.account_context(self.account_file, headless=self.headless,
+                                        executable_path=self.local_executable_path, **self.context_options) as context:
+            context = await set_init_script(context)
+
+            # 打开上传页（该任务已被预热时直接复用加载好的页面）
+            page = await pool.open_page(context, self.upload_url)
+            xiaohongshu_logger.info(f'[+]正在上传-------{self.title}.mp4')
+            # 等待页面跳转到指定的 URL，没进入，则自动等待到超时
+            xiaohongshu_logger.info(f'[-] 正在打开主页...')
+            await page.wait_for_url("https://creator.xiaohongshu.com/publish/publish?from=homepage&target=video")
+            report_progress(PHASE_PAGE_OPENED)
+            # 点击 "上传视频" 按钮
+            await page.locator("div[class^='upload-content'] input[class='upload-input']").set_input_files(self.file_path)
+            report_progress(PHASE_FILE_ATTACHED)
+
+            # 等待页面跳转到指定的 URL 2025.01.08修改在原有基础上兼容两种页面
+            while True:
+                try:
+                    # 等待upload-input元素出现
+                    upload_input = await page.wait_for_selector('input.upload-input', timeout=3000)
+                    # 获取下一个兄弟元素
+                    preview_new = await upload_input.query_selector(
+                        'xpath=following-sibling::div[contains(@class, "preview-new")]')
+                    if preview_new:
+                        # 在preview-new元素中查找包含"上传成功"的stage元素
+                        stage_elements = await preview_new.query_selector_all('div.stage')
+                        upload_success = False
+                        for stage in stage_elements:
+                            text_content = await page.evaluate('(element) => element.textContent', stage)
+                            if '上传成功' in text_content:
+                                upload_success = True
+                                break
+                        if upload_success:
+                            xiaohongshu_logger.info("[+] 检测到上传成功标识!")
+                            report_progress(PHASE_UPLOAD_COMPLETE)
+                            break  # 成功检测到上传成功后跳出循环
+                        else:
+                            print("  [-] 未找到上传成功标识，继续等待...")
                     else:
-                        print("  [-] 未找到上传成功标识，继续等待...")
-                else:
-                    print("  [-] 未找到预览元素，继续等待...")
-                    await asyncio.sleep(1)
-            except Exception as e:
-                print(f"  [-] 检测过程出错: {str(e)}，重新尝试...")
-                await asyncio.sleep(0.5)  # 等待0.5秒后重新尝试
-
-        # 填充标题和话题
-        # 检查是否存在包含输入框的元素
-        # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
-        await asyncio.sleep(1)
-        xiaohongshu_logger.info(f'  [-] 正在填充标题和话题...')
-        title_selectors = [
-            "div.plugin.title-container input.d-text",
-            "input.d-text[placeholder*='填写标题']",
-            "input[placeholder*='填写标题']",
-        ]
-        title_container = await self.locate_first_visible(page, title_selectors, timeout=15000)
-        if title_container:
-            await title_container.fill(self.title[:30])
-        else:
-            titlecontainer = page.locator(".notranslate")
-            await titlecontainer.click()
-            await page.keyboard.press("Backspace")
-            await page.keyboard.press("Control+KeyA")
-            await page.keyboard.press("Delete")
-            await page.keyboard.type(self.title)
-            await page.keyboard.press("Enter")
-        if self.tags:
-            tag_editor_selectors = [
-                ".ql-editor",  # 旧版编辑器
-                "[contenteditable='true'][data-placeholder*='话题']",
-                "[contenteditable='true'][data-placeholder*='话题内容']",
-                "[contenteditable='true'][data-placeholder*='正文']",
-                ".tiptap.ProseMirror[contenteditable='true']",
-                "[contenteditable='true'].ProseMirror",
-                "div.tiptap-container [contenteditable='true']",
-                "div[class*='topic'] [contenteditable='true']",
+                        print("  [-] 未找到预览元素，继续等待...")
+                        await asyncio.sleep(1)
+                except Exception as e:
+                    print(f"  [-] 检测过程出错: {str(e)}，重新尝试...")
+                    await asyncio.sleep(0.5)  # 等待0.5秒后重新尝试
+
+            # 填充标题和话题
+            # 检查是否存在包含输入框的元素
+            # 这里为了避免页面变化，故使用相对位置定位：作品标题父级右侧第一个元素的input子元素
+            await asyncio.sleep(1)
+            xiaohongshu_logger.info(f'  [-] 正在填充标题和话题...')
+            title_selectors = [
+                "div.plugin.title-container input.d-text",
+                "input.d-text[placeholder*='填写标题']",
+                "input[placeholder*='填写标题']",
             ]
-            editor_locator = await self.locate_first_visible(page, tag_editor_selectors, timeout=15000)
-            if editor_locator is None:
-                raise RuntimeError("未找到小红书话题输入框，请检查页面结构是否发生变化。")
-
-            await editor_locator.click()
-            try:
-                await editor_locator.press("Control+KeyA")
-                await editor_locator.press("Delete")
-            except Exception:
-                pass
-            for index, tag in enumerate(self.tags, start=1):
-                await editor_locator.type("#" + tag)
-                await editor_locator.press("Space")
-            xiaohongshu_logger.info(f'总共添加{len(self.tags)}个话题')
-
-        # while True:
-        #     # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
-        #     try:
-        #         #  新版：定位重新上传
-        #         number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
-        #         if number > 0:
-        #             xiaohongshu_logger.success("  [-]视频上传完毕")
-        #             break
-        #         else:
-        #             xiaohongshu_logger.info("  [-] 正在上传视频中...")
-        #             await asyncio.sleep(2)
-
-        #             if await page.locator('div.progress-div > div:has-text("上传失败")').count():
-        #                 xiaohongshu_logger.error("  [-] 发现上传出错了... 准备重试")
-        #                 await self.handle_upload_error(page)
-        #     except:
-        #         xiaohongshu_logger.info("  [-] 正在上传视频中...")
-        #         await asyncio.sleep(2)
+            title_container = await self.locate_first_visible(page, title_selectors, timeout=15000)
+            if title_container:
+                await title_container.fill(self.title[:30])
+            else:
+                titlecontainer = page.locator(".notranslate")
+                await titlecontainer.click()
+                await page.keyboard.press("Backspace")
+                await page.keyboard.press("Control+KeyA")
+                await page.keyboard.press("Delete")
+                await page.keyboard.type(self.title)
+                await page.keyboard.press("Enter")
+            if self.tags:
+                tag_editor_selectors = [
+                    ".ql-editor",  # 旧版编辑器
+                    "[contenteditable='true'][data-placeholder*='话题']",
+                    "[contenteditable='true'][data-placeholder*='话题内容']",
+                    "[contenteditable='true'][data-placeholder*='正文']",
+                    ".tiptap.ProseMirror[contenteditable='true']",
+                    "[contenteditable='true'].ProseMirror",
+                    "div.tiptap-container [contenteditable='true']",
+                    "div[class*='topic'] [contenteditable='true']",
+                ]
+                editor_locator = await self.locate_first_visible(page, tag_editor_selectors, timeout=15000)
+                if editor_locator is None:
+                    raise RuntimeError("未找到小红书话题输入框，请检查页面结构是否发生变化。")
+
+                await editor_locator.click()
+                try:
+                    await editor_locator.press("Control+KeyA")
+                    await editor_locator.press("Delete")
+                except Exception:
+                    pass
+                for index, tag in enumerate(self.tags, start=1):
+                    await editor_locator.type("#" + tag)
+                    await editor_locator.press("Space")
+                xiaohongshu_logger.info(f'总共添加{len(self.tags)}个话题')
+
+            # while True:
+            #     # 判断重新上传按钮是否存在，如果不存在，代表视频正在上传，则等待
+            #     try:
+            #         #  新版：定位重新上传
+            #         number = await page.locator('[class^="long-card"] div:has-text("重新上传")').count()
+            #         if number > 0:
+            #             xiaohongshu_logger.success("  [-]视频上传完毕")
+            #             break
+            #         else:
+            #             xiaohongshu_logger.info("  [-] 正在上传视频中...")
+            #             await asyncio.sleep(2)
+
+            #             if await page.locator('div.progress-div > div:has-text("上传失败")').count():
+            #                 xiaohongshu_logger.error("  [-] 发现上传出错了... 准备重试")
+            #                 await self.handle_upload_error(page)
+            #     except:
+            #         xiaohongshu_logger.info("  [-] 正在上传视频中...")
+            #         await asyncio.sleep(2)
         
-        # 上传视频封面
-        # await self.set_thumbnail(page, self.thumbnail_path)
-
-        # 更换可见元素
-        # await self.set_location(page, "青岛市")
-
-        # # 頭條/西瓜
-        # third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
-        # # 定位是否有第三方平台
-        # if await page.locator(third_part_element).count():
-        #     # 检测是否是已选中状态
-        #     if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
-        #         await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
-
-        if self.publish_date != 0:
-            await self.set_schedule_time_xiaohongshu(page, self.publish_date)
-
-        # 判断视频是否发布成功
-        while True:
-            try:
-                # 等待包含"定时发布"文本的button元素出现并点击
-                if self.publish_date != 0:
-                    publish_selectors = [
-                        "button:has-text(\"定时发布\")",
-                        "button.d-button:has-text(\"定时发布\")",
-                    ]
-                else:
-                    publish_selectors = [
-                        "button.publishBtn",
-                        "button.d-button:has-text(\"发布\")",
-                        "button:has-text(\"发布\")",
-                    ]
-                publish_button = await self.locate_first_visible(page, publish_selectors, timeout=15000)
-                if publish_button is None:
-                    raise RuntimeError("未找到发布按钮，请检查页面结构是否发生变化。")
-                await publish_button.click()
-                await page.wait_for_url(
-                    "https://creator.xiaohongshu.com/publish/success?**",
-                    timeout=10000
-                )  # 如果自动跳转到作品页面，则代表发布成功
-                xiaohongshu_logger.success("  [-]视频发布成功")
-                break
-            except:
-                xiaohongshu_logger.info("  [-] 视频正在发布中...")
-                await page.screenshot(full_page=True)
-                await asyncio.sleep(0.5)
-
-        await context.storage_state(path=self.account_file)  # 保存cookie
-        xiaohongshu_logger.success('  [-]cookie更新完毕！')
-        await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
-        # 关闭浏览器上下文和浏览器实例
-        await context.close()
-        await browser.close()
+            # 上传视频封面
+            # await self.set_thumbnail(page, self.thumbnail_path)
+
+            # 更换可见元素
+            # await self.set_location(page, "青岛市")
+
+            # # 頭條/西瓜
+            # third_part_element = '[class^="info"] > [class^="first-part"] div div.semi-switch'
+            # # 定位是否有第三方平台
+            # if await page.locator(third_part_element).count():
+            #     # 检测是否是已选中状态
+            #     if 'semi-switch-checked' not in await page.eval_on_selector(third_part_element, 'div => div.className'):
+            #         await page.locator(third_part_element).locator('input.semi-switch-native-control').click()
+
+            report_progress(PHASE_METADATA_FILLED)
+            if self.publish_date != 0:
+                await self.set_schedule_time_xiaohongshu(page, self.publish_date)
+                report_progress(PHASE_SCHEDULE_SET)
+
+            # 检查点落库后才点击发布，崩溃恢复时不会从更早的检查点重跑而重复发布
+            await commit_progress(PHASE_PUBLISH_CLICKED)
+            # 判断视频是否发布成功
+            while True:
+                try:
+                    # 等待包含"定时发布"文本的button元素出现并点击
+                    if self.publish_date != 0:
+                        publish_selectors = [
+                            "button:has-text(\"定时发布\")",
+                            "button.d-button:has-text(\"定时发布\")",
+                        ]
+                    else:
+                        publish_selectors = [
+                            "button.publishBtn",
+                            "button.d-button:has-text(\"发布\")",
+                            "button:has-text(\"发布\")",
+                        ]
+                    publish_button = await self.locate_first_visible(page, publish_selectors, timeout=15000)
+                    if publish_button is None:
+                        raise RuntimeError("未找到发布按钮，请检查页面结构是否发生变化。")
+                    await publish_button.click()
+                    await page.wait_for_url(
+                        "https://creator.xiaohongshu.com/publish/success?**",
+                        timeout=10000
+                    )  # 如果自动跳转到作品页面，则代表发布成功
+                    xiaohongshu_logger.success("  [-]视频发布成功")
+                    report_progress(PHASE_PUBLISH_CONFIRMED)
+                    break
+                except:
+                    xiaohongshu_logger.info("  [-] 视频正在发布中...")
+                    await page.screenshot(full_page=True)
+                    await asyncio.sleep(0.5)
+
+            await pool.save_storage_state(context, self.account_file)  # 保存cookie
+            xiaohongshu_logger.success('  [-]cookie更新完毕！')
+            await asyncio.sleep(2)  # 这里延迟是为了方便眼睛直观的观看
     
     async def set_thumbnail(self, page: Page, thumbnail_path: str):
         if thumbnail_path:
@@ -412,7 +391,7 @@ class XiaoHongShuVideo(object):
         return None
 
     async def main(self):
-        async with async_playwright() as playwright:
-            await self.upload(playwright)
+        async with use_browser_pool():
+            await self.upload()
 
 
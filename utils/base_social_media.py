@@ -2,6 +2,7 @@ from pathlib import Path
 from typing import List
 
 from conf import BASE_DIR
+from utils.resource_policy import apply_resource_policy
 
 SOCIAL_MEDIA_DOUYIN = "douyin"
 SOCIAL_MEDIA_TENCENT = "tencent"
@@ -18,7 +19,18 @@ def get_cli_action() -> List[str]:
     return ["upload", "login", "watch"]
 
 
-async def set_init_script(context):
+async def set_init_script(context, block_resources: bool = True):
+    """
+    为上下文注入反检测脚本；block_resources 为 True 时同时启用资源路由策略（见 utils.resource_policy），
+    拦截自动化流程用不到的字体、视频预览和埋点（持久化 profile 的上下文不拦截，以保留 HTTP 缓存）。
+    需要人工扫码登录的上下文应传 False，保证二维码等页面资源完整加载。
+    """
+    # 持久化 profile 的上下文会被多个任务复用，init script 只注入一次
+    if getattr(context, "_sau_stealth_injected", False):
+        return context
     stealth_js_path = Path(BASE_DIR / "utils/stealth.min.js")
     await context.add_init_script(path=stealth_js_path)
+    if block_resources:
+        await apply_resource_policy(context)
+    context._sau_stealth_injected = True
     return context
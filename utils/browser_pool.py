@@ -0,0 +1,589 @@
+import asyncio
+import os
+import shutil
+import time
+import weakref
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from playwright.async_api import async_playwright, Browser, BrowserContext
+
+import psutil
+
+from conf import BASE_DIR
+from utils.base_social_media import set_init_script
+from utils.log import browser_logger
+from utils.cookie_store import get_cookie_store
+
+try:
+    from conf import BROWSER_POOL_SETTINGS
+except ImportError:
+    BROWSER_POOL_SETTINGS = {}
+
+try:
+    from conf import BROWSER_PROFILE_SETTINGS
+except ImportError:
+    BROWSER_PROFILE_SETTINGS = {}
+
+try:
+    from conf import PREWARM_SETTINGS
+except ImportError:
+    PREWARM_SETTINGS = {}
+
+# 记录最后一次导入到该 profile 的登录态变化标记（CookieStore.stamp）
+_PROFILE_SEED_MARKER = ".sau_seeded"
+
+
+def normalize_executable_path(executable_path) -> Optional[str]:
+    """只有路径存在且可执行时才使用本地浏览器，否则回退到 Playwright 自带的 Chromium（避免 spawn . EACCES）。"""
+    path = str(executable_path or "").strip()
+    if path and os.path.isfile(path) and os.access(path, os.X_OK):
+        return path
+    return None
+
+
+class _BrowserEntry(object):
+    def __init__(self, key: Tuple, browser: Browser):
+        self.key = key
+        self.browser = browser
+        self.served = 0
+        self.active = 0
+        self.retired = False
+
+
+def get_profiles_dir() -> Path:
+    return Path(BROWSER_PROFILE_SETTINGS.get("dir") or BASE_DIR / "browserProfiles")
+
+
+def profile_name(account_file) -> str:
+    """profile 目录名取 cookie 文件名（即 user_info.filePath 去掉扩展名），一个账号一个 profile。"""
+    return Path(account_file).stem
+
+
+def remove_profile(account_file) -> bool:
+    """删除账号对应的 profile 目录，账号被删除时调用。"""
+    profile_dir = get_profiles_dir() / profile_name(account_file)
+    if not profile_dir.is_dir():
+        return False
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    return True
+
+
+def prune_profiles(account_files, retention_days: Optional[float] = None) -> int:
+    """
+    清理冷 profile：删除不属于 account_files 中任何账号的目录，以及超过 retention_days 天未使用的目录。
+    返回删除的目录数。
+    """
+    profiles_dir = get_profiles_dir()
+    if not profiles_dir.is_dir():
+        return 0
+    if retention_days is None:
+        retention_days = BROWSER_PROFILE_SETTINGS.get("retention_days", 30)
+    keep = {profile_name(account_file) for account_file in account_files}
+    deadline = time.time() - float(retention_days) * 86400 if retention_days else None
+    removed = 0
+    for profile_dir in profiles_dir.iterdir():
+        if not profile_dir.is_dir():
+            continue
+        if profile_dir.name in keep and (deadline is None or profile_dir.stat().st_mtime >= deadline):
+            continue
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        removed += 1
+    if removed:
+        browser_logger.info(f"[+] 已清理 {removed} 个冷 profile")
+    return removed
+
+
+class _ProfileEntry(object):
+    def __init__(self, name: str, path: Path, key: Tuple, context: BrowserContext, account_file):
+        self.name = name
+        self.path = path
+        self.key = key
+        self.context = context
+        self.account_file = account_file
+        self.active = False
+        self.dirty = False
+        self.base_version = None
+        self.last_used = time.monotonic()
+
+
+class _WarmEntry(object):
+    """为排队中的任务提前打开并加载好上传页的上下文。"""
+
+    def __init__(self, name: str, key: Tuple, context: BrowserContext, page, url: str,
+                 browser_entry: Optional[_BrowserEntry] = None):
+        self.name = name
+        self.key = key
+        self.context = context
+        self.page = page
+        self.url = url
+        # 非 profile 模式下预热的上下文占用的浏览器，上下文关闭时归还
+        self.browser_entry = browser_entry
+        self.navigation = None
+
+
+class BrowserPool(object):
+    """
+    长期存活的浏览器池，按 (executable_path, headless) 复用 Chromium 进程，每次借出全新的 BrowserContext。
+    浏览器崩溃或断开后自动重启；单个浏览器累计借出 max_contexts_per_browser 个上下文后退役，
+    待其上正在使用的上下文全部归还后关闭，由新启动的实例接替。
+    Playwright 对象绑定创建它的事件循环，因此每个事件循环各有一个池，见 get_browser_pool。
+    """
+
+    def __init__(self, max_contexts_per_browser: Optional[int] = None, launch_args=None,
+                 profiles_enabled: Optional[bool] = None):
+        if max_contexts_per_browser is None:
+            max_contexts_per_browser = BROWSER_POOL_SETTINGS.get("max_contexts_per_browser", 100)
+        self.max_contexts_per_browser = max(1, int(max_contexts_per_browser))
+        self.launch_args = list(launch_args if launch_args is not None else BROWSER_POOL_SETTINGS.get("args", []))
+        self.users = 0
+        self._playwright_manager = None
+        self._playwright = None
+        self._entries: Dict[Tuple, _BrowserEntry] = {}
+        self._lock = asyncio.Lock()
+        self._closed = False
+        if profiles_enabled is None:
+            profiles_enabled = bool(BROWSER_PROFILE_SETTINGS.get("enabled", False))
+        self.profiles_enabled = profiles_enabled
+        self.max_open_profiles = max(1, int(BROWSER_PROFILE_SETTINGS.get("max_open", 4)))
+        self.profile_idle_seconds = float(BROWSER_PROFILE_SETTINGS.get("idle_seconds", 600))
+        self._profiles: Dict[str, _ProfileEntry] = {}
+        self._profile_locks: Dict[str, asyncio.Lock] = {}
+        self._evictions = set()
+        self.max_warm_pages = max(0, int(PREWARM_SETTINGS.get("max_pages", 2)))
+        self.warm_min_available_mb = float(PREWARM_SETTINGS.get("min_available_mb", 1024))
+        self.warm_ttl = float(PREWARM_SETTINGS.get("ttl", 300))
+        self._warm: Dict[str, _WarmEntry] = {}
+        self._warming = set()
+        self._warm_pages: Dict[int, _WarmEntry] = {}
+        # 上下文创建时读取的 cookie 版本号，保存时据此判断期间是否被其他任务写过
+        self._base_versions: Dict[int, int] = {}
+
+    async def _ensure_playwright(self):
+        if self._playwright is None:
+            self._playwright_manager = async_playwright()
+            self._playwright = await self._playwright_manager.start()
+        return self._playwright
+
+    async def _launch(self, key: Tuple) -> _BrowserEntry:
+        executable_path, headless = key
+        playwright = await self._ensure_playwright()
+        options = {"headless": headless}
+        if executable_path:
+            options["executable_path"] = executable_path
+        if self.launch_args:
+            options["args"] = self.launch_args
+        browser = await playwright.chromium.launch(**options)
+        entry = _BrowserEntry(key, browser)
+        browser.on("disconnected", lambda _: self._on_disconnected(entry))
+        browser_logger.info(f"[+] 启动浏览器 headless={headless} executable={executable_path or 'chromium'}")
+        return entry
+
+    def _on_disconnected(self, entry: _BrowserEntry):
+        entry.retired = True
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+            if not self._closed:
+                browser_logger.warning("[-] 浏览器已断开，下次借用时将重新启动")
+
+    async def _acquire(self, key: Tuple) -> _BrowserEntry:
+        async with self._lock:
+            if self._closed:
+                raise RuntimeError("browser pool is closed")
+            entry = self._entries.get(key)
+            if entry is None or entry.retired or not entry.browser.is_connected():
+                entry = await self._launch(key)
+                self._entries[key] = entry
+            entry.served += 1
+            entry.active += 1
+            if entry.served >= self.max_contexts_per_browser:
+                # 达到回收阈值：不再借出新的上下文，归还完毕后关闭
+                entry.retired = True
+                del self._entries[key]
+            return entry
+
+    async def _release(self, entry: _BrowserEntry):
+        entry.active -= 1
+        if entry.retired and entry.active <= 0 and entry.browser.is_connected():
+            browser_logger.info(f"[+] 浏览器已服务 {entry.served} 个上下文，回收重启")
+            try:
+                await entry.browser.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def new_context(self, storage_state=None, headless: bool = True, executable_path=None, **context_kwargs):
+        """借出一个新的 BrowserContext，退出时自动关闭；浏览器已崩溃时重启一次后重试。"""
+        key = (normalize_executable_path(executable_path), bool(headless))
+        base_version = None
+        if isinstance(storage_state, (str, os.PathLike)):
+            # 通过 cookie 存储读取（同时压缩），记下版本号供保存时使用；读取失败时仍交给 Playwright 报错
+            state, base_version = await get_cookie_store().aload(storage_state)
+            storage_state = state if state is not None else str(storage_state)
+        if storage_state is not None:
+            context_kwargs["storage_state"] = storage_state
+        entry = await self._acquire(key)
+        try:
+            context = await entry.browser.new_context(**context_kwargs)
+        except Exception:
+            await self._release(entry)
+            if entry.browser.is_connected():
+                raise
+            entry = await self._acquire(key)
+            try:
+                context = await entry.browser.new_context(**context_kwargs)
+            except Exception:
+                await self._release(entry)
+                raise
+        if base_version is not None:
+            self._base_versions[id(context)] = base_version
+        try:
+            yield context
+        finally:
+            self._base_versions.pop(id(context), None)
+            try:
+                await context.close()
+            except Exception:
+                pass
+            await self._release(entry)
+
+    @asynccontextmanager
+    async def account_context(self, account_file, headless: bool = True, executable_path=None, **context_kwargs):
+        """
+        借出账号专用的 BrowserContext。开启 BROWSER_PROFILE_SETTINGS['enabled'] 时使用该账号的持久化 profile
+        （HTTP 缓存、Service Worker、IndexedDB 跨任务保留），归还后保持打开以便下个任务复用；
+        未开启时等同于 new_context(storage_state=account_file)。
+        """
+        name = profile_name(account_file)
+        key = (normalize_executable_path(executable_path), bool(headless))
+        if not self.profiles_enabled:
+            warm = await self._take_warm(name, key)
+            if warm is None:
+                async with self.new_context(storage_state=account_file, headless=headless,
+                                            executable_path=executable_path, **context_kwargs) as context:
+                    yield context
+                return
+            # 直接使用预热好的上下文，上传页已在加载中或已加载完成
+            self._warm_pages[id(warm.context)] = warm
+            try:
+                yield warm.context
+            finally:
+                self._warm_pages.pop(id(warm.context), None)
+                await self._close_warm(warm)
+            return
+
+        # 同一 profile 目录同时只能被一个浏览器进程打开，借用期间独占
+        lock = self._profile_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            entry = await self._open_profile(name, account_file, key, context_kwargs)
+            warm = await self._take_warm(name, key)
+            if warm is not None and warm.context is entry.context:
+                self._warm_pages[id(entry.context)] = warm
+            entry.active = True
+            try:
+                yield entry.context
+            finally:
+                self._warm_pages.pop(id(entry.context), None)
+                entry.active = False
+                entry.last_used = time.monotonic()
+                await self._reset_pages(entry)
+                self._schedule_idle_eviction(entry)
+
+    async def open_page(self, context, url: str):
+        """打开上传页：该上下文有预热好的同一页面时直接复用，否则新建页面并访问 url。"""
+        warm = self._warm_pages.pop(id(context), None)
+        if warm is not None and warm.url == url and not warm.page.is_closed():
+            try:
+                await warm.navigation
+                browser_logger.info(f"[+] 使用预热页面 {url}")
+                return warm.page
+            except Exception as exc:
+                browser_logger.warning(f"[-] 预热页面不可用，重新打开: {exc}")
+        page = await context.new_page()
+        await page.goto(url)
+        return page
+
+    def _can_prewarm(self) -> bool:
+        """内存上限：预热页面数不超过 max_pages，且系统可用内存不低于 min_available_mb。"""
+        if len(self._warm) + len(self._warming) >= self.max_warm_pages:
+            return False
+        return psutil.virtual_memory().available >= self.warm_min_available_mb * 1024 * 1024
+
+    async def prewarm(self, account_file, url: str, headless: bool = True, executable_path=None,
+                      **context_kwargs) -> bool:
+        """
+        为排队中的任务提前创建上下文、注入 stealth 脚本并打开上传页，
+        之后该账号的 account_context 会直接取用。返回是否新预热了一个页面。
+        """
+        name = profile_name(account_file)
+        key = (normalize_executable_path(executable_path), bool(headless))
+        if self._closed or name in self._warm or name in self._warming or not self._can_prewarm():
+            return False
+        self._warming.add(name)
+        try:
+            if self.profiles_enabled:
+                lock = self._profile_locks.setdefault(name, asyncio.Lock())
+                if lock.locked():
+                    # 该账号正在上传，profile 被占用
+                    return False
+                async with lock:
+                    entry = await self._open_profile(name, account_file, key, context_kwargs)
+                    context = await set_init_script(entry.context)
+                    page = context.pages[0] if context.pages else await context.new_page()
+                    warm = _WarmEntry(name, key, context, page, url)
+                    # profile 模式在持有锁期间完成导航，避免与上传同时操作同一页面
+                    return await self._load_warm(warm)
+            browser_entry = await self._acquire(key)
+            try:
+                state, base_version = await get_cookie_store().aload(account_file)
+                options = dict(context_kwargs)
+                options["storage_state"] = state if state is not None else str(account_file)
+                context = await browser_entry.browser.new_context(**options)
+                self._base_versions[id(context)] = base_version
+                context = await set_init_script(context)
+                page = await context.new_page()
+            except Exception:
+                await self._release(browser_entry)
+                raise
+            return await self._load_warm(_WarmEntry(name, key, context, page, url, browser_entry))
+        finally:
+            self._warming.discard(name)
+
+    async def _load_warm(self, warm: _WarmEntry) -> bool:
+        warm.navigation = asyncio.ensure_future(warm.page.goto(warm.url))
+        self._warm[warm.name] = warm
+        try:
+            await asyncio.shield(warm.navigation)
+        except Exception as exc:
+            browser_logger.warning(f"[-] 预热 {warm.name} 失败: {exc}")
+            if self._warm.get(warm.name) is warm:
+                del self._warm[warm.name]
+                await self._close_warm(warm)
+            return False
+        browser_logger.info(f"[+] 已预热 {warm.name}: {warm.url}")
+        if self.warm_ttl > 0:
+            asyncio.get_running_loop().call_later(self.warm_ttl, self._on_warm_expired, warm)
+        return True
+
+    async def _take_warm(self, name: str, key: Tuple) -> Optional[_WarmEntry]:
+        warm = self._warm.pop(name, None)
+        if warm is not None and warm.key != key:
+            await self._close_warm(warm)
+            return None
+        return warm
+
+    async def _close_warm(self, warm: _WarmEntry):
+        if warm.browser_entry is None:
+            # profile 模式下上下文归 profile 管理，这里不关闭
+            return
+        self._base_versions.pop(id(warm.context), None)
+        try:
+            await warm.context.close()
+        except Exception:
+            pass
+        await self._release(warm.browser_entry)
+
+    def _on_warm_expired(self, warm: _WarmEntry):
+        """预热页面超过 ttl 未被取用时丢弃，避免长期占用内存或 cookie 过旧。"""
+        if self._warm.get(warm.name) is not warm:
+            return
+        del self._warm[warm.name]
+        task = asyncio.ensure_future(self._close_warm(warm))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def _open_profile(self, name: str, account_file, key: Tuple, context_kwargs) -> _ProfileEntry:
+        entry = self._profiles.get(name)
+        if entry is not None and (entry.key != key or not self._profile_alive(entry)):
+            # headless 或浏览器路径不同（例如 cookie 校验后紧接着上传），需要以新参数重新打开
+            await self._close_profile(entry)
+            entry = None
+        if entry is None:
+            await self._evict_lru_profiles()
+            entry = await self._launch_profile(name, account_file, key, context_kwargs)
+            self._profiles[name] = entry
+        await self._seed_profile(entry)
+        os.utime(entry.path)
+        return entry
+
+    async def _launch_profile(self, name: str, account_file, key: Tuple, context_kwargs) -> _ProfileEntry:
+        if self._closed:
+            raise RuntimeError("browser pool is closed")
+        executable_path, headless = key
+        playwright = await self._ensure_playwright()
+        profile_dir = get_profiles_dir() / name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        options = dict(context_kwargs)
+        options["headless"] = headless
+        if executable_path:
+            options["executable_path"] = executable_path
+        if self.launch_args:
+            options["args"] = self.launch_args
+        context = await playwright.chromium.launch_persistent_context(str(profile_dir), **options)
+        entry = _ProfileEntry(name, profile_dir, key, context, account_file)
+        context.on("close", lambda _: self._on_profile_closed(entry))
+        browser_logger.info(f"[+] 打开 profile {name} headless={headless}")
+        return entry
+
+    async def _seed_profile(self, entry: _ProfileEntry):
+        """cookie 存储中的登录态与上次导入时不同（首次使用或重新登录过）时，把其中的 cookie 导入 profile。"""
+        store = get_cookie_store()
+        marker = entry.path / _PROFILE_SEED_MARKER
+        stamp = await asyncio.to_thread(store.stamp, entry.account_file)
+        if stamp is None:
+            return
+        if marker.exists() and marker.read_text(encoding="utf-8").strip() == str(stamp):
+            return
+        try:
+            state, entry.base_version = await store.aload(entry.account_file)
+            cookies = (state or {}).get("cookies") or []
+            if cookies:
+                await entry.context.add_cookies(cookies)
+        except Exception as exc:
+            browser_logger.warning(f"[-] 导入 cookie 到 profile {entry.name} 失败: {exc}")
+            return
+        marker.write_text(str(stamp), encoding="utf-8")
+
+    @staticmethod
+    def _write_seed_marker(entry: _ProfileEntry):
+        stamp = get_cookie_store().stamp(entry.account_file)
+        if stamp is not None:
+            (entry.path / _PROFILE_SEED_MARKER).write_text(str(stamp), encoding="utf-8")
+
+    @staticmethod
+    def _profile_alive(entry: _ProfileEntry) -> bool:
+        browser = entry.context.browser
+        return browser is None or browser.is_connected()
+
+    def _on_profile_closed(self, entry: _ProfileEntry):
+        if self._profiles.get(entry.name) is entry:
+            del self._profiles[entry.name]
+
+    async def _reset_pages(self, entry: _ProfileEntry):
+        """任务结束后只保留一个空白页，缓存留在 profile 中，页面和内存随之释放。"""
+        try:
+            pages = entry.context.pages
+            for page in pages[1:]:
+                await page.close()
+            if pages:
+                await pages[0].goto("about:blank")
+        except Exception:
+            pass
+
+    async def _close_profile(self, entry: _ProfileEntry):
+        self._on_profile_closed(entry)
+        warm = self._warm.get(entry.name)
+        if warm is not None and warm.context is entry.context:
+            del self._warm[entry.name]
+        if entry.dirty:
+            # profile 模式下不再每个任务都写 cookie 文件，关闭时同步一次，供 cookie 校验等场景读取
+            try:
+                await get_cookie_store().save_context(entry.context, entry.account_file, entry.base_version)
+                await asyncio.to_thread(self._write_seed_marker, entry)
+            except Exception as exc:
+                browser_logger.warning(f"[-] 保存 profile {entry.name} 的 cookie 失败: {exc}")
+        try:
+            await entry.context.close()
+        except Exception:
+            pass
+        browser_logger.info(f"[+] 关闭 profile {entry.name}")
+
+    async def _evict_lru_profiles(self):
+        """打开的 profile 达到 max_open 时，按最久未使用顺序关闭空闲的 profile。"""
+        while len(self._profiles) >= self.max_open_profiles:
+            idle = [entry for entry in self._profiles.values() if not self._profile_locks[entry.name].locked()]
+            if not idle:
+                break
+            await self._close_profile(min(idle, key=lambda entry: entry.last_used))
+
+    def _schedule_idle_eviction(self, entry: _ProfileEntry):
+        if self.profile_idle_seconds <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        loop.call_later(self.profile_idle_seconds, self._on_idle_timer, entry)
+
+    def _on_idle_timer(self, entry: _ProfileEntry):
+        if self._closed or self._profiles.get(entry.name) is not entry or entry.active:
+            return
+        if time.monotonic() - entry.last_used < self.profile_idle_seconds:
+            return
+        task = asyncio.ensure_future(self._evict_idle_profile(entry))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def _evict_idle_profile(self, entry: _ProfileEntry):
+        lock = self._profile_locks.setdefault(entry.name, asyncio.Lock())
+        async with lock:
+            if self._profiles.get(entry.name) is entry and not entry.active:
+                await self._close_profile(entry)
+
+    async def save_storage_state(self, context, account_file, force: bool = False):
+        """
+        任务结束时保存 cookie。profile 模式下登录态已在 profile 目录中，只标记待同步，
+        等 profile 关闭时写一次 cookie 文件，避免每个任务都重写；force 为 True 时立即写入（如保活后需要读取新的过期时间）。
+        写入经由 CookieStore：加锁、原子替换，读取后被其他任务写过时与最新内容合并。
+        """
+        for entry in self._profiles.values():
+            if entry.context is context:
+                if not force:
+                    entry.dirty = True
+                    return
+                await get_cookie_store().save_context(context, entry.account_file, entry.base_version)
+                # 写入的就是 profile 当前的登录态，更新导入标记，下次借出时不必再导入
+                await asyncio.to_thread(self._write_seed_marker, entry)
+                entry.dirty = False
+                return
+        await get_cookie_store().save_context(context, account_file, self._base_versions.get(id(context)))
+
+    async def close(self):
+        self._closed = True
+        for warm in list(self._warm.values()):
+            await self._close_warm(warm)
+        self._warm.clear()
+        for entry in list(self._profiles.values()):
+            await self._close_profile(entry)
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            try:
+                await entry.browser.close()
+            except Exception:
+                pass
+        if self._playwright_manager is not None:
+            try:
+                await self._playwright_manager.__aexit__(None, None, None)
+            except Exception:
+                pass
+        self._playwright_manager = None
+        self._playwright = None
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_browser_pool() -> BrowserPool:
+    """返回当前事件循环对应的浏览器池，不存在时创建。"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool._closed:
+        pool = BrowserPool()
+        _pools[loop] = pool
+    return pool
+
+
+@asynccontextmanager
+async def use_browser_pool():
+    """
+    声明对当前事件循环浏览器池的使用，最后一个使用者退出时关闭池。
+    长期运行的发布循环在最外层持有一次，内部的上传、校验即可一直复用同一批浏览器；
+    CLI 等一次性调用则在结束时自动释放浏览器与 Playwright 驱动。
+    """
+    pool = get_browser_pool()
+    pool.users += 1
+    try:
+        yield pool
+    finally:
+        pool.users -= 1
+        if pool.users <= 0:
+            await pool.close()
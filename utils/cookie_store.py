@@ -0,0 +1,384 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from conf import BASE_DIR
+from utils.log import browser_logger
+from utils.storage_state import compact_raw, compact_state, compaction_enabled, record_compaction
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from conf import COOKIE_STORE_SETTINGS
+except ImportError:
+    COOKIE_STORE_SETTINGS = {}
+
+LAYOUTS = ("flat", "sharded", "sqlite")
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_atomic(path: Path, data: bytes):
+    """写入同目录下的临时文件并 fsync 后替换目标文件，进程中途崩溃也不会留下写了一半的文件。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _cookie_key(cookie: Dict) -> Tuple:
+    return cookie.get("name"), cookie.get("domain"), cookie.get("path")
+
+
+def merge_states(theirs: Dict, ours: Dict) -> Dict:
+    """
+    合并同一账号的两份登录态（读取之后另一个任务已经写过一次）：
+    同名 cookie 保留过期时间更晚的一份，会话 cookie 以本次为准；localStorage 按 origin 合并，同名项以本次为准。
+    """
+    cookies = {_cookie_key(cookie): cookie for cookie in theirs.get("cookies") or []}
+    for cookie in ours.get("cookies") or []:
+        key = _cookie_key(cookie)
+        other = cookies.get(key)
+        if other is None or (cookie.get("expires") or -1) <= 0 or \
+                (cookie.get("expires") or -1) >= (other.get("expires") or -1):
+            cookies[key] = cookie
+    origins = {origin.get("origin"): origin for origin in theirs.get("origins") or []}
+    for origin in ours.get("origins") or []:
+        other = origins.get(origin.get("origin"))
+        if other is None:
+            origins[origin.get("origin")] = origin
+            continue
+        items = {item.get("name"): item for item in other.get("localStorage") or []}
+        items.update({item.get("name"): item for item in origin.get("localStorage") or []})
+        origins[origin.get("origin")] = dict(origin, localStorage=list(items.values()))
+    return dict(ours, cookies=list(cookies.values()), origins=list(origins.values()))
+
+
+class CookieStore(object):
+    """
+    账号登录态（Playwright storage_state）的统一读写入口，供浏览器池、上传器、登录与 cookie 校验共用。
+    - 每个账号一把跨进程的文件锁（root/.locks 下），多个任务、多个工作进程同时写同一账号时串行执行；
+    - 写入先落到临时文件再 rename，崩溃不会留下损坏的 cookie 文件；内容未变化时不写；
+    - 每次写入版本号加一（database.db 的 cookie_store 表），save 时传入读取时的版本号，
+      期间被其他任务写过则与最新内容合并，不会用旧的登录态覆盖新的；
+    - layout 为 flat（cookiesFile/<文件名>，默认）、sharded（cookiesFile/<文件名前两位>/<文件名>）
+      或 sqlite（内容存在 cookie_store 表中），切换到后两种时旧文件在首次读取时自动迁移。
+    账号仍以 cookiesFile/<文件名> 这一路径标识，不在 cookiesFile 下的路径（如 CLI 的 cookies 目录）始终按 flat 读写。
+    """
+
+    def __init__(self, root=None, layout: Optional[str] = None, db_path=None, lock_timeout: Optional[float] = None):
+        settings = COOKIE_STORE_SETTINGS
+        self.root = Path(root or settings.get("dir") or BASE_DIR / "cookiesFile").resolve()
+        self.layout = layout or settings.get("layout") or "flat"
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"不支持的 cookie 存储方式: {self.layout}")
+        self.db_path = Path(db_path or settings.get("db_path") or BASE_DIR / "database.db")
+        self.lock_timeout = float(lock_timeout if lock_timeout is not None else settings.get("lock_timeout_seconds", 30))
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    # ---- 路径与元数据 ----
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ensure_schema(self):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS cookie_store (
+                        account_key TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0,
+                        sha256 TEXT,
+                        state BLOB,
+                        updated_at REAL
+                    )
+                    """
+                )
+            self._schema_ready = True
+
+    def _key(self, account_file) -> Tuple[str, bool]:
+        """返回 (键, 是否由本存储管理)：cookiesFile 下的账号以文件名为键，其他路径以绝对路径为键。"""
+        path = Path(account_file)
+        if not path.is_absolute() and len(path.parts) == 1:
+            # 只有文件名时视为 cookiesFile 下的账号，与 user_info.filePath 一致
+            path = self.root / path
+        path = path.resolve()
+        if path.parent == self.root:
+            return path.name, True
+        return str(path), False
+
+    def _row(self, key: str):
+        self.ensure_schema()
+        with self._connect() as conn:
+            return conn.execute("SELECT version, sha256, state, updated_at FROM cookie_store WHERE account_key = ?",
+                                (key,)).fetchone()
+
+    def path(self, account_file) -> Optional[Path]:
+        """cookie 文件的实际位置，sqlite 方式下返回 None。"""
+        key, managed = self._key(account_file)
+        if not managed:
+            return Path(key)
+        if self.layout == "flat":
+            return self.root / key
+        if self.layout == "sharded":
+            sharded = self.root / key[:2] / key
+            flat = self.root / key
+            if not sharded.exists() and flat.exists():
+                # 从平铺目录迁移，rename 是原子的，并发迁移时只有一个成功
+                sharded.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.replace(flat, sharded)
+                except FileNotFoundError:
+                    pass
+            return sharded
+        return None
+
+    def version(self, account_file) -> int:
+        key, _ = self._key(account_file)
+        row = self._row(key)
+        return int(row["version"]) if row else 0
+
+    def stamp(self, account_file) -> Optional[int]:
+        """登录态的变化标记（文件方式为修改时间，sqlite 方式为版本号），不存在时返回 None。"""
+        path = self.path(account_file)
+        if path is None:
+            self._import_legacy(account_file)
+            row = self._row(self._key(account_file)[0])
+            return int(row["version"]) if row and row["state"] is not None else None
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def exists(self, account_file) -> bool:
+        return self.stamp(account_file) is not None
+
+    @contextmanager
+    def lock(self, account_file, timeout: Optional[float] = None):
+        """账号级的跨进程排他锁，超时抛出 TimeoutError。"""
+        key, managed = self._key(account_file)
+        name = key if managed else hashlib.sha1(key.encode("utf-8")).hexdigest()
+        lock_path = self.root / ".locks" / f"{name}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        timeout = self.lock_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with open(lock_path, "a+b") as f:
+            while True:
+                try:
+                    _lock_file(f)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"等待账号 {name} 的 cookie 锁超时（{timeout}s）")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+    # ---- 读写 ----
+
+    def _import_legacy(self, account_file, locked: bool = False):
+        """sqlite 方式下首次读取时导入 cookiesFile 中的旧文件。locked 表示调用方已持有该账号的锁。"""
+        key, _ = self._key(account_file)
+        legacy = self.root / key
+        row = self._row(key)
+        if (row and row["state"] is not None) or not legacy.is_file():
+            return
+        if not locked:
+            with self.lock(account_file):
+                self._import_legacy(account_file, locked=True)
+            return
+        data = legacy.read_bytes()
+        self._write_row(key, (int(row["version"]) if row else 0) + 1, data)
+        browser_logger.info(f"[+] 已将 cookie 文件 {key} 导入数据库")
+
+    def _write_row(self, key: str, version: int, data: bytes, store_state: bool = True):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cookie_store (account_key, version, sha256, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, version, hashlib.sha256(data).hexdigest(), data if store_state else None, time.time()),
+            )
+
+    def _read_raw(self, account_file, locked: bool = False) -> Optional[bytes]:
+        path = self.path(account_file)
+        if path is None:
+            self._import_legacy(account_file, locked)
+            row = self._row(self._key(account_file)[0])
+            return bytes(row["state"]) if row and row["state"] is not None else None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def load(self, account_file) -> Optional[Dict]:
+        """
+        读取登录态，不存在或内容损坏时返回 None。
+        开启压缩时返回前在内存中压缩（见 utils/storage_state.py），读取不改写存储，文件的压缩在 save 时于账号锁内进行。
+        """
+        raw = self._read_raw(account_file)
+        if raw is None:
+            return None
+        try:
+            state = json.loads(raw)
+        except ValueError:
+            return None
+        if not isinstance(state, dict):
+            return None
+        if compaction_enabled():
+            state, _ = compact_state(state)
+        return state
+
+    def load_versioned(self, account_file) -> Tuple[Optional[Dict], int]:
+        """读取登录态及其版本号，保存时把版本号传给 save。"""
+        version = self.version(account_file)
+        return self.load(account_file), version
+
+    def save(self, account_file, state: Dict, base_version: Optional[int] = None) -> bool:
+        """
+        写入登录态，返回是否实际写入（内容未变化时跳过）。
+        base_version 为读取时的版本号，当前版本已更新时先与最新内容合并。
+        """
+        key, _ = self._key(account_file)
+        with self.lock(account_file):
+            current = self._read_raw(account_file, locked=True)
+            row = self._row(key)
+            version = int(row["version"]) if row else 0
+            if base_version is not None and version > base_version and current:
+                try:
+                    state = merge_states(json.loads(current), state)
+                except ValueError:
+                    pass
+            if compaction_enabled():
+                state, _ = compact_state(state)
+            data = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            if current == data:
+                return False
+            self._write_locked(account_file, key, version + 1, data)
+        return True
+
+    def _write_locked(self, account_file, key: str, version: int, data: bytes):
+        """在已持有账号锁时写入内容并记录新版本号。"""
+        path = self.path(account_file)
+        if path is not None:
+            write_atomic(path, data)
+        self._write_row(key, version, data, store_state=path is None)
+
+    def compact(self, account_file) -> Optional[Dict]:
+        """
+        压缩已保存的登录态（丢弃过期 cookie 与无关域名的数据，见 utils/storage_state.py），返回统计；
+        未开启、不存在或格式错误时返回 None。与 save 一样在账号锁内读写并递增版本号，
+        文件修改时间随之更新，依赖修改时间的缓存（cookie 校验缓存、profile 导入标记）能感知变化。
+        """
+        if not compaction_enabled():
+            return None
+        key, _ = self._key(account_file)
+        with self.lock(account_file):
+            raw = self._read_raw(account_file, locked=True)
+            if raw is None:
+                return None
+            data, result = compact_raw(raw)
+            if result is None:
+                return None
+            if data is not None:
+                self._write_locked(account_file, key, self.version(account_file) + 1, data)
+                browser_logger.info(f"[+] 已压缩 cookie {key}: {result['bytes_before']} -> {result['bytes_after']} 字节")
+        record_compaction(result)
+        return result
+
+    def accounts(self) -> List[str]:
+        """本存储管理的全部账号（cookiesFile 下的文件名）。"""
+        names = {path.name for path in self.root.rglob("*.json") if ".locks" not in path.relative_to(self.root).parts
+                 and len(path.relative_to(self.root).parts) <= 2}
+        if self.layout == "sqlite":
+            self.ensure_schema()
+            with self._connect() as conn:
+                rows = conn.execute("SELECT account_key FROM cookie_store WHERE state IS NOT NULL").fetchall()
+            names.update(row["account_key"] for row in rows if self._key(row["account_key"])[1])
+        return sorted(names)
+
+    def compact_all(self) -> List[Dict]:
+        """逐个账号压缩（服务启动时在后台线程调用），返回实际压缩了的账号的统计。"""
+        results = []
+        for name in self.accounts():
+            try:
+                result = self.compact(name)
+            except (OSError, TimeoutError) as exc:
+                browser_logger.warning(f"[-] 压缩 cookie {name} 失败: {exc}")
+                continue
+            if result is not None and result["bytes_after"] != result["bytes_before"]:
+                results.append(dict(result, file=name))
+        return results
+
+    def delete(self, account_file) -> bool:
+        key, _ = self._key(account_file)
+        with self.lock(account_file):
+            path = self.path(account_file) or self.root / key
+            removed = path.exists()
+            if removed:
+                path.unlink()
+            row = self._row(key)
+            removed = removed or bool(row and row["state"] is not None)
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cookie_store WHERE account_key = ?", (key,))
+        return removed
+
+    # ---- 异步封装 ----
+
+    async def aload(self, account_file) -> Tuple[Optional[Dict], int]:
+        return await asyncio.to_thread(self.load_versioned, account_file)
+
+    async def save_context(self, context, account_file, base_version: Optional[int] = None) -> bool:
+        """保存浏览器上下文的登录态，替代 context.storage_state(path=...)。"""
+        state = await context.storage_state()
+        return await asyncio.to_thread(self.save, account_file, state, base_version)
+
+
+_store: Optional[CookieStore] = None
+
+
+def get_cookie_store() -> CookieStore:
+    global _store
+    if _store is None:
+        _store = CookieStore()
+    return _store
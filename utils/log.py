@@ -51,3 +51,7 @@ bilibili_logger = create_logger('bilibili', 'logs/bilibili.log')
 kuaishou_logger = create_logger('kuaishou', 'logs/kuaishou.log')
 baijiahao_logger = create_logger('baijiahao', 'logs/baijiahao.log')
 xiaohongshu_logger = create_logger('xiaohongshu', 'logs/xiaohongshu.log')
+job_logger = create_logger('job', 'logs/job.log')
+browser_logger = create_logger('browser', 'logs/browser.log')
+account_logger = create_logger('account', 'logs/account.log')
+upload_logger = create_logger('upload', 'logs/upload.log')
@@ -0,0 +1,74 @@
+import inspect
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# 发布任务阶段
+PHASE_WAITING = "waiting"
+PHASE_RUNNING = "running"
+
+# 上传检查点，按先后顺序排列；任务记录已到达的最远检查点（与阶段在同一次写库中更新）。
+# 崩溃恢复只据此防止重复发布：publish_confirmed 记为成功，publish_clicked 需核对或人工确认，其余检查点仅用于展示进度，任务从头重跑
+PHASE_PAGE_OPENED = "page_opened"
+PHASE_FILE_ATTACHED = "file_attached"
+PHASE_UPLOAD_COMPLETE = "upload_complete"
+PHASE_METADATA_FILLED = "metadata_filled"
+PHASE_SCHEDULE_SET = "schedule_set"
+PHASE_PUBLISH_CLICKED = "publish_clicked"
+PHASE_PUBLISH_CONFIRMED = "publish_confirmed"
+CHECKPOINTS = (
+    PHASE_PAGE_OPENED,
+    PHASE_FILE_ATTACHED,
+    PHASE_UPLOAD_COMPLETE,
+    PHASE_METADATA_FILLED,
+    PHASE_SCHEDULE_SET,
+    PHASE_PUBLISH_CLICKED,
+    PHASE_PUBLISH_CONFIRMED,
+)
+
+def checkpoint_rank(phase: Optional[str]) -> int:
+    """检查点的先后位置，非检查点阶段返回 -1。"""
+    return CHECKPOINTS.index(phase) if phase in CHECKPOINTS else -1
+
+
+def checkpoint_reached(checkpoint: Optional[str], phase: str) -> bool:
+    return checkpoint_rank(checkpoint) >= checkpoint_rank(phase)
+
+
+_progress_reporter: ContextVar[Optional[Callable]] = ContextVar("progress_reporter", default=None)
+
+
+def set_progress_reporter(reporter: Optional[Callable[[str, Optional[str], bool], object]]):
+    """
+    为当前任务（asyncio Task）设置进度回调，返回值用于 reset_progress_reporter 还原。
+    回调接收 (phase, detail, durable)：durable 为 True 时须返回一个 awaitable，在进度写入任务存储后才完成。
+    """
+    return _progress_reporter.set(reporter)
+
+
+def reset_progress_reporter(token):
+    _progress_reporter.reset(token)
+
+
+def report_progress(phase: str, detail: Optional[str] = None):
+    """上报当前发布任务所处阶段；不在发布任务中运行（如 CLI 直接上传）时忽略。"""
+    reporter = _progress_reporter.get()
+    if reporter is None:
+        return
+    try:
+        reporter(phase, detail, False)
+    except Exception:
+        pass
+
+
+async def commit_progress(phase: str, detail: Optional[str] = None):
+    """
+    上报阶段并等待写入任务存储后才返回，用于 publish_clicked 这类必须先落库再执行下一步的检查点：
+    否则点击发布后进程立即崩溃时，任务会从更早的检查点续跑并重复发布。写入失败时抛出异常，调用方不应继续点击。
+    不在发布任务中运行时忽略。
+    """
+    reporter = _progress_reporter.get()
+    if reporter is None:
+        return
+    result = reporter(phase, detail, True)
+    if inspect.isawaitable(result):
+        await result
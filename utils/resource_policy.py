@@ -0,0 +1,168 @@
+import re
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from utils.log import browser_logger
+
+try:
+    from conf import RESOURCE_ROUTING_SETTINGS
+except ImportError:
+    RESOURCE_ROUTING_SETTINGS = {}
+
+# 页面所属平台：按页面域名后缀识别
+PLATFORM_HOSTS = {
+    "douyin.com": "douyin",
+    "xiaohongshu.com": "xiaohongshu",
+    "weixin.qq.com": "tencent",
+    "kuaishou.com": "kuaishou",
+    "tiktok.com": "tiktok",
+    "baidu.com": "baijiahao",
+}
+
+# 默认策略：
+# - abort_types：直接中止的资源类型（字体、视频预览）
+# - stub_types：返回 1x1 透明图片的资源类型，页面的 onload 照常触发，不会因为图片缺失卡住；
+#   默认为空，平台页面的图片（头像、封面、按钮图标）照常加载，需要时在 conf.py 中按平台开启
+# - block_hosts：直接中止的第三方域名（统计、埋点、监控上报、广告）
+# - allow_patterns：始终放行的 URL 正则，优先级最高，上传流程需要的资源（如封面预览）写在这里
+DEFAULT_POLICY = {
+    "abort_types": ["font", "media"],
+    "stub_types": [],
+    "block_hosts": [
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+        "googleadservices.com", "hm.baidu.com", "pos.baidu.com", "cpro.baidu.com", "cnzz.com",
+        "sentry.io", "mcs.snssdk.com", "mon.snssdk.com", "mon.zijieapi.com", "log.snssdk.com",
+        "apm.volccdn.com", "mssdk.bytedance.com", "t.kuaishou.com", "apm-fe.xiaohongshu.com",
+        "t2.xiaohongshu.com", "mon.tiktokv.com", "mcs.tiktokw.us",
+    ],
+    "allow_patterns": [r"^data:", r"^blob:"],
+}
+
+# 各平台在默认策略上追加的放行规则：封面编辑、上传预览、验证码等页面逻辑依赖真实资源，开启 stub_types 后同样放行
+PLATFORM_POLICIES = {
+    "douyin": {"allow_patterns": [r"/cover", r"poster", r"captcha"]},
+    "xiaohongshu": {"allow_patterns": [r"/cover", r"captcha"]},
+    "tencent": {"allow_patterns": [r"/cover", r"qrcode", r"captcha"]},
+    "kuaishou": {"allow_patterns": [r"/cover", r"captcha"]},
+    "tiktok": {"allow_patterns": [r"/cover", r"captcha"]},
+}
+
+# 被拦截的资源没有下载，无法得知真实大小：按类型给出的固定估值（字节），只用于 estimated_bytes_saved，不是实测值
+ESTIMATED_BYTES = {"image": 40 * 1024, "media": 512 * 1024, "font": 80 * 1024}
+ESTIMATED_OTHER_BYTES = 4 * 1024
+
+# 1x1 透明 GIF
+_STUB_IMAGE = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+
+class ResourcePolicy(object):
+    """某个平台的路由策略，由默认策略、平台策略与 conf.py 中 RESOURCE_ROUTING_SETTINGS 的覆盖项合并而成。"""
+
+    def __init__(self, platform: Optional[str]):
+        policy = {key: list(value) for key, value in DEFAULT_POLICY.items()}
+        overrides = [PLATFORM_POLICIES.get(platform) or {}, RESOURCE_ROUTING_SETTINGS.get("default") or {},
+                     (RESOURCE_ROUTING_SETTINGS.get("platforms") or {}).get(platform) or {}]
+        for override in overrides:
+            for key, value in override.items():
+                if key in ("abort_types", "stub_types"):
+                    # 类型列表整体替换，便于关闭某类拦截
+                    policy[key] = list(value)
+                else:
+                    policy[key] = policy.get(key, []) + list(value)
+        self.platform = platform
+        self.abort_types = set(policy["abort_types"])
+        self.stub_types = set(policy["stub_types"])
+        self.block_hosts = tuple(host.lstrip(".") for host in policy["block_hosts"])
+        self.allow = re.compile("|".join(f"(?:{pattern})" for pattern in policy["allow_patterns"])) \
+            if policy["allow_patterns"] else None
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        """返回 "abort" / "stub"，放行时返回 None。"""
+        if self.allow is not None and self.allow.search(url):
+            return None
+        host = urlsplit(url).hostname or ""
+        if any(host == blocked or host.endswith("." + blocked) for blocked in self.block_hosts):
+            return "abort"
+        if resource_type in self.abort_types:
+            return "abort"
+        if resource_type in self.stub_types:
+            return "stub"
+        return None
+
+
+_policies: Dict[Optional[str], ResourcePolicy] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def platform_of(url: str) -> Optional[str]:
+    host = urlsplit(url).hostname or ""
+    for suffix, platform in PLATFORM_HOSTS.items():
+        if host == suffix or host.endswith("." + suffix):
+            return platform
+    return None
+
+
+def get_policy(platform: Optional[str]) -> ResourcePolicy:
+    policy = _policies.get(platform)
+    if policy is None:
+        policy = _policies[platform] = ResourcePolicy(platform)
+    return policy
+
+
+def _record(platform: Optional[str], action: str, resource_type: str):
+    saved = ESTIMATED_BYTES.get(resource_type, ESTIMATED_OTHER_BYTES)
+    if action == "stub":
+        saved = max(0, saved - len(_STUB_IMAGE))
+    with _stats_lock:
+        stats = _stats.setdefault(platform or "other",
+                                  {"aborted": 0, "stubbed": 0, "by_type": {}, "estimated_bytes_saved": 0})
+        stats["aborted" if action == "abort" else "stubbed"] += 1
+        stats["by_type"][resource_type] = stats["by_type"].get(resource_type, 0) + 1
+        stats["estimated_bytes_saved"] += saved
+
+
+def get_routing_stats() -> Dict[str, Dict]:
+    """
+    当前进程内按平台统计的拦截请求数（aborted / stubbed，by_type 按资源类型细分）
+    与按 ESTIMATED_BYTES 估算的节省流量 estimated_bytes_saved（字节，估值而非实测）。
+    """
+    with _stats_lock:
+        return {platform: dict(stats, by_type=dict(stats["by_type"])) for platform, stats in _stats.items()}
+
+
+async def _handle_route(route, request):
+    try:
+        page_url = request.frame.url
+    except Exception:
+        page_url = ""
+    platform = platform_of(page_url) or platform_of(request.url)
+    action = get_policy(platform).decide(request.url, request.resource_type)
+    try:
+        if action == "abort":
+            await route.abort("blockedbyclient")
+        elif action == "stub":
+            await route.fulfill(status=200, content_type="image/gif", body=_STUB_IMAGE)
+        else:
+            await route.fallback()
+            return
+    except Exception:
+        # 页面已关闭等情况下请求已失效，忽略即可
+        return
+    _record(platform, action, request.resource_type)
+
+
+async def apply_resource_policy(context):
+    """
+    为自动化上下文（cookie 校验、上传、保活）注册路由策略，拦截用不到的字体、视频预览与第三方埋点、广告。
+    Playwright 开启路由后该上下文不再使用 HTTP 缓存，因此持久化 profile 的上下文（context.browser 为 None）
+    不注册路由，保留 profile 跨任务复用的缓存；可通过 RESOURCE_ROUTING_SETTINGS 的 enabled 整体关闭。
+    """
+    if not RESOURCE_ROUTING_SETTINGS.get("enabled", True):
+        return
+    if context.browser is None and not RESOURCE_ROUTING_SETTINGS.get("persistent_contexts", False):
+        browser_logger.debug("[+] 持久化 profile 上下文使用 HTTP 缓存，不启用资源路由策略")
+        return
+    await context.route("**/*", _handle_route)
+    browser_logger.debug("[+] 已为上下文启用资源路由策略")
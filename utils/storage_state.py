@@ -0,0 +1,148 @@
+import json
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    from conf import STORAGE_STATE_SETTINGS
+except ImportError:
+    STORAGE_STATE_SETTINGS = {}
+
+# 各平台登录与上传需要的域名（按后缀匹配）：cookie 与 localStorage 只保留这些域名下的，
+# 其余是浏览页面时顺带写入的第三方数据，每次创建上下文都要解析、注入却用不到
+PLATFORM_DOMAINS = {
+    "xiaohongshu": ("xiaohongshu.com",),
+    "tencent": ("qq.com",),
+    "douyin": ("douyin.com", "snssdk.com", "bytedance.com", "zijieapi.com"),
+    "kuaishou": ("kuaishou.com", "kuaishouzt.com"),
+    "tiktok": ("tiktok.com", "tiktokv.com", "tiktokv.us", "tiktokw.us", "byteoversea.com"),
+    "baijiahao": ("baidu.com",),
+}
+
+# 各平台可以丢弃的 localStorage 项：(键名正则, 保留天数)。
+# 百家号 AI 成片每次运行都会写入一个 ai2video_YYYYMMDDHHMM 批次列表，只用于当次记录，
+# 去重依赖的 ai2video_processed_titles 不在此列
+STALE_LOCAL_STORAGE = {
+    "baijiahao": [(r"^ai2video_(\d{12})$", 7)],
+}
+
+_stats_lock = threading.Lock()
+_stats = {"files": 0, "compacted": 0, "bytes_before": 0, "bytes_after": 0,
+          "cookies_dropped": 0, "origins_dropped": 0, "items_dropped": 0}
+
+
+def _host_matches(host: str, domains) -> bool:
+    host = (host or "").lstrip(".").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+def _platform_domains(platform: str) -> Tuple[str, ...]:
+    extra = (STORAGE_STATE_SETTINGS.get("platforms") or {}).get(platform) or ()
+    return tuple(PLATFORM_DOMAINS.get(platform, ())) + tuple(extra)
+
+
+def infer_platform(state: Dict) -> Optional[str]:
+    """cookie 文件名不含平台信息，按 cookie 域名归属最多的平台判断，无法判断时返回 None。"""
+    counts = {}
+    for cookie in state.get("cookies") or []:
+        for platform in PLATFORM_DOMAINS:
+            if _host_matches(cookie.get("domain"), _platform_domains(platform)):
+                counts[platform] = counts.get(platform, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def _stale_item(platform: str, name: str, now: float) -> bool:
+    for pattern, keep_days in STALE_LOCAL_STORAGE.get(platform, ()):
+        match = re.match(pattern, name or "")
+        if not match:
+            continue
+        try:
+            written = time.mktime(time.strptime(match.group(1), "%Y%m%d%H%M"))
+        except (IndexError, ValueError):
+            return True
+        return now - written > keep_days * 86400
+    return False
+
+
+def compact_state(state: Dict, platform: Optional[str] = None, now: Optional[float] = None) -> Tuple[Dict, Dict]:
+    """
+    返回 (压缩后的 storage_state, 丢弃数量)。
+    丢弃已过期的 cookie；能判断平台时，再丢弃其他域名的 cookie、其他 origin 的 localStorage
+    以及平台自身过期的 localStorage 项。无法判断平台时只清理过期 cookie。
+    """
+    now = time.time() if now is None else now
+    platform = platform or infer_platform(state)
+    domains = _platform_domains(platform) if platform else ()
+    max_item_bytes = int(STORAGE_STATE_SETTINGS.get("max_item_bytes", 0) or 0)
+    dropped = {"cookies_dropped": 0, "origins_dropped": 0, "items_dropped": 0}
+
+    cookies = []
+    for cookie in state.get("cookies") or []:
+        expires = cookie.get("expires")
+        expired = isinstance(expires, (int, float)) and 0 < expires <= now
+        if expired or (domains and not _host_matches(cookie.get("domain"), domains)):
+            dropped["cookies_dropped"] += 1
+            continue
+        cookies.append(cookie)
+
+    origins = []
+    for origin in state.get("origins") or []:
+        if domains and not _host_matches(urlsplit(origin.get("origin") or "").hostname, domains):
+            dropped["origins_dropped"] += 1
+            continue
+        items = []
+        for item in origin.get("localStorage") or []:
+            value = item.get("value") or ""
+            if _stale_item(platform, item.get("name"), now) or (max_item_bytes and len(value) > max_item_bytes):
+                dropped["items_dropped"] += 1
+                continue
+            items.append(item)
+        if not items:
+            dropped["origins_dropped"] += 1
+            continue
+        origins.append(dict(origin, localStorage=items))
+
+    return dict(state, cookies=cookies, origins=origins), dropped
+
+
+def compaction_enabled() -> bool:
+    return bool(STORAGE_STATE_SETTINGS.get("compact", True))
+
+
+def compact_raw(raw: bytes, platform: Optional[str] = None) -> Tuple[Optional[bytes], Optional[Dict]]:
+    """
+    压缩序列化的 storage_state，返回 (压缩后的内容, 统计)；没有可丢弃的内容时内容为 None，格式错误时两者都为 None。
+    只做计算不写文件，写回由 CookieStore.compact 在账号锁内完成。
+    """
+    try:
+        state = json.loads(raw)
+    except ValueError:
+        return None, None
+    if not isinstance(state, dict):
+        return None, None
+    compacted, dropped = compact_state(state, platform)
+    result = dict(dropped, bytes_before=len(raw), bytes_after=len(raw))
+    if not any(dropped.values()):
+        return None, result
+    data = json.dumps(compacted, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    result["bytes_after"] = len(data)
+    return data, result
+
+
+def record_compaction(result: Dict):
+    """累计一次压缩的统计，见 get_compaction_stats。"""
+    with _stats_lock:
+        _stats["files"] += 1
+        _stats["compacted"] += int(result["bytes_after"] != result["bytes_before"])
+        for name in ("bytes_before", "bytes_after", "cookies_dropped", "origins_dropped", "items_dropped"):
+            _stats[name] += result[name]
+
+
+def get_compaction_stats() -> Dict[str, int]:
+    """当前进程内 cookie 文件压缩的累计统计，bytes_saved 为压缩节省的字节数。"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+    return stats